@@ -0,0 +1,81 @@
+import os
+import re
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_lexer import canonical_tokens, scan, sql_fingerprint
+from sql_utils import normalize_sql
+from query_log import create_query_log_reader
+from config import QUERY_LOG_CONFIG
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# The regex normalizer and character tokenizer the evaluator used before the shared lexer, kept for comparison
+def legacy_normalize_sql(sql: str) -> str:
+    sql = re.sub(r'--.*$', '', sql, flags=re.MULTILINE)
+    sql = re.sub(r'/\*.*?\*/', '', sql, flags=re.DOTALL)
+    sql = re.sub(r'\s+', ' ', sql.strip().lower())
+    sql = re.sub(r'\s*=\s*', ' = ', sql)
+    sql = re.sub(r'\s*,\s*', ', ', sql)
+    sql = re.sub(r'\s*\(\s*', '(', sql)
+    sql = re.sub(r'\s*\)\s*', ')', sql)
+    return sql
+
+
+def legacy_tokenize_sql(sql: str) -> List[str]:
+    tokens = []
+    current = ""
+    in_quotes = False
+    for char in sql:
+        if char == "'" or char == '"':
+            in_quotes = not in_quotes
+            current += char
+        elif char == ' ' and not in_quotes:
+            if current:
+                tokens.append(current)
+            current = ""
+        else:
+            current += char
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def timed(label: str, function, queries: List[str], repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for sql in queries:
+            function(sql)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed:8.3f}s  {elapsed / (len(queries) * repeat) * 1e6:8.1f}us/query")
+
+
+def clear_caches():
+    for function in (scan, canonical_tokens, sql_fingerprint, normalize_sql):
+        function.cache_clear()
+
+
+if __name__ == "__main__":
+    # `python benchmark_lexer.py [copies]`: the logged queries, repeated `copies` times as distinct strings
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    reader = create_query_log_reader(QUERY_LOG_CONFIG, ROOT)
+    logged = [entry["sql_query"] for entry in reader.read() if entry.get("sql_query")]
+    if not logged:
+        sys.exit("No logged queries to benchmark")
+    queries = [f"{sql} -- {copy}" for copy in range(copies) for sql in logged]
+    # compute_prf and exact_match see each predicted query several times per evaluation
+    repeat = 3
+    print(f"{len(queries)} queries, each processed {repeat} times")
+
+    timed("legacy normalize + tokenize", lambda sql: legacy_tokenize_sql(legacy_normalize_sql(sql)), queries, repeat)
+    clear_caches()
+    timed("lexer canonical tokens (cold)", canonical_tokens, queries, 1)
+    clear_caches()
+    timed("lexer canonical tokens (memoized)", canonical_tokens, queries, repeat)
+    clear_caches()
+    timed("legacy normalize", legacy_normalize_sql, queries, repeat)
+    timed("lexer normalize_sql (memoized)", normalize_sql, queries, repeat)
+    timed("lexer fingerprint (memoized)", sql_fingerprint, queries, repeat)
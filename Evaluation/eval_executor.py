@@ -0,0 +1,178 @@
+import time
+import pickle
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from db_engine import create_db_engine
+from sql_lexer import sql_fingerprint
+from result_equivalence import ResultFingerprint, fingerprint, query_chunks
+
+
+def is_select_query(query: str) -> bool:
+    return query.strip().lower().startswith("select")
+
+
+def query_key(sql: str) -> str:
+    # Literals are kept as written: 'Germany' and 'germany' are different queries
+    return sql_fingerprint(sql)
+
+
+class QueryResult(NamedTuple):
+    frame: Optional[pd.DataFrame]  # None when the query failed or returned more than max_frame_rows rows
+    fingerprint: Optional[ResultFingerprint]
+    error: str  # "" when the query ran
+    seconds: float
+    cached: bool
+
+
+class GoldResultStore:
+    """Result sets of gold queries on disk, keyed by SQL hash, so later runs don't execute them again."""
+
+    def __init__(self, path: str, max_age_seconds: float = 7 * 86400):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS gold_results ("
+            "key TEXT PRIMARY KEY, sql_query TEXT NOT NULL, result BLOB NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, stored_at FROM gold_results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.max_age_seconds:
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key: str, sql: str, result: tuple):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gold_results (key, sql_query, result, stored_at) VALUES (?, ?, ?, ?)",
+                (key, sql, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM gold_results")
+            self._conn.commit()
+
+
+class EvaluationExecutor:
+    """Runs every distinct query of an evaluation once, on a thread pool sized to the connection pool."""
+
+    def __init__(self, engine: Engine, gold_store: Optional[GoldResultStore] = None, workers: int = 8,
+                 chunk_rows: int = 50000, max_frame_rows: int = 10000, tolerance: float = 1e-4,
+                 ignore_column_order: bool = True):
+        self.engine = engine
+        self.gold_store = gold_store
+        self.workers = workers
+        self.chunk_rows = chunk_rows
+        self.max_frame_rows = max_frame_rows
+        self.tolerance = tolerance
+        self.ignore_column_order = ignore_column_order
+        self._results: Dict[str, QueryResult] = {}
+        self._stats = {"executed": 0, "failed": 0, "gold_cache_hits": 0, "duplicates": 0, "seconds": 0.0}
+
+    def _execute(self, sql: str) -> QueryResult:
+        started = time.perf_counter()
+        kept = []
+
+        def chunks():
+            # Results are fingerprinted chunk by chunk; only small ones are kept whole, for row diffs
+            nonlocal kept
+            rows = 0
+            for chunk in query_chunks(self.engine, sql, self.chunk_rows):
+                rows += len(chunk)
+                if rows > self.max_frame_rows:
+                    kept = None
+                elif kept is not None:
+                    kept.append(chunk)
+                yield chunk
+
+        try:
+            result = fingerprint(chunks(), self.tolerance, self.ignore_column_order)
+        except Exception as e:
+            return QueryResult(None, None, str(e), time.perf_counter() - started, False)
+        frame = pd.concat(kept, ignore_index=True) if kept else None
+        return QueryResult(frame, result, "", time.perf_counter() - started, False)
+
+    def _run(self, key: str, sql: str, is_gold: bool) -> QueryResult:
+        result = self._execute(sql)
+        if is_gold and not result.error and self.gold_store is not None:
+            self.gold_store.set(key, sql, (result.frame, result.fingerprint))
+        return result
+
+    def execute(self, predicted: Iterable[str], gold: Iterable[str] = ()) -> Dict[str, QueryResult]:
+        """Run the queries not seen yet in this evaluation; gold queries are read from the store when cached."""
+        pending = {}
+        for sql, is_gold in [(sql, False) for sql in predicted] + [(sql, True) for sql in gold]:
+            if sql is None or not is_select_query(sql):
+                continue
+            key = query_key(sql)
+            if key in self._results or key in pending:
+                self._stats["duplicates"] += 1
+                # A query that is also a gold query is worth storing
+                if is_gold and key in pending:
+                    pending[key] = (sql, True)
+                continue
+            pending[key] = (sql, is_gold)
+
+        for key, (sql, is_gold) in list(pending.items()):
+            stored = self.gold_store.get(key) if is_gold and self.gold_store is not None else None
+            # A result fingerprinted with another tolerance can't be compared; run the query again
+            if stored is not None and stored[1].settings() == (self.tolerance, self.ignore_column_order):
+                self._results[key] = QueryResult(stored[0], stored[1], "", 0.0, True)
+                self._stats["gold_cache_hits"] += 1
+                del pending[key]
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="eval") as executor:
+            futures = {
+                key: executor.submit(self._run, key, sql, is_gold)
+                for key, (sql, is_gold) in pending.items()
+            }
+            for key, future in futures.items():
+                result = future.result()
+                self._results[key] = result
+                self._stats["executed"] += 1
+                self._stats["failed"] += bool(result.error)
+                self._stats["seconds"] += result.seconds
+        return self._results
+
+    def result(self, sql: str) -> QueryResult:
+        if sql is None or not is_select_query(sql):
+            return QueryResult(None, None, "Only SELECT queries are allowed", 0.0, False)
+        key = query_key(sql)
+        if key not in self._results:
+            self.execute([sql])
+        return self._results[key]
+
+    def stats(self) -> dict:
+        return dict(self._stats, distinct_queries=len(self._results))
+
+
+def create_evaluation_executor(connection_string: str, engine_config: dict, evaluation_config: dict) -> EvaluationExecutor:
+    workers = evaluation_config['workers']
+    # One connection per worker; evaluation queries should not queue for a connection
+    engine = create_db_engine(connection_string, dict(engine_config, pool_size=workers, max_overflow=0))
+    gold_store = None
+    if evaluation_config['gold_cache_path']:
+        gold_store = GoldResultStore(evaluation_config['gold_cache_path'], evaluation_config['gold_cache_max_age_seconds'])
+    return EvaluationExecutor(
+        engine,
+        gold_store,
+        workers,
+        chunk_rows=evaluation_config['chunk_rows'],
+        max_frame_rows=evaluation_config['max_frame_rows'],
+        tolerance=evaluation_config['float_tolerance'],
+        ignore_column_order=evaluation_config['ignore_column_order'],
+    )
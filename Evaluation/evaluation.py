@@ -1,12 +1,21 @@
+import os
+import sys
 import json
-import re
 import pandas as pd
-from sqlalchemy import create_engine, text
 from urllib.parse import quote_plus
 from difflib import SequenceMatcher
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Iterable, Iterator
 import numpy as np
-from collections import defaultdict
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_lexer import PUNCTUATION, canonical_tokens, sql_fingerprint
+from query_log import QueryLogReader
+from config import QUERY_LOG_CONFIG, DB_ENGINE_CONFIG, EVALUATION_CONFIG
+from eval_executor import EvaluationExecutor, QueryResult, create_evaluation_executor, is_select_query, query_key
+from evaluation_store import EvaluationStore, gold_version
+from result_equivalence import compare_fingerprints, frame_chunks, row_diff
+from question_index import QuestionIndex, load_question_index
 
 DB_CONFIG = {
     'username': 'add-your-username-here', 
@@ -21,41 +30,10 @@ CONN_STRING = (
     f"@{DB_CONFIG['host']}/{DB_CONFIG['database']}?driver=ODBC+Driver+17+for+SQL+Server"
 )
 
-engine = create_engine(CONN_STRING)
-
-def normalize_sql(sql: str) -> str:
-    sql = re.sub(r'--.*$', '', sql, flags=re.MULTILINE)
-    sql = re.sub(r'/\*.*?\*/', '', sql, flags=re.DOTALL)
-    
-    sql = re.sub(r'\s+', ' ', sql.strip().lower())
-    
-    sql = re.sub(r'\s*=\s*', ' = ', sql)
-    sql = re.sub(r'\s*,\s*', ', ', sql)
-    sql = re.sub(r'\s*\(\s*', '(', sql)
-    sql = re.sub(r'\s*\)\s*', ')', sql)
-    
-    return sql
 
 def tokenize_sql(sql: str) -> List[str]:
-    tokens = []
-    current = ""
-    in_quotes = False
-    
-    for char in sql:
-        if char == "'" or char == '"':
-            in_quotes = not in_quotes
-            current += char
-        elif char == ' ' and not in_quotes:
-            if current:
-                tokens.append(current)
-            current = ""
-        else:
-            current += char
-    
-    if current:
-        tokens.append(current)
-    
-    return tokens
+    # Canonical tokens from the shared, memoized lexer; punctuation carries no meaning on its own
+    return [token for token in canonical_tokens(sql, fold_literals=True) if token not in PUNCTUATION]
 
 def compute_similarity(str1: str, str2: str) -> float:
     words1 = set(str1.lower().split())
@@ -70,25 +48,12 @@ def compute_similarity(str1: str, str2: str) -> float:
     
     return 0.7 * sequence + 0.3 * overlap
 
-def find_best_matching_question(user_question: str, gold_questions: List[str]) -> Tuple[str, float]:
-    similarities = [(q, compute_similarity(user_question, q)) for q in gold_questions]
-    best_match, similarity = max(similarities, key=lambda x: x[1])
-    
-    if similarity < 0.3:
-        user_terms = set(user_question.lower().split())
-        for q in gold_questions:
-            gold_terms = set(q.lower().split())
-            if user_terms & gold_terms:  
-                return q, 0.3 
-    
-    return best_match, similarity
-
 def exact_match(pred: str, gold: str) -> bool:
-    return normalize_sql(pred) == normalize_sql(gold)
+    return sql_fingerprint(pred, fold_literals=True) == sql_fingerprint(gold, fold_literals=True)
 
 def compute_prf(pred: str, gold: str) -> Tuple[float, float, float]:
-    pred_tokens = set(tokenize_sql(normalize_sql(pred)))
-    gold_tokens = set(tokenize_sql(normalize_sql(gold)))
+    pred_tokens = set(tokenize_sql(pred))
+    gold_tokens = set(tokenize_sql(gold))
     
     if not pred_tokens or not gold_tokens:
         return 0.0, 0.0, 0.0
@@ -101,41 +66,44 @@ def compute_prf(pred: str, gold: str) -> Tuple[float, float, float]:
     
     return precision, recall, f1
 
-def is_select_query(query: str) -> bool:
-    return query.strip().lower().startswith("select")
+_executor = None
+
+def get_executor() -> EvaluationExecutor:
+    global _executor
+    if _executor is None:
+        _executor = create_evaluation_executor(CONN_STRING, DB_ENGINE_CONFIG, EVALUATION_CONFIG)
+    return _executor
 
 def run_readonly_query(query: str) -> pd.DataFrame:
-    if not is_select_query(query):
-        return pd.DataFrame()
-    try:
-        return pd.read_sql(text(query), engine)
-    except Exception as e:
-        print(f"[Error executing query]: {e}")
-        return pd.DataFrame()
+    result = get_executor().result(query)
+    if result.error:
+        print(f"[Error executing query]: {result.error}")
+    return result.frame if result.frame is not None else pd.DataFrame()
 
 def compare_results_semantically(pred_query: str, gold_query: str) -> bool:
-    df_pred = run_readonly_query(pred_query)
-    df_gold = run_readonly_query(gold_query)
-    
-    if df_pred.empty or df_gold.empty:
+    executor = get_executor()
+    return results_match(executor.result(pred_query), executor.result(gold_query))
+
+def results_match(pred: QueryResult, gold: QueryResult) -> bool:
+    # Same rows in any order; float and money values within EVALUATION_CONFIG['float_tolerance']
+    if pred.fingerprint is None or gold.fingerprint is None:
         return False
-    
-    try:
-        if set(df_pred.columns) != set(df_gold.columns):
-            return False
-            
-        df_pred = df_pred.sort_values(by=df_pred.columns.tolist()).reset_index(drop=True)
-        df_gold = df_gold.sort_values(by=df_gold.columns.tolist()).reset_index(drop=True)
-        
-        for col in df_pred.columns:
-            if df_pred[col].dtype != df_gold[col].dtype:
-                return False
-        
-        return df_pred.equals(df_gold)
-    except:
+    if not pred.fingerprint.rows or not gold.fingerprint.rows:
         return False
+    return not compare_fingerprints(pred.fingerprint, gold.fingerprint)
 
-def validate_query(query):
+def result_diff(pred: QueryResult, gold: QueryResult) -> Optional[Dict]:
+    if pred.fingerprint is None or gold.fingerprint is None:
+        return None
+    return row_diff(
+        pred.fingerprint,
+        gold.fingerprint,
+        (lambda: frame_chunks(pred.frame)) if pred.frame is not None else None,
+        (lambda: frame_chunks(gold.frame)) if gold.frame is not None else None,
+        limit=EVALUATION_CONFIG['max_diff_rows']
+    )
+
+def validate_query(query, executor: Optional[EvaluationExecutor] = None):
     if query is None:
         return False, "Query is None"
     if not query.strip():
@@ -143,19 +111,77 @@ def validate_query(query):
     if not is_select_query(query):
         return False, "Only SELECT queries are allowed"
     
-    try:
-        pd.read_sql(text(query), engine)
-        return True, "Valid query"
-    except Exception as e:
-        return False, f"Invalid query: {str(e)}"
+    result = (executor or get_executor()).result(query)
+    if result.error:
+        return False, f"Invalid query: {result.error}"
+    return True, "Valid query"
+
+def classify_question(gold_sql: str) -> str:
+    if "JOIN" in gold_sql.upper():
+        return "join"
+    elif "GROUP BY" in gold_sql.upper():
+        return "aggregation"
+    elif "WHERE" in gold_sql.upper():
+        return "filter"
+    return "simple"
+
+def score_entries(entries: List[Tuple[str, str]], gold_queries: Dict[str, str], similarity_threshold: float = 0.5,
+                  executor: Optional[EvaluationExecutor] = None, index: Optional[QuestionIndex] = None) -> List[Dict]:
+    """One record per (question, predicted SQL) entry, holding everything evaluate() reports about it."""
+    # All log questions are scored against all gold questions in one pass; only the top few are re-ranked
+    index = index or load_question_index(list(gold_queries.keys()), EVALUATION_CONFIG['question_index_path'])
+    best_matches = index.best_matches(
+        [question for question, _ in entries], compute_similarity, k=EVALUATION_CONFIG['match_candidates']
+    )
+
+    records = []
+    for (question, pred_sql), (best_match, similarity) in zip(entries, best_matches):
+        record = {"question": question, "predicted": pred_sql, "similarity": similarity, "status": "unmatched"}
+        records.append(record)
+        if similarity < similarity_threshold:
+            print(f"[Skipped] No sufficiently similar gold question found for: {question}")
+            continue
+        record.update(best_match=best_match, gold=gold_queries[best_match])
+
+    # Every distinct predicted and gold query runs once, in parallel, before any of them is scored
+    matched = [record for record in records if "gold" in record]
+    executor = executor or get_executor()
+    executor.execute([record["predicted"] for record in matched], [record["gold"] for record in matched])
+
+    for record in matched:
+        pred_sql, gold_sql = record["predicted"], record["gold"]
+        is_valid, validation_msg = validate_query(pred_sql, executor)
+        if not is_valid:
+            record.update(status="invalid", error=validation_msg)
+            continue
+
+        pred_result = executor.result(pred_sql)
+        gold_result = executor.result(gold_sql)
+        if gold_result.error:
+            print(f"[Error executing query]: {gold_result.error}")
+        semantic_match = results_match(pred_result, gold_result)
+        precision, recall, f1 = compute_prf(pred_sql, gold_sql)
+        record.update(
+            status="scored",
+            type=classify_question(gold_sql),
+            exact=exact_match(pred_sql, gold_sql),
+            semantic=semantic_match,
+            precision=precision,
+            recall=recall,
+            f1=f1,
+            # Row-level differences are only worked out when the fingerprints differ
+            result_diff=None if semantic_match else result_diff(pred_result, gold_result)
+        )
+    return records
 
-def evaluate(logs: List[Dict], gold_queries: Dict[str, str], similarity_threshold: float = 0.5) -> Dict:
+def summarize_results(records: Iterable[Dict]) -> Dict:
+    """Evaluation report over scored entries; a record seen several times in the log carries `occurrences`."""
     total = 0
     em_count = 0
     semantic_match_count = 0
-    precisions, recalls, f1s = [], [], []
+    precisions, recalls, f1s, weights = [], [], [], []
+    similarities, similarity_weights = [], []
     mismatches = []
-    gold_questions = list(gold_queries.keys())
     
     question_types = defaultdict(lambda: {"total": 0, "exact": 0, "semantic": 0})
     
@@ -172,75 +198,55 @@ def evaluate(logs: List[Dict], gold_queries: Dict[str, str], similarity_threshol
         "similarity_distribution": []
     }
 
-    for log in logs:
-        question = log["question"].strip().lower()
-        pred_sql = log["sql_query"]
-        
-        if pred_sql is None:
-            print("Error: pred_sql is None")
-            continue
-        
-        print(f"pred_sql: {pred_sql}")
-        
-        best_match, similarity = find_best_matching_question(question, gold_questions)
-        evaluation_results["similarity_distribution"].append(similarity)
-        
-        if similarity < similarity_threshold:
-            print(f"[Skipped] No sufficiently similar gold question found for: {question}")
-            continue
-            
-        gold_sql = gold_queries[best_match]
-        
-        is_valid, validation_msg = validate_query(pred_sql)
-        if not is_valid:
+    for record in records:
+        occurrences = record.get("occurrences", 1)
+        similarities.append(record["similarity"])
+        similarity_weights.append(occurrences)
+        if record["status"] == "invalid":
             evaluation_results["invalid_queries"].append({
-                "question": question,
-                "query": pred_sql,
-                "error": validation_msg
+                "question": record["question"],
+                "query": record["predicted"],
+                "error": record["error"]
             })
             continue
+        if record["status"] != "scored":
+            continue
 
-        total += 1
-        evaluation_results["total_questions"] = total
+        total += occurrences
+        question_type = record["type"]
+        question_types[question_type]["total"] += occurrences
 
-        question_type = "simple"
-        if "JOIN" in gold_sql.upper():
-            question_type = "join"
-        elif "GROUP BY" in gold_sql.upper():
-            question_type = "aggregation"
-        elif "WHERE" in gold_sql.upper():
-            question_type = "filter"
-            
-        question_types[question_type]["total"] += 1
-
-        if exact_match(pred_sql, gold_sql):
-            em_count += 1
-            evaluation_results["exact_matches"] = em_count
-            question_types[question_type]["exact"] += 1
+        if record["exact"]:
+            em_count += occurrences
+            question_types[question_type]["exact"] += occurrences
         else:
             mismatches.append({
-                "question": question,
-                "best_match": best_match,
-                "similarity": similarity,
-                "predicted": pred_sql,
-                "gold": gold_sql,
-                "type": question_type
+                "question": record["question"],
+                "best_match": record["best_match"],
+                "similarity": record["similarity"],
+                "predicted": record["predicted"],
+                "gold": record["gold"],
+                "type": question_type,
+                "result_diff": record["result_diff"]
             })
 
-        p, r, f1 = compute_prf(pred_sql, gold_sql)
-        precisions.append(p)
-        recalls.append(r)
-        f1s.append(f1)
+        precisions.append(record["precision"])
+        recalls.append(record["recall"])
+        f1s.append(record["f1"])
+        weights.append(occurrences)
 
-        if compare_results_semantically(pred_sql, gold_sql):
-            semantic_match_count += 1
-            evaluation_results["semantic_matches"] = semantic_match_count
-            question_types[question_type]["semantic"] += 1
+        if record["semantic"]:
+            semantic_match_count += occurrences
+            question_types[question_type]["semantic"] += occurrences
 
+    evaluation_results["similarity_distribution"] = np.repeat(similarities, similarity_weights).tolist()
     if total > 0:
-        evaluation_results["avg_precision"] = np.mean(precisions)
-        evaluation_results["avg_recall"] = np.mean(recalls)
-        evaluation_results["avg_f1"] = np.mean(f1s)
+        evaluation_results["total_questions"] = total
+        evaluation_results["exact_matches"] = em_count
+        evaluation_results["semantic_matches"] = semantic_match_count
+        evaluation_results["avg_precision"] = np.average(precisions, weights=weights)
+        evaluation_results["avg_recall"] = np.average(recalls, weights=weights)
+        evaluation_results["avg_f1"] = np.average(f1s, weights=weights)
         evaluation_results["mismatches"] = mismatches
         evaluation_results["question_type_performance"] = {
             qtype: {
@@ -259,6 +265,48 @@ def evaluate(logs: List[Dict], gold_queries: Dict[str, str], similarity_threshol
 
     return evaluation_results
 
+def log_entries(logs: Iterable[Dict]) -> Iterator[Tuple[str, str]]:
+    for log in logs:
+        if not log.get("question"):
+            print(f"Error: log entry without a question: {log}")
+            continue
+        question = log["question"].strip().lower()
+        pred_sql = log.get("sql_query")
+        
+        if pred_sql is None:
+            print("Error: pred_sql is None")
+            continue
+        
+        print(f"pred_sql: {pred_sql}")
+        yield question, pred_sql
+
+def evaluate(logs: Iterable[Dict], gold_queries: Dict[str, str], similarity_threshold: float = 0.5,
+             executor: Optional[EvaluationExecutor] = None, index: Optional[QuestionIndex] = None) -> Dict:
+    records = score_entries(list(log_entries(logs)), gold_queries, similarity_threshold, executor, index)
+    return summarize_results(records)
+
+def evaluate_incremental(reader: QueryLogReader, gold_queries: Dict[str, str], store: EvaluationStore,
+                         similarity_threshold: float = 0.5, executor: Optional[EvaluationExecutor] = None,
+                         index: Optional[QuestionIndex] = None) -> Dict:
+    """Score only the log entries appended since the last run and report over everything scored so far."""
+    version = gold_version(gold_queries)
+    offsets = store.offsets(version)
+    occurrences, entries = Counter(), {}
+    for question, pred_sql in log_entries(reader.read_new(offsets)):
+        key = (question, query_key(pred_sql))
+        occurrences[key] += 1
+        entries.setdefault(key, (question, pred_sql))
+
+    known = store.known(entries, version)
+    new_keys = [key for key in entries if key not in known]
+    records = score_entries([entries[key] for key in new_keys], gold_queries, similarity_threshold, executor, index)
+    store.save(version, offsets, occurrences, dict(zip(new_keys, records)))
+
+    evaluation_results = summarize_results(store.records(version))
+    evaluation_results["new_log_entries"] = sum(occurrences.values())
+    evaluation_results["newly_scored_entries"] = len(new_keys)
+    return evaluation_results
+
 def print_evaluation_report(results: Dict):
     print("\n--- Evaluation Report ---")
     print(f"Total Questions Evaluated: {results['total_questions']}")
@@ -296,17 +344,39 @@ def print_evaluation_report(results: Dict):
             print(f"Best Match: {m['best_match']} (similarity: {m['similarity']:.2f})")
             print(f"Type: {m['type']}")
             print(f"Predicted: {m['predicted']}")
-            print(f"Gold: {m['gold']}\n")
+            print(f"Gold: {m['gold']}")
+            diff = m.get('result_diff')
+            if diff and diff['reason']:
+                print(f"Results: {diff['reason']}")
+                for row in diff.get('missing', []):
+                    print(f"  missing: {row}")
+                for row in diff.get('extra', []):
+                    print(f"  extra: {row}")
+            print()
 
 if __name__ == "__main__":
     with open(r'C:\Users\parth\Desktop\Projects\Query-To-SQL\Query-To-SQL\evaluation\gold_queries.json', 'r') as f:
         gold_queries = json.load(f)
     
-    test_logs = []
-    with open(r'C:\Users\parth\Desktop\Projects\Query-To-SQL\Query-To-SQL\sql_log.json', 'r') as f:
-        for line in f:
-            if line.strip():  # Skip empty lines
-                test_logs.append(json.loads(line))
+    # Optional time range, e.g. `python evaluation.py 2025-01-01 2025-02-01`,
+    # or `python evaluation.py --incremental` to score only what was logged since the last incremental run
+    args = [arg for arg in sys.argv[1:] if arg != '--incremental']
+    incremental = len(args) != len(sys.argv) - 1
+    start = args[0] if len(args) > 0 else None
+    end = args[1] if len(args) > 1 else None
+    
+    reader = QueryLogReader(
+        os.path.join(r'C:\Users\parth\Desktop\Projects\Query-To-SQL\Query-To-SQL', QUERY_LOG_CONFIG['directory']),
+        legacy_file=r'C:\Users\parth\Desktop\Projects\Query-To-SQL\Query-To-SQL\sql_log.json',
+        max_write_delay_seconds=QUERY_LOG_CONFIG['max_write_delay_seconds']
+    )
     
-    results = evaluate(test_logs, gold_queries)
+    executor = get_executor()
+    if incremental:
+        results = evaluate_incremental(reader, gold_queries, EvaluationStore(EVALUATION_CONFIG['incremental_path']),
+                                       executor=executor)
+        print(f"New log entries: {results['new_log_entries']}, newly scored: {results['newly_scored_entries']}")
+    else:
+        results = evaluate(reader.read(start, end), gold_queries, executor=executor)
     print_evaluation_report(results)
+    print(f"\nExecution: {executor.stats()}")
@@ -0,0 +1,90 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, Set, Tuple
+
+
+def gold_version(gold_queries: Dict[str, str]) -> str:
+    """Changes whenever a gold question or its SQL does; results scored against other versions are not reused."""
+    return hashlib.sha256(json.dumps(gold_queries, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class EvaluationStore:
+    """Per-entry evaluation results and the query log read position, kept between runs of the evaluator.
+
+    Entries are keyed by (question, SQL hash, gold version): a log line asking what an earlier one asked,
+    and getting the same SQL, only adds an occurrence.
+    """
+
+    def __init__(self, path: str = 'evaluation_state.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS log_offsets (path TEXT PRIMARY KEY, offset INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS evaluation_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS entry_results ("
+            "question TEXT NOT NULL, sql_hash TEXT NOT NULL, gold_version TEXT NOT NULL, record TEXT NOT NULL, "
+            "occurrences INTEGER NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (question, sql_hash, gold_version))"
+        )
+        self._conn.commit()
+
+    def offsets(self, version: str) -> Dict[str, int]:
+        """Where to resume reading the log; nowhere when the gold queries changed since the last run."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM evaluation_state WHERE key = 'gold_version'").fetchone()
+            if row is None or row[0] != version:
+                return {}
+            return dict(self._conn.execute("SELECT path, offset FROM log_offsets").fetchall())
+
+    def known(self, keys: Iterable[Tuple[str, str]], version: str) -> Set[Tuple[str, str]]:
+        with self._lock:
+            return {
+                key for key in keys
+                if self._conn.execute(
+                    "SELECT 1 FROM entry_results WHERE question = ? AND sql_hash = ? AND gold_version = ?",
+                    (*key, version)
+                ).fetchone() is not None
+            }
+
+    def save(self, version: str, offsets: Dict[str, int], occurrences: Dict[Tuple[str, str], int],
+             records: Dict[Tuple[str, str], dict]):
+        """Store new records, count new occurrences of known ones and move the checkpoint, all at once."""
+        now = time.time()
+        with self._lock, self._conn:
+            for key, record in records.items():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entry_results "
+                    "(question, sql_hash, gold_version, record, occurrences, updated_at) VALUES (?, ?, ?, ?, 0, ?)",
+                    (*key, version, json.dumps(record, default=str), now)
+                )
+            for key, count in occurrences.items():
+                self._conn.execute(
+                    "UPDATE entry_results SET occurrences = occurrences + ?, updated_at = ? "
+                    "WHERE question = ? AND sql_hash = ? AND gold_version = ?",
+                    (count, now, *key, version)
+                )
+            # Results scored against earlier gold queries are never read again
+            self._conn.execute("DELETE FROM entry_results WHERE gold_version != ?", (version,))
+            self._conn.execute("DELETE FROM log_offsets")
+            self._conn.executemany("INSERT INTO log_offsets (path, offset) VALUES (?, ?)", offsets.items())
+            self._conn.execute(
+                "INSERT OR REPLACE INTO evaluation_state (key, value) VALUES ('gold_version', ?)", (version,)
+            )
+
+    def records(self, version: str) -> Iterator[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT record, occurrences FROM entry_results WHERE gold_version = ? ORDER BY updated_at",
+                (version,)
+            ).fetchall()
+        for record, occurrences in rows:
+            yield dict(json.loads(record), occurrences=occurrences)
+
+    def reset(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entry_results")
+            self._conn.execute("DELETE FROM log_offsets")
+            self._conn.execute("DELETE FROM evaluation_state")
@@ -0,0 +1,180 @@
+import os
+import re
+import hashlib
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    # Padded so the first and last words get n-grams of their own
+    return " " + re.sub(r'\s+', ' ', question.lower()).strip() + " "
+
+
+def char_ngrams(question: str, n: int) -> Counter:
+    question = normalize_question(question)
+    return Counter(question[start:start + n] for start in range(len(question) - n + 1))
+
+
+def questions_hash(questions: List[str], n: int) -> str:
+    digest = hashlib.sha256(str(n).encode('utf-8'))
+    for question in questions:
+        digest.update(b"\x00" + question.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class QuestionIndex:
+    """Character n-gram TF-IDF vectors of the gold questions, stored as an inverted index.
+
+    Scoring a batch of log questions is one sparse matrix product done with numpy: each query n-gram
+    is expanded into the postings of the gold questions containing it and the products are summed with bincount.
+    """
+
+    def __init__(self, questions: List[str], n: int, terms: Dict[str, int], idf: np.ndarray,
+                 postings_start: np.ndarray, postings_gold: np.ndarray, postings_weight: np.ndarray):
+        self.questions = questions
+        self.n = n
+        self.terms = terms
+        self.idf = idf
+        self.postings_start = postings_start  # postings of term t: [postings_start[t], postings_start[t + 1])
+        self.postings_gold = postings_gold
+        self.postings_weight = postings_weight
+        self.version = questions_hash(questions, n)
+        # The old matcher's fallback: the first gold question sharing a word with the log question
+        self._first_with_word = {}
+        for gold_id, question in enumerate(questions):
+            for word in question.lower().split():
+                self._first_with_word.setdefault(word, gold_id)
+
+    @classmethod
+    def build(cls, questions: List[str], n: int = 3) -> "QuestionIndex":
+        counts = [char_ngrams(question, n) for question in questions]
+        terms = {}
+        for question_counts in counts:
+            for term in question_counts:
+                terms.setdefault(term, len(terms))
+        document_frequency = np.zeros(len(terms), dtype=np.float64)
+        rows, columns, values = [], [], []
+        for gold_id, question_counts in enumerate(counts):
+            for term, count in question_counts.items():
+                rows.append(gold_id)
+                columns.append(terms[term])
+                values.append(1.0 + np.log(count))
+                document_frequency[terms[term]] += 1
+        rows, columns, values = np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64), np.array(values)
+        idf = np.log((1.0 + len(questions)) / (1.0 + document_frequency)) + 1.0
+        values = values * idf[columns]
+        norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=len(questions)))
+        values = values / np.maximum(norms[rows], 1e-12)
+
+        order = np.argsort(columns, kind="stable")
+        postings_start = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings_start[1:] = np.cumsum(np.bincount(columns, minlength=len(terms)))
+        return cls(list(questions), n, terms, idf, postings_start, rows[order], values[order].astype(np.float32))
+
+    def _query_vectors(self, queries: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows, columns, values = [], [], []
+        unknown_idf = np.log(1.0 + len(self.questions)) + 1.0
+        for query_id, query in enumerate(queries):
+            weights, unknown = {}, 0.0
+            for term, count in char_ngrams(query, self.n).items():
+                if term in self.terms:
+                    weights[self.terms[term]] = 1.0 + np.log(count)
+                else:
+                    # Unknown n-grams still count towards the norm, so mostly unknown questions score low
+                    unknown += ((1.0 + np.log(count)) * unknown_idf) ** 2
+            if not weights:
+                continue
+            term_ids = np.fromiter(weights, dtype=np.int64, count=len(weights))
+            term_values = np.fromiter(weights.values(), dtype=np.float64, count=len(weights)) * self.idf[term_ids]
+            norm = np.sqrt(np.dot(term_values, term_values) + unknown)
+            rows.append(np.full(len(term_ids), query_id, dtype=np.int64))
+            columns.append(term_ids)
+            values.append(term_values / norm)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(rows), np.concatenate(columns), np.concatenate(values)
+
+    def scores(self, queries: List[str]) -> np.ndarray:
+        """Cosine similarity of every query against every gold question, shape (queries, gold)."""
+        query_rows, term_ids, query_values = self._query_vectors(queries)
+        starts = self.postings_start[term_ids]
+        lengths = self.postings_start[term_ids + 1] - starts
+        # Position of every (query n-gram, gold posting) pair in the postings arrays
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        postings = np.repeat(starts, lengths) + offsets
+        cells = np.repeat(query_rows, lengths) * len(self.questions) + self.postings_gold[postings]
+        products = np.repeat(query_values, lengths) * self.postings_weight[postings]
+        scores = np.bincount(cells, weights=products, minlength=len(queries) * len(self.questions))
+        return scores.reshape(len(queries), len(self.questions))
+
+    def top_k(self, queries: List[str], k: int = 5, batch_size: int = 1024) -> List[List[int]]:
+        k = min(k, len(self.questions))
+        if not k:
+            return [[] for _ in queries]
+        candidates = []
+        for start in range(0, len(queries), batch_size):
+            scores = self.scores(queries[start:start + batch_size])
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind="stable")
+            candidates.extend(np.take_along_axis(best, order, axis=1).tolist())
+        return candidates
+
+    def best_matches(self, queries: List[str], similarity: Callable[[str, str], float], k: int = 5,
+                     batch_size: int = 1024) -> List[Tuple[str, float]]:
+        """Best gold question per query: TF-IDF picks `k` candidates and `similarity` re-ranks them."""
+        matches = []
+        for query, candidates in zip(queries, self.top_k(queries, k, batch_size)):
+            best_match, best_similarity = max(
+                ((self.questions[gold_id], similarity(query, self.questions[gold_id])) for gold_id in candidates),
+                key=lambda match: match[1]
+            )
+            if best_similarity < 0.3:
+                shared = [self._first_with_word[word] for word in query.lower().split() if word in self._first_with_word]
+                if shared:
+                    best_match, best_similarity = self.questions[min(shared)], 0.3
+            matches.append((best_match, best_similarity))
+        return matches
+
+    def save(self, path: str):
+        terms = sorted(self.terms, key=self.terms.get)
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                questions=np.array(self.questions, dtype=str),
+                n=np.array(self.n),
+                terms=np.array(terms, dtype=str),
+                idf=self.idf,
+                postings_start=self.postings_start,
+                postings_gold=self.postings_gold,
+                postings_weight=self.postings_weight,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "QuestionIndex":
+        with np.load(path) as data:
+            return cls(
+                data["questions"].tolist(),
+                int(data["n"]),
+                {term: term_id for term_id, term in enumerate(data["terms"].tolist())},
+                data["idf"],
+                data["postings_start"],
+                data["postings_gold"],
+                data["postings_weight"],
+            )
+
+
+def load_question_index(questions: List[str], path: Optional[str], n: int = 3) -> QuestionIndex:
+    """Index saved at `path`, rebuilt and saved again when the gold questions have changed."""
+    if path and os.path.exists(path):
+        try:
+            index = QuestionIndex.load(path)
+            if index.version == questions_hash(questions, n):
+                return index
+        except Exception as e:
+            print(f"Error loading question index {path}: {e}")
+    index = QuestionIndex.build(questions, n)
+    if path:
+        index.save(path)
+    return index
@@ -0,0 +1,171 @@
+import numbers
+import datetime
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Any NULL hashes to this, whatever type the rest of its column has
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+COLUMN_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def frame_chunks(frame: pd.DataFrame, chunk_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    if frame.empty:
+        yield frame
+        return
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def query_chunks(engine: Engine, sql: str, chunk_rows: int = 50000) -> Iterator[pd.DataFrame]:
+    """Result of `sql` read from a server-side cursor, `chunk_rows` rows at a time."""
+    with engine.connect().execution_options(stream_results=True) as conn:
+        yield from pd.read_sql(text(sql), conn, chunksize=chunk_rows)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def canonical_column(column: pd.Series, tolerance: float) -> pd.Series:
+    """Same values for equal cells of columns with different dtypes: 5, 5.0 and Decimal('5.00') hash alike."""
+    values = column.dropna()
+    if pd.api.types.is_bool_dtype(column):
+        column = column.astype("float64")
+    if pd.api.types.is_numeric_dtype(column) or (
+            column.dtype == object and len(values) and values.map(_is_number).all()):
+        column = pd.to_numeric(column, errors="coerce").astype("float64")
+        if tolerance:
+            # Floats and money within `tolerance` of each other land in the same bucket
+            column = np.round(column / tolerance)
+        return column + 0.0  # -0.0 and 0.0 hash differently
+    if pd.api.types.is_datetime64_any_dtype(column) or (
+            column.dtype == object and len(values) and values.map(lambda value: isinstance(value, datetime.date)).all()):
+        column = pd.to_datetime(column, errors="coerce", utc=True)
+        return column.dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    # SQL Server pads char(n) columns; trailing spaces don't change the value
+    return column.astype(str).str.rstrip()
+
+
+def row_hashes(chunk: pd.DataFrame, positions: List[int], tolerance: float) -> np.ndarray:
+    hashes = np.zeros(len(chunk), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for position in positions:
+            column = chunk.iloc[:, position]
+            column_hashes = pd.util.hash_array(canonical_column(column, tolerance).to_numpy())
+            column_hashes[column.isna().to_numpy()] = NULL_HASH
+            hashes = hashes * COLUMN_MULTIPLIER ^ column_hashes
+    return hashes
+
+
+class ResultFingerprint:
+    """Order-insensitive fingerprint of a result set: row count plus two wrapping sums of per-row hashes."""
+
+    def __init__(self, columns: List[str], tolerance: float = 1e-4, ignore_column_order: bool = True,
+                 keep_hashes: bool = True):
+        # Positions of the columns in hashing order: by name when the order doesn't matter
+        self.positions = list(range(len(columns)))
+        if ignore_column_order:
+            self.positions.sort(key=lambda position: str(columns[position]))
+        self.columns = [columns[position] for position in self.positions]
+        self.tolerance = tolerance
+        self.ignore_column_order = ignore_column_order
+        self.rows = 0
+        self.total = np.uint64(0)
+        self.squares = np.uint64(0)
+        self._hashes = [] if keep_hashes else None
+
+    def update(self, chunk: pd.DataFrame):
+        if chunk.empty:
+            return
+        hashes = row_hashes(chunk, self.positions, self.tolerance)
+        with np.errstate(over="ignore"):
+            # uint64 arithmetic wraps, so the sums are taken modulo 2**64 and never depend on row order
+            self.total += hashes.sum(dtype=np.uint64)
+            self.squares += (hashes * hashes).sum(dtype=np.uint64)
+        self.rows += len(hashes)
+        if self._hashes is not None:
+            self._hashes.append(hashes)
+
+    def hashes(self) -> np.ndarray:
+        if self._hashes is None:
+            raise ValueError("Row hashes were not kept for this fingerprint")
+        return np.concatenate(self._hashes) if self._hashes else np.empty(0, dtype=np.uint64)
+
+    def settings(self) -> tuple:
+        return self.tolerance, self.ignore_column_order
+
+
+def fingerprint(chunks: Iterable[pd.DataFrame], tolerance: float = 1e-4, ignore_column_order: bool = True,
+                keep_hashes: bool = True) -> ResultFingerprint:
+    result = None
+    for chunk in chunks:
+        if result is None:
+            result = ResultFingerprint(list(chunk.columns), tolerance, ignore_column_order, keep_hashes)
+        result.update(chunk)
+    return result if result is not None else ResultFingerprint([], tolerance, ignore_column_order, keep_hashes)
+
+
+def compare_fingerprints(pred: ResultFingerprint, gold: ResultFingerprint) -> str:
+    """Why the two results differ, or "" when they hold the same rows."""
+    if pred.settings() != gold.settings():
+        raise ValueError("Fingerprints were computed with different settings")
+    if pred.columns != gold.columns:
+        return "different columns" if set(pred.columns) != set(gold.columns) else "different column order"
+    if pred.rows != gold.rows:
+        return f"{pred.rows} rows instead of {gold.rows}"
+    if pred.total != gold.total or pred.squares != gold.squares:
+        return "different values"
+    return ""
+
+
+def _differing_hashes(pred: ResultFingerprint, gold: ResultFingerprint):
+    pred_values, pred_counts = np.unique(pred.hashes(), return_counts=True)
+    gold_values, gold_counts = np.unique(gold.hashes(), return_counts=True)
+    values = np.union1d(pred_values, gold_values)
+    counts = np.zeros(len(values), dtype=np.int64)
+    counts[np.searchsorted(values, pred_values)] += pred_counts
+    counts[np.searchsorted(values, gold_values)] -= gold_counts
+    # Positive: rows only the prediction returned; negative: rows it is missing
+    return values[counts > 0], counts[counts > 0], values[counts < 0], -counts[counts < 0]
+
+
+def _sample_rows(fingerprint_: ResultFingerprint, chunks: Iterable[pd.DataFrame], wanted: np.ndarray,
+                 limit: int) -> List[dict]:
+    rows = []
+    for chunk in chunks:
+        if len(rows) >= limit or not len(wanted):
+            break
+        if chunk.empty:
+            continue
+        selected = np.isin(row_hashes(chunk, fingerprint_.positions, fingerprint_.tolerance), wanted)
+        rows.extend(chunk[selected].head(limit - len(rows)).to_dict("records"))
+    return rows
+
+
+def row_diff(pred: ResultFingerprint, gold: ResultFingerprint,
+             pred_chunks: Optional[Callable[[], Iterable[pd.DataFrame]]] = None,
+             gold_chunks: Optional[Callable[[], Iterable[pd.DataFrame]]] = None, limit: int = 10) -> dict:
+    """Rows returned by only one side; pass chunk factories to get up to `limit` of those rows back."""
+    reason = compare_fingerprints(pred, gold)
+    diff = {"reason": reason}
+    if not reason:
+        return diff
+    if set(pred.columns) != set(gold.columns):
+        diff["missing_columns"] = sorted(set(gold.columns) - set(pred.columns))
+        diff["extra_columns"] = sorted(set(pred.columns) - set(gold.columns))
+        return diff
+    if pred.columns != gold.columns:
+        return diff
+
+    extra, extra_counts, missing, missing_counts = _differing_hashes(pred, gold)
+    diff["extra_rows"] = int(extra_counts.sum())
+    diff["missing_rows"] = int(missing_counts.sum())
+    if pred_chunks is not None:
+        diff["extra"] = _sample_rows(pred, pred_chunks(), extra, limit)
+    if gold_chunks is not None:
+        diff["missing"] = _sample_rows(gold, gold_chunks(), missing, limit)
+    return diff
@@ -3,14 +3,16 @@ from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 from langchain.agents.agent_types import AgentType
 from langchain_openai import ChatOpenAI
 from langchain_community.utilities import SQLDatabase
-from sqlalchemy import create_engine
+from functools import lru_cache
+from db_engine import get_engine
 import config
 import os
 
+@lru_cache(maxsize=1)
 def init_sql_agent():
     os.environ["OPENAI_API_KEY"] = config.OPENAI_API_KEY
     
-    db_engine = create_engine(config.DB_CONNECTION_STRING)
+    db_engine = get_engine(config.DB_CONNECTION_STRING, config.DB_ENGINE_CONFIG)
     db = SQLDatabase(db_engine)
     
     llm = ChatOpenAI(temperature=0.0, model="gpt-4")
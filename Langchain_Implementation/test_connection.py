@@ -1,10 +1,15 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from db_engine import create_db_engine, warm_pool, pool_stats
 import config
 import time
 
 def test_connection():    
     try:
-        engine = create_engine(config.DB_CONNECTION_STRING)
+        engine = create_db_engine(config.DB_CONNECTION_STRING, config.DB_ENGINE_CONFIG)
+        start_time = time.time()
+        warmed = warm_pool(engine, config.DB_ENGINE_CONFIG['warm_connections'])
+        print(f"Warmed {warmed} connections in {time.time() - start_time:.2f} seconds")
+        
         start_time = time.time()
         with engine.connect() as conn:
             result = conn.execute(text("SELECT 1"))
@@ -22,7 +27,8 @@ def test_connection():
             for table in tables:
                 print(f"✓ {table[0]}")
             
-            return True
+        print(f"\nPool stats: {pool_stats(engine)}")
+        return True
             
     except Exception as e:
         print(f"✗ Connection failed: {str(e)}")
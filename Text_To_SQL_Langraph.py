@@ -1,45 +1,79 @@
+import time
+
+# Import cost is reported by /health; keep this above the other imports
+_import_started = time.perf_counter()
+
 import os
-import json
-from datetime import datetime
-from typing import Any, Union, Literal, Annotated
+import asyncio
+import operator
+import weakref
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Any, Union, Literal, Annotated, Optional
 from typing_extensions import TypedDict
-from langsmith import Client
-from langchain.callbacks.tracers import LangChainTracer
-from langchain.callbacks.manager import CallbackManager
 
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from langchain_core.messages import ToolMessage, AIMessage, AnyMessage
 from langchain_core.runnables import RunnableLambda, RunnableWithFallbacks
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import ToolNode
 from langgraph.graph import END, StateGraph, START
 from langgraph.graph.message import add_messages
 from pydantic import BaseModel, Field
 
-from config import DB_CONNECTION_STRING, OPENAI_API_KEY, LANGSMITH_API_KEY, LANGSMITH_ENDPOINT, LANGSMITH_PROJECT
-
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
+from config import DB_CONNECTION_STRING, DB_ENGINE_CONFIG, OPENAI_API_KEY, LANGSMITH_API_KEY, LANGSMITH_ENDPOINT, LANGSMITH_PROJECT, LANGSMITH_TRACING, QUERY_CACHE_CONFIG, RESULT_CACHE_CONFIG
+from config import SCHEMA_CATALOG_CONFIG, SCHEMA_LINKING_CONFIG, SCHEMA_INFO, CONCURRENCY_CONFIG, BATCH_CONFIG, PAGINATION_CONFIG, METRICS_CONFIG, TRACING_CONFIG
+from config import QUERY_LOG_CONFIG, SQL_VALIDATION_CONFIG, COST_GUARD_CONFIG, SPECULATIVE_CONFIG, REPLICA_CONFIG, SUMMARY_CONFIG
+from config import STARTUP_CONFIG
+from cost_guard import create_cost_guard
+from db_engine import dry_run, get_engine
+from metrics import create_metrics_registry
+from runtime import Runtime
+from tracing import create_request_tracer
+from query_cache import create_query_cache, normalize_question
+from query_log import QueryLogWriter, create_query_log_reader, create_query_log_writer
+from replica import create_query_router, create_replica, create_replica_engine
+from result_cache import create_result_cache
+from schema_catalog import create_schema_catalog
+from schema_linking import SchemaLinker, estimate_tokens
+from singleflight import SingleFlight
+from summaries import create_summary_store
+from sql_utils import extract_tables, normalize_sql
+from sql_validator import SqlValidator
+from result_pages import create_result_pager, format_page
+
+# LangChain's own tracing exports every run; sampled request traces from request_tracer replace it by default
+os.environ["LANGCHAIN_TRACING_V2"] = "true" if TRACING_CONFIG['langchain_auto_trace'] else "false"
 os.environ["LANGCHAIN_ENDPOINT"] = LANGSMITH_ENDPOINT
 os.environ["LANGCHAIN_API_KEY"] = LANGSMITH_API_KEY
 os.environ["LANGCHAIN_PROJECT"] = LANGSMITH_PROJECT
 
 os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
-SQL_LOG_FILE = 'sql_log.json'
-
-client = Client(
-    api_key=LANGSMITH_API_KEY,
-    api_url=LANGSMITH_ENDPOINT
-)
-
-tracer = LangChainTracer(
-    project_name=LANGSMITH_PROJECT
-)
-
-callback_manager = CallbackManager([tracer])
+# Nothing below connects to the database or builds an LLM client at import time: those are runtime
+# components, built on first use or by warm_up()
+runtime = Runtime()
+metrics_registry = create_metrics_registry(METRICS_CONFIG)
+
+@runtime.component("query_log")
+def build_query_log():
+    return create_query_log_writer(QUERY_LOG_CONFIG)
+
+@runtime.component("request_tracer")
+def build_request_tracer():
+    return create_request_tracer(TRACING_CONFIG, {
+        "tracing": LANGSMITH_TRACING == "true",
+        "api_key": LANGSMITH_API_KEY,
+        "endpoint": LANGSMITH_ENDPOINT,
+        "project": LANGSMITH_PROJECT
+    })
+
+@contextmanager
+def stage(name: str):
+    with metrics_registry.span(name), runtime.request_tracer.span(name):
+        yield
 
 def log_to_json(question: str, sql_query: str, answer: str, timestamp: str = None):
     if timestamp is None:
@@ -52,16 +86,147 @@ def log_to_json(question: str, sql_query: str, answer: str, timestamp: str = Non
         "answer": answer
     }
     
-    try:
-        with open(SQL_LOG_FILE, 'a') as f:
-            json.dump(log_entry, f)
-            f.write('\n')
-    except Exception as e:
-        print(f"Error writing to log file: {e}")
+    with stage("log_write"):
+        runtime.query_log.write(log_entry)
 
-db = SQLDatabase.from_uri(DB_CONNECTION_STRING)
+def log_to_json_bulk(log_entries: list[dict]):
+    if not log_entries:
+        return
+    
+    with stage("log_write"):
+        runtime.query_log.write_many(log_entries)
+
+def record_log(log_entries, question: str, sql_query: str, answer: str):
+    # Batches collect entries and write them in one append once every question has finished
+    if log_entries is None:
+        log_to_json(question, sql_query, answer)
+    else:
+        log_entries.append({
+            "timestamp": datetime.now().isoformat(),
+            "question": question,
+            "sql_query": sql_query,
+            "answer": answer
+        })
+
+@runtime.component("replica")
+def build_replica():
+    if not (REPLICA_CONFIG['enabled'] or REPLICA_CONFIG['offline']):
+        return None
+    return create_replica(
+        create_replica_engine(REPLICA_CONFIG, DB_ENGINE_CONFIG),
+        None if REPLICA_CONFIG['offline'] else get_engine(DB_CONNECTION_STRING, DB_ENGINE_CONFIG),
+        REPLICA_CONFIG
+    )
+
+@runtime.component("query_router")
+def build_query_router():
+    return create_query_router(runtime.replica, REPLICA_CONFIG) if runtime.replica is not None else None
+
+@runtime.component("engine")
+def build_engine():
+    return runtime.replica.engine if REPLICA_CONFIG['offline'] else get_engine(DB_CONNECTION_STRING, DB_ENGINE_CONFIG)
+
+@runtime.component("db")
+def build_db():
+    from langchain_community.utilities import SQLDatabase
+    return SQLDatabase(runtime.engine)
+
+@runtime.component("query_cache")
+def build_query_cache():
+    return create_query_cache(QUERY_CACHE_CONFIG) if QUERY_CACHE_CONFIG['enabled'] else None
+
+@runtime.component("result_cache")
+def build_result_cache():
+    return create_result_cache(RESULT_CACHE_CONFIG) if RESULT_CACHE_CONFIG['enabled'] else None
+
+# Calls in flight and open cursors belong to the process that started them
+@runtime.component("question_flight", process_bound=True)
+def build_question_flight():
+    return SingleFlight()
+
+@runtime.component("sql_flight", process_bound=True)
+def build_sql_flight():
+    return SingleFlight()
+
+@runtime.component("result_pager", process_bound=True)
+def build_result_pager():
+    return create_result_pager(runtime.engine, PAGINATION_CONFIG, DB_ENGINE_CONFIG)
+
+@runtime.component("schema_catalog")
+def build_schema_catalog():
+    return create_schema_catalog(runtime.db, SCHEMA_CATALOG_CONFIG, SCHEMA_INFO)
+
+@runtime.component("summary_store")
+def build_summary_store():
+    if not SUMMARY_CONFIG['enabled']:
+        return None
+    return create_summary_store(get_engine(SUMMARY_CONFIG['url'], DB_ENGINE_CONFIG), runtime.engine, SUMMARY_CONFIG)
+
+query_log_reader = create_query_log_reader(QUERY_LOG_CONFIG)
+
+def recent_log_entries():
+    return query_log_reader.read(start=datetime.now() - timedelta(days=SUMMARY_CONFIG['mine_window_days']))
+
+@runtime.component("cost_guard")
+def build_cost_guard():
+    if not COST_GUARD_CONFIG['enabled']:
+        return None
+    return create_cost_guard(
+        runtime.engine, COST_GUARD_CONFIG, QueryLogWriter(COST_GUARD_CONFIG['log_directory'], prefix='cost_log')
+    )
+
+def get_schema_version() -> str:
+    return runtime.schema_catalog.version
+
+_schema_linker = {"version": None, "linker": None, "full_tokens": 0}
+
+def get_schema_linker() -> SchemaLinker:
+    version = runtime.schema_catalog.version
+    if _schema_linker["version"] != version:
+        _schema_linker["linker"] = SchemaLinker(runtime.schema_catalog.tables, SCHEMA_LINKING_CONFIG['table_descriptions'])
+        _schema_linker["full_tokens"] = estimate_tokens(runtime.schema_catalog.render())
+        _schema_linker["version"] = version
+    return _schema_linker["linker"]
+
+def link_schema(question: str) -> tuple[str, list[str], int]:
+    if not SCHEMA_LINKING_CONFIG['enabled']:
+        return runtime.schema_catalog.render(), list(runtime.schema_catalog.tables), 0
+    
+    linker = get_schema_linker()
+    tables = linker.link(
+        question,
+        max_tables=SCHEMA_LINKING_CONFIG['max_tables'],
+        min_score_ratio=SCHEMA_LINKING_CONFIG['min_score_ratio'],
+        include_neighbors=SCHEMA_LINKING_CONFIG['include_fk_neighbors']
+    )
+    schema = runtime.schema_catalog.render(tables)
+    tokens_saved = max(0, _schema_linker["full_tokens"] - estimate_tokens(schema))
+    return schema, tables, tokens_saved
+
+_sql_validator = {"version": None, "validator": None}
+
+def validate_sql(sql_query: str) -> list[str]:
+    if not SQL_VALIDATION_CONFIG['enabled']:
+        return []
+    version = runtime.schema_catalog.version
+    if _sql_validator["version"] != version:
+        _sql_validator["validator"] = SqlValidator(runtime.schema_catalog.tables)
+        _sql_validator["version"] = version
+    with stage("validate_sql"):
+        return _sql_validator["validator"].validate(sql_query)
+
+def refresh_schema(force: bool = False) -> list:
+    changed = runtime.schema_catalog.refresh(force=True) if force else runtime.schema_catalog.maybe_refresh()
+    if changed and runtime.result_cache is not None:
+        runtime.result_cache.invalidate_tables(*changed)
+    if changed and runtime.cost_guard is not None:
+        runtime.cost_guard.clear()
+    if changed and runtime.summary_store is not None:
+        runtime.summary_store.invalidate_tables(*changed)
+    return changed
 
 def create_tool_node_with_fallback(tools: list) -> RunnableWithFallbacks[Any, dict]:
+    from langgraph.prebuilt import ToolNode
     return ToolNode(tools).with_fallbacks(
         [RunnableLambda(handle_tool_error)], exception_key="error"
     )
@@ -79,11 +244,87 @@ def handle_tool_error(state) -> dict:
         ]
     }
 
-toolkit = SQLDatabaseToolkit(db=db, llm=ChatOpenAI(model="gpt-4", temperature=0.1))
-tools = toolkit.get_tools()
+def fetch_first_page(query: str, max_rows: Optional[int] = None, notice: Optional[str] = None, engine=None) -> dict:
+    # Only pages from the primary database are cached: replica and summary pages are cheap to read again,
+    # and a cached one would be served for primary queries and outlive the replica's staleness limit
+    use_cache = runtime.result_cache is not None and engine is None
+    if use_cache:
+        cached = runtime.result_cache.get(query)
+        if cached is not None:
+            # The cached page's query id may have left the pager; page 2 needs an id that is still known
+            return runtime.result_pager.register_page(cached, engine)
+    key = (normalize_sql(query, preserve_literals=True), engine is not None)
+    page, _ = runtime.sql_flight.do(key, runtime.result_pager.open, query, max_rows, notice, engine)
+    if use_cache and page["rows"]:
+        runtime.result_cache.set(query, page)
+    return page
+
+def run_on_replica(query: str) -> Optional[dict]:
+    try:
+        age = runtime.replica.age(extract_tables(query)) or 0.0
+        with stage("replica_query"):
+            return fetch_first_page(
+                query, notice=f"Answered from the local replica (data as of {age / 60:.0f} minutes ago).",
+                engine=runtime.replica.engine
+            )
+    except Exception as e:
+        # SQL Server is still there when the translated query doesn't run on the replica
+        runtime.query_router.record_fallback()
+        print(f"Error running query on the replica, falling back to the database: {e}")
+        return None
 
-list_tables_tool = next(tool for tool in tools if tool.name == "sql_db_list_tables")
-get_schema_tool = next(tool for tool in tools if tool.name == "sql_db_schema")
+def run_on_summary(hit) -> Optional[dict]:
+    started = time.perf_counter()
+    try:
+        with stage("summary_query"):
+            page = fetch_first_page(
+                hit.sql, notice=f"Answered from a precomputed summary (refreshed {hit.age / 60:.0f} minutes ago).",
+                engine=runtime.summary_store.engine
+            )
+    except Exception as e:
+        print(f"Error reading summary {hit.name}, falling back to the database: {e}")
+        return None
+    runtime.summary_store.record_hit(hit, time.perf_counter() - started)
+    return page
+
+def query_database(query: str) -> tuple[Optional[dict], str]:
+    if runtime.cost_guard is None:
+        with stage("db_query"):
+            return fetch_first_page(query), ""
+    with stage("cost_guard"):
+        decision = runtime.cost_guard.check(query)
+    if decision.action == "reject":
+        return None, f"Cost Error: {decision.message}"
+    started = time.perf_counter()
+    with stage("db_query"):
+        page = fetch_first_page(decision.sql, decision.row_limit, decision.message or None)
+    runtime.cost_guard.record(query, decision, page, time.perf_counter() - started)
+    return page, ""
+
+def run_sql(query: str) -> tuple[Optional[dict], str]:
+    try:
+        page = None
+        if runtime.summary_store is not None:
+            runtime.summary_store.maybe_refresh(recent_log_entries)
+            hit = runtime.summary_store.lookup(query)
+            if hit is not None:
+                page = run_on_summary(hit)
+        if page is None and runtime.query_router is not None:
+            with stage("route"):
+                route = runtime.query_router.route(query)
+            if route.target == "replica":
+                page = run_on_replica(route.sql)
+            else:
+                query = route.sql
+        if page is None:
+            page, error = query_database(query)
+            if error:
+                return None, error
+    except Exception as e:
+        return None, f"SQL Error: {str(e)}"
+    if not page["rows"]:
+        return None, "Error: Query returned no results."
+    return page, ""
 
 @tool
 def db_query_tool(query: str) -> str:
@@ -91,13 +332,10 @@ def db_query_tool(query: str) -> str:
     Execute a SQL query against the database and return the raw result.
     If the query fails, return a detailed error message.
     """
-    try:
-        result = db.run_no_throw(query)
-        if not result:
-            return "Error: Query returned no results."
-        return result
-    except Exception as e:
-        return f"SQL Error: {str(e)}"
+    page, error = run_sql(query)
+    if error:
+        return error
+    return str(page["rows"])
 
 def analyze_query_error(error_message: str) -> str:
     error_lower = error_message.lower()
@@ -109,6 +347,8 @@ def analyze_query_error(error_message: str) -> str:
         return "One or more tables in the query don't exist. Please check the table names."
     elif "ambiguous column" in error_lower:
         return "There are ambiguous column names in the query. Please specify the table name for ambiguous columns."
+    elif "cost error" in error_lower:
+        return "The query would read or return too much data. Add WHERE filters, aggregate, or select fewer rows."
     return "The query failed. Please check the query structure and try again."
 
 def should_retry_query(error_message: str) -> bool:
@@ -143,106 +383,580 @@ Remember:
 query_gen_prompt = ChatPromptTemplate.from_messages(
     [("system", query_gen_system), ("placeholder", "{messages}")]
 )
-query_gen = query_gen_prompt | ChatOpenAI(model="gpt-4", temperature=0)
+@runtime.component("query_gen_llm")
+def build_query_gen_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4", temperature=0)
+
+@runtime.component("query_gen")
+def build_query_gen():
+    return query_gen_prompt | runtime.query_gen_llm
+
+def record_token_usage(messages: list, response: AIMessage):
+    usage = getattr(response, "usage_metadata", None) or {}
+    token_usage = (response.response_metadata or {}).get("token_usage") or {}
+    prompt_tokens = usage.get("input_tokens", token_usage.get("prompt_tokens"))
+    completion_tokens = usage.get("output_tokens", token_usage.get("completion_tokens"))
+    if prompt_tokens is None:
+        # The provider didn't report usage; estimating it costs a tokenizer pass, so skip that in low-overhead mode
+        if metrics_registry.low_overhead:
+            return
+        prompt_tokens = estimate_tokens(query_gen_system) + sum(estimate_tokens(content) for _, content in messages)
+        completion_tokens = estimate_tokens(response.content)
+    metrics_registry.record_tokens("query_gen", prompt_tokens, completion_tokens or 0)
+
+def record_attempt(latency: float, outcome: str):
+    metrics_registry.observe("attempt_duration_seconds", latency,
+                             help_text="Time for one generate-and-execute attempt", outcome=outcome)
+
+# Worker threads and held permits don't survive fork(), so each process builds its own
+@runtime.component("llm_slots", process_bound=True)
+def build_llm_slots():
+    return threading.BoundedSemaphore(CONCURRENCY_CONFIG['llm_calls'])
+
+@runtime.component("db_slots", process_bound=True)
+def build_db_slots():
+    return threading.BoundedSemaphore(CONCURRENCY_CONFIG['db_calls'])
+
+def execute_sql(query: str) -> tuple[Optional[dict], str]:
+    with runtime.db_slots:
+        return run_sql(query)
+
+@runtime.component("db_executor", process_bound=True)
+def build_db_executor():
+    return ThreadPoolExecutor(max_workers=CONCURRENCY_CONFIG['db_threads'], thread_name_prefix="sql-db")
+
+@runtime.component("speculation_executor", process_bound=True)
+def build_speculation_executor():
+    return ThreadPoolExecutor(max_workers=CONCURRENCY_CONFIG['llm_calls'], thread_name_prefix="sql-speculate")
+
+_async_limits = weakref.WeakKeyDictionary()
+
+def get_async_limits() -> tuple[asyncio.Semaphore, asyncio.Semaphore]:
+    # asyncio primitives are bound to the loop that first uses them, so keep one pair per loop
+    loop = asyncio.get_running_loop()
+    if loop not in _async_limits:
+        _async_limits[loop] = (
+            asyncio.Semaphore(CONCURRENCY_CONFIG['llm_calls']),
+            asyncio.Semaphore(CONCURRENCY_CONFIG['db_calls'])
+        )
+    return _async_limits[loop]
+
+async def arun_in_db_executor(func, *args):
+    _, db_limit = get_async_limits()
+    async with db_limit:
+        # run_in_executor doesn't carry context variables over, so the current trace would be lost
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(runtime.db_executor, context.run, func, *args)
+
+async def aexecute_sql(query: str) -> tuple[Optional[dict], str]:
+    return await arun_in_db_executor(run_sql, query)
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
+    question: str
+    schema: str
+    linked_tables: list[str]
+    schema_tokens_saved: int
+    sql_query: str
+    result: dict
+    error: str
+    failed_attempts: Annotated[list[dict], operator.add]
+    retry_count: int
+    max_retries: int
+    attempt_started: float
+    attempt_latencies: Annotated[list[float], operator.add]
+    candidates: int
+    speculation: Annotated[list[dict], operator.add]
 
 workflow = StateGraph(State)
 
-def first_tool_call(state: State) -> dict[str, list[AIMessage]]:
-    schema = db.get_table_info()
+def first_tool_call(state: State) -> dict:
+    with stage("first_tool_call"):
+        refresh_schema()
+        question = state.get("question") or state["messages"][0].content
+        schema, linked_tables, tokens_saved = link_schema(question)
     return {
         "messages": [
             AIMessage(content=f"Database Schema:\n{schema}\n\nPlease generate a SQL query for the user's question.")
-        ]
+        ],
+        "question": question,
+        "schema": schema,
+        "linked_tables": linked_tables,
+        "schema_tokens_saved": tokens_saved,
+        "retry_count": 0
     }
 
-def query_gen_node(state: State):
-    messages = state["messages"]
-    user_question = messages[0].content if isinstance(messages[0], str) else messages[0].content
-    schema_info = messages[1].content if len(messages) > 1 else ""
-    response = query_gen.invoke({"messages": [
-        ("system", f"Database Schema:\n{schema_info}"),
-        ("user", user_question)
-    ]})
-    sql_query = response.content.strip()
-    
+async def afirst_tool_call(state: State) -> dict:
+    return await arun_in_db_executor(first_tool_call, state)
+
+def build_generation_messages(state: State) -> list:
+    messages = [
+        ("system", f"Database Schema:\n{state['schema']}"),
+        ("user", state["question"])
+    ]
+    # Replay earlier failures so the model can see exactly what it got wrong
+    for attempt in state.get("failed_attempts", []):
+        messages.append(("ai", attempt["sql_query"] or "(no SQL generated)"))
+        messages.append((
+            "user",
+            f"That query failed with: {attempt['error']}\n{attempt['diagnosis']}\n"
+            "Please output a corrected SQL query."
+        ))
+    return messages
+
+def rejected_generation(state: State, sql_query: str, error: str, diagnosis: str, attempt_started: float) -> dict:
+    latency = time.perf_counter() - attempt_started
+    record_attempt(latency, "invalid_sql")
+    return {
+        "messages": [AIMessage(content=error)],
+        "sql_query": "",
+        "error": error,
+        "failed_attempts": [{
+            "sql_query": sql_query,
+            "error": error,
+            "diagnosis": diagnosis
+        }],
+        "retry_count": state.get("retry_count", 0) + 1,
+        "attempt_latencies": [latency]
+    }
+
+def check_generated_sql(sql_query: str) -> tuple[str, str]:
+    """Return (error, diagnosis) for a generated query, or ("", "") when it may be executed."""
     # Validate that it's a SQL query
     if not sql_query.upper().startswith('SELECT'):
-        return {
-            "messages": [
-                AIMessage(content="Error: Generated response is not a valid SQL query. Please try again.")
-            ]
-        }
+        return (
+            "Error: Generated response is not a valid SQL query. Please try again.",
+            "The response must be a single SQL query that starts with SELECT."
+        )
+    
+    # Resolve tables and columns against the catalog so bad queries never reach the database
+    diagnostics = validate_sql(sql_query)
+    if diagnostics:
+        metrics_registry.inc("validation_rejections_total", help_text="Generated queries rejected before execution")
+        return f"Validation Error: {diagnostics[0]}", "\n".join(diagnostics)
+    return "", ""
+
+def accepted_generation(sql_query: str, attempt_started: float) -> dict:
+    return {
+        "messages": [AIMessage(content=sql_query)],
+        "sql_query": sql_query,
+        "error": "",
+        "attempt_started": attempt_started
+    }
+
+def generation_update(state: State, sql_query: str, attempt_started: float) -> dict:
+    error, diagnosis = check_generated_sql(sql_query)
+    if error:
+        return rejected_generation(state, sql_query, error, diagnosis, attempt_started)
+    return accepted_generation(sql_query, attempt_started)
+
+def candidate_settings(index: int) -> tuple[float, str]:
+    temperatures = SPECULATIVE_CONFIG['temperatures']
+    variants = SPECULATIVE_CONFIG['prompt_variants']
+    return temperatures[index % len(temperatures)], variants[index % len(variants)]
+
+def candidate_inputs(messages: list, index: int) -> tuple[Any, dict]:
+    temperature, variant = candidate_settings(index)
+    chain = query_gen_prompt | runtime.query_gen_llm.bind(temperature=temperature)
+    return chain, {"messages": messages + [("user", variant)] if variant else messages}
+
+def check_candidate(sql_query: str) -> tuple[str, str]:
+    error, diagnosis = check_generated_sql(sql_query)
+    if not error and SPECULATIVE_CONFIG['dry_run']:
+        with stage("dry_run"):
+            error = dry_run(runtime.engine, sql_query)
+        diagnosis = analyze_query_error(error) if error else ""
+    return error, diagnosis
+
+def candidate_result(index: int, sql_query: str, error: str, diagnosis: str, started: float) -> dict:
+    return {
+        "index": index,
+        "temperature": candidate_settings(index)[0],
+        "sql_query": sql_query,
+        "error": error,
+        "diagnosis": diagnosis,
+        "latency": time.perf_counter() - started
+    }
+
+def generate_candidate(messages: list, index: int) -> dict:
+    started = time.perf_counter()
+    chain, inputs = candidate_inputs(messages, index)
+    try:
+        with runtime.llm_slots, stage("query_gen"):
+            response = chain.invoke(inputs)
+        record_token_usage(messages, response)
+        sql_query = response.content.strip()
+        with runtime.db_slots:
+            error, diagnosis = check_candidate(sql_query)
+    except Exception as e:
+        sql_query, error, diagnosis = "", f"Error: {e}", "Generating this candidate failed."
+    return candidate_result(index, sql_query, error, diagnosis, started)
+
+async def agenerate_candidate(messages: list, index: int) -> dict:
+    started = time.perf_counter()
+    chain, inputs = candidate_inputs(messages, index)
+    llm_limit, _ = get_async_limits()
+    try:
+        async with llm_limit:
+            with stage("query_gen"):
+                response = await chain.ainvoke(inputs)
+        record_token_usage(messages, response)
+        sql_query = response.content.strip()
+        error, diagnosis = await arun_in_db_executor(check_candidate, sql_query)
+    except Exception as e:
+        sql_query, error, diagnosis = "", f"Error: {e}", "Generating this candidate failed."
+    return candidate_result(index, sql_query, error, diagnosis, started)
+
+def speculation_update(state: State, count: int, winner: Optional[dict], invalid: list[dict],
+                       attempt_started: float) -> dict:
+    wall_seconds = time.perf_counter() - attempt_started
+    # Retrying serially would have paid for each candidate that failed before the winner, one after another
+    serial_seconds = sum(candidate["latency"] for candidate in invalid) + (winner["latency"] if winner else 0.0)
+    report = {
+        "candidates": count,
+        "winner": winner["index"] if winner else None,
+        "temperature": winner["temperature"] if winner else None,
+        "invalid": len(invalid),
+        "wall_seconds": wall_seconds,
+        "serial_seconds": serial_seconds,
+        "saved_seconds": max(0.0, serial_seconds - wall_seconds)
+    }
+    metrics_registry.observe("speculation_saved_seconds", report["saved_seconds"],
+                             help_text="Generation time saved by speculative candidates versus serial retry")
+    metrics_registry.inc("speculative_candidates_total", amount=len(invalid), help_text="Speculative candidates checked",
+                         outcome="invalid")
     
-    return {"messages": [AIMessage(content=sql_query)]}
+    if winner is not None:
+        metrics_registry.inc("speculative_candidates_total", help_text="Speculative candidates checked", outcome="chosen")
+        update = accepted_generation(winner["sql_query"], attempt_started)
+        update["speculation"] = [report]
+        return update
+    
+    record_attempt(wall_seconds, "invalid_sql")
+    error = invalid[0]["error"]
+    return {
+        "messages": [AIMessage(content=error)],
+        "sql_query": "",
+        "error": error,
+        # Every candidate's mistake is replayed to the next round
+        "failed_attempts": [
+            {"sql_query": candidate["sql_query"], "error": candidate["error"], "diagnosis": candidate["diagnosis"]}
+            for candidate in sorted(invalid, key=lambda candidate: candidate["index"])
+        ],
+        "retry_count": state.get("retry_count", 0) + 1,
+        "attempt_latencies": [wall_seconds],
+        "speculation": [report]
+    }
 
-def should_continue(state: State) -> str:
-    messages = state["messages"]
-    last_message = messages[-1]
+def speculative_query_gen(state: State, count: int) -> dict:
+    """Generate `count` candidates at once and take the first that passes validation and the dry run."""
+    attempt_started = time.perf_counter()
+    messages = build_generation_messages(state)
+    # Each worker needs its own copy of the context; one Context can't be entered by two threads at once
+    futures = [
+        runtime.speculation_executor.submit(contextvars.copy_context().run, generate_candidate, messages, index)
+        for index in range(count)
+    ]
+    winner, invalid = None, []
+    for future in as_completed(futures):
+        candidate = future.result()
+        if not candidate["error"]:
+            winner = candidate
+            break
+        invalid.append(candidate)
+    # Candidates not started yet are dropped; ones already waiting on the model finish in the background
+    for future in futures:
+        future.cancel()
+    return speculation_update(state, count, winner, invalid, attempt_started)
+
+async def aspeculative_query_gen(state: State, count: int) -> dict:
+    attempt_started = time.perf_counter()
+    messages = build_generation_messages(state)
+    tasks = [asyncio.create_task(agenerate_candidate(messages, index)) for index in range(count)]
+    winner, invalid = None, []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            candidate = await next_done
+            if not candidate["error"]:
+                winner = candidate
+                break
+            invalid.append(candidate)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return speculation_update(state, count, winner, invalid, attempt_started)
+
+def query_gen_node(state: State):
+    if state.get("candidates", 1) > 1:
+        return speculative_query_gen(state, state["candidates"])
+    attempt_started = time.perf_counter()
+    messages = build_generation_messages(state)
+    with runtime.llm_slots, stage("query_gen"):
+        response = runtime.query_gen.invoke({"messages": messages})
+    record_token_usage(messages, response)
+    return generation_update(state, response.content.strip(), attempt_started)
+
+async def aquery_gen_node(state: State):
+    if state.get("candidates", 1) > 1:
+        return await aspeculative_query_gen(state, state["candidates"])
+    attempt_started = time.perf_counter()
+    messages = build_generation_messages(state)
+    llm_limit, _ = get_async_limits()
+    async with llm_limit:
+        with stage("query_gen"):
+            response = await runtime.query_gen.ainvoke({"messages": messages})
+    record_token_usage(messages, response)
+    return generation_update(state, response.content.strip(), attempt_started)
+
+def execution_update(state: State, page: Optional[dict], error: str) -> dict:
+    sql_query = state["sql_query"]
+    latency = time.perf_counter() - state["attempt_started"]
+    record_attempt(latency, "sql_error" if error else "success")
     
-    if last_message.content and last_message.content.strip().upper().startswith('SELECT'):
-        return END
+    if error:
+        return {
+            "messages": [ToolMessage(content=error, tool_call_id="execute_query")],
+            "result": None,
+            "error": error,
+            "failed_attempts": [{
+                "sql_query": sql_query,
+                "error": error,
+                "diagnosis": analyze_query_error(error)
+            }],
+            "retry_count": state.get("retry_count", 0) + 1,
+            "attempt_latencies": [latency]
+        }
     
-    if last_message.content and ("Error:" in last_message.content or "SQL Error:" in last_message.content):
+    return {
+        "result": page,
+        "error": "",
+        "attempt_latencies": [latency]
+    }
+
+def execute_query_node(state: State):
+    return execution_update(state, *execute_sql(state["sql_query"]))
+
+async def aexecute_query_node(state: State):
+    return execution_update(state, *await aexecute_sql(state["sql_query"]))
+
+def has_retries_left(state: State) -> bool:
+    return state.get("retry_count", 0) < state.get("max_retries", 3)
+
+def route_after_generation(state: State) -> str:
+    if not state.get("error"):
+        return "execute_query"
+    return "query_gen" if has_retries_left(state) else END
+
+def route_after_execution(state: State) -> str:
+    if state.get("error") and has_retries_left(state):
         return "query_gen"
-    
     return END
 
-workflow.add_node("first_tool_call", first_tool_call)
-workflow.add_node("query_gen", query_gen_node)
+workflow.add_node("first_tool_call", RunnableLambda(first_tool_call, afirst_tool_call))
+workflow.add_node("query_gen", RunnableLambda(query_gen_node, aquery_gen_node))
+workflow.add_node("execute_query", RunnableLambda(execute_query_node, aexecute_query_node))
 
 workflow.add_edge(START, "first_tool_call")
 workflow.add_edge("first_tool_call", "query_gen")
-workflow.add_conditional_edges("query_gen", should_continue)
+workflow.add_conditional_edges("query_gen", route_after_generation)
+workflow.add_conditional_edges("execute_query", route_after_execution)
 
-app = workflow.compile()
+@runtime.component("app")
+def build_app():
+    return workflow.compile()
 
-def run_query(question: str, max_retries: int = 3):
-    try:
-        retry_count = 0
-        last_error = None
-        
-        while retry_count < max_retries:
-            messages = app.invoke({"messages": [("user", question)]})
-            final_message = messages["messages"][-1]
-            
-            if not final_message.content:
-                return "Error: Failed to generate SQL query", None, []
-            
-            sql_query = final_message.content.strip()
-            
-            if not sql_query.upper().startswith('SELECT'):
-                return "Error: Generated response is not a valid SQL query", None, []
-            
-            result = db_query_tool.invoke(sql_query)
-            
-            if not should_retry_query(result):
-                log_to_json(question, sql_query, result)
-                
-                formatted_response = f"""SQL Query:
+def format_response(sql_query: str, page: dict) -> str:
+    return f"""SQL Query:
 {sql_query}
 
-Results:
-{result}"""
-                return formatted_response, None, []
-            
-            last_error = analyze_query_error(result)
-            retry_count += 1
-            
-            if retry_count < max_retries:
-                question = f"{question}\nPrevious error: {last_error}\nPlease fix the SQL query and try again."
+{format_page(page)}"""
+
+def describe_run(state: dict) -> list[str]:
+    logs = [
+        f"Schema linking kept {len(state['linked_tables'])}/{len(runtime.schema_catalog.tables)} tables "
+        f"({', '.join(state['linked_tables'])}), saving ~{state['schema_tokens_saved']} prompt tokens"
+    ]
+    for attempt, latency in enumerate(state.get("attempt_latencies", []), start=1):
+        logs.append(f"Attempt {attempt} took {latency:.2f}s")
+    for report in state.get("speculation", []):
+        if report["winner"] is None:
+            logs.append(f"Speculative generation: none of {report['candidates']} candidates passed validation")
+        else:
+            logs.append(
+                f"Speculative generation: candidate {report['winner'] + 1}/{report['candidates']} "
+                f"(temperature {report['temperature']}) chosen after {report['invalid']} invalid; "
+                f"{report['wall_seconds']:.2f}s vs ~{report['serial_seconds']:.2f}s serial, "
+                f"saved ~{report['saved_seconds']:.2f}s"
+            )
+    return logs
+
+def finish_run(question: str, schema_version: str, state: dict, log_entries: list = None):
+    logs = describe_run(state)
+    sql_query = state.get("sql_query", "")
+    
+    if not state.get("error"):
+        page = state["result"]
+        record_log(log_entries, question, sql_query, str(page["rows"]))
+        if runtime.query_cache is not None:
+            runtime.query_cache.set(question, schema_version, sql_query)
+        return format_response(sql_query, page), page, logs
+    
+    last_attempt = state["failed_attempts"][-1]
+    error_message = f"Failed after {state['retry_count']} attempts. Last error: {last_attempt['diagnosis']}"
+    record_log(log_entries, question, last_attempt["sql_query"], error_message)
+    return error_message, None, logs + [error_message]
+
+def record_outcome(trace, response: tuple) -> tuple:
+    if trace is not None:
+        answer, page, logs = response
+        trace.outputs = {
+            "sql_query": page["sql_query"] if page is not None else None,
+            "rows": len(page["rows"]) if page is not None else 0,
+            "logs": logs
+        }
+        if page is None:
+            trace.error = answer
+    return response
+
+def resolve_candidates(candidates: Optional[int] = None) -> int:
+    """Candidates per generation step: the request's choice, else the configured default, within the limit."""
+    if candidates is None:
+        candidates = SPECULATIVE_CONFIG['candidates'] if SPECULATIVE_CONFIG['enabled'] else 1
+    return max(1, min(int(candidates), SPECULATIVE_CONFIG['max_candidates']))
+
+def _run_query(question: str, max_retries: int, bypass_cache: bool, log_entries: list = None, candidates: int = 1):
+    with runtime.request_tracer.trace("run_query", question=question) as trace, metrics_registry.span("request"):
+        return record_outcome(trace, _run_query_stages(question, max_retries, bypass_cache, log_entries, candidates))
+
+def _run_query_stages(question: str, max_retries: int, bypass_cache: bool, log_entries: list = None,
+                      candidates: int = 1):
+    try:
+        schema_version = get_schema_version() if runtime.query_cache is not None else None
+        
+        if runtime.query_cache is not None and not bypass_cache:
+            cached_sql = runtime.query_cache.get(question, schema_version)
+            if cached_sql:
+                page, error = execute_sql(cached_sql)
+                if not error:
+                    record_log(log_entries, question, cached_sql, str(page["rows"]))
+                    return format_response(cached_sql, page), page, ["SQL served from query cache"]
+                runtime.query_cache.invalidate(question, schema_version)
         
-        error_message = f"Failed after {max_retries} attempts. Last error: {last_error}"
-        log_to_json(question, sql_query, error_message)
+        state = runtime.app.invoke({
+            "messages": [("user", question)],
+            "question": question,
+            "max_retries": max_retries,
+            "candidates": candidates
+        })
+        return finish_run(question, schema_version, state, log_entries)
+        
+    except Exception as e:
+        error_message = f"Error processing query: {str(e)}"
+        record_log(log_entries, question, "", error_message)
         return error_message, None, [error_message]
+
+async def _arun_query(question: str, max_retries: int, bypass_cache: bool, candidates: int = 1):
+    with runtime.request_tracer.trace("arun_query", question=question) as trace, metrics_registry.span("request"):
+        return record_outcome(trace, await _arun_query_stages(question, max_retries, bypass_cache, candidates))
+
+async def _arun_query_stages(question: str, max_retries: int, bypass_cache: bool, candidates: int = 1):
+    try:
+        schema_version = get_schema_version() if runtime.query_cache is not None else None
+        
+        if runtime.query_cache is not None and not bypass_cache:
+            cached_sql = runtime.query_cache.get(question, schema_version)
+            if cached_sql:
+                page, error = await aexecute_sql(cached_sql)
+                if not error:
+                    log_to_json(question, cached_sql, str(page["rows"]))
+                    return format_response(cached_sql, page), page, ["SQL served from query cache"]
+                runtime.query_cache.invalidate(question, schema_version)
+        
+        state = await runtime.app.ainvoke({
+            "messages": [("user", question)],
+            "question": question,
+            "max_retries": max_retries,
+            "candidates": candidates
+        })
+        return await asyncio.to_thread(finish_run, question, schema_version, state)
         
     except Exception as e:
         error_message = f"Error processing query: {str(e)}"
         log_to_json(question, "", error_message)
         return error_message, None, [error_message]
 
+def coalesced(response: tuple, shared: bool) -> tuple:
+    if not shared:
+        return response
+    answer, final_message, logs = response
+    return answer, final_message, logs + ["Coalesced with an identical question already in flight"]
+
+def run_query(question: str, max_retries: int = 3, bypass_cache: bool = False, candidates: int = None):
+    candidates = resolve_candidates(candidates)
+    key = (normalize_question(question), max_retries, bypass_cache, candidates)
+    return coalesced(*runtime.question_flight.do(key, _run_query, question, max_retries, bypass_cache, None, candidates))
+
+async def arun_query(question: str, max_retries: int = 3, bypass_cache: bool = False, candidates: int = None):
+    candidates = resolve_candidates(candidates)
+    key = (normalize_question(question), max_retries, bypass_cache, candidates)
+    return coalesced(*await runtime.question_flight.ado(key, _arun_query, question, max_retries, bypass_cache, candidates))
+
+def iter_queries(questions: list[str], max_retries: int = 3, bypass_cache: bool = False, max_workers: int = None):
+    """Yield (index, response) pairs as questions finish; duplicates are answered once."""
+    positions = {}
+    for index, question in enumerate(questions):
+        positions.setdefault(normalize_question(question), []).append(index)
+    
+    log_entries = []
+    candidates = resolve_candidates()
+    max_workers = max_workers or BATCH_CONFIG['max_workers']
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sql-batch") as executor:
+            futures = {
+                executor.submit(
+                    runtime.question_flight.do,
+                    (key, max_retries, bypass_cache, candidates),
+                    _run_query, questions[indexes[0]], max_retries, bypass_cache, log_entries, candidates
+                ): indexes
+                for key, indexes in positions.items()
+            }
+            for future in as_completed(futures):
+                response = coalesced(*future.result())
+                for index in futures[future]:
+                    yield index, response
+    finally:
+        log_to_json_bulk(log_entries)
+
+def run_queries(questions: list[str], max_retries: int = 3, bypass_cache: bool = False, max_workers: int = None) -> list:
+    responses = [None] * len(questions)
+    for index, response in iter_queries(questions, max_retries, bypass_cache, max_workers):
+        responses[index] = response
+    return responses
+
+def warm_up(components: list[str] = None, background: bool = False):
+    """Build components ahead of the first request. Pre-forking servers should call this in each worker."""
+    components = components if components is not None else STARTUP_CONFIG['warm_up']
+    if background:
+        return runtime.warm_up_in_background(components)
+    return runtime.warm_up(components)
+
+def is_ready() -> bool:
+    return runtime.is_warm(STARTUP_CONFIG['warm_up'])
+
+def startup_status() -> dict:
+    status = runtime.status(import_seconds)
+    status["ready"] = is_ready()
+    return status
+
+def __getattr__(name: str):
+    # Keeps `from Text_To_SQL_Langraph import db` working; the component is built on that first access
+    if runtime.has(name):
+        return runtime.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+import_seconds = time.perf_counter() - _import_started
+
 if __name__ == "__main__":
     question = "provide me information on order details?"
     result, final_message, logs = run_query(question)
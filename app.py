@@ -1,65 +1,214 @@
-from flask import Flask, render_template, request, jsonify
-from Text_To_SQL_Langraph import run_query
+import json
+from flask import Blueprint, Flask, Response, render_template, request, jsonify
+from Text_To_SQL_Langraph import run_query, iter_queries, run_queries, refresh_schema, format_response, metrics_registry
+from Text_To_SQL_Langraph import runtime, warm_up, is_ready, startup_status
+from db_engine import pool_stats
+from result_pages import CursorLimitError, decode_page_token, page_metadata
+from result_format import to_arrow_ipc, ARROW_MIME_TYPE, arrow_headers, format_error, query_payload
 import logging
 from datetime import datetime
 import os
-from langsmith import Client
-from langchain.callbacks.tracers import LangChainTracer
-from langchain.callbacks.manager import CallbackManager
+from config import BATCH_CONFIG, STARTUP_CONFIG
 
-app = Flask(__name__)
+bp = Blueprint('text_to_sql', __name__)
 
 LOG_FILE = 'sql_agent.log'
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
-
-client = Client(
-    api_key=os.getenv("LANGSMITH_API_KEY"),
-    api_url=os.getenv("LANGSMITH_ENDPOINT")
-)
-
-tracer = LangChainTracer(
-    project_name=os.getenv("LANGSMITH_PROJECT")
-)
-
-callback_manager = CallbackManager([tracer])
-
-@app.route('/')
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/query', methods=['POST'])
+def query_response(answer: str, page: dict, logs: list, response_format: str = 'text'):
+    if response_format == 'arrow' and page is not None:
+        return Response(to_arrow_ipc(page), mimetype=ARROW_MIME_TYPE, headers=arrow_headers(page))
+    return jsonify(query_payload(answer, page, logs, response_format))
+
+@bp.route('/query', methods=['POST'])
 def process_query():
     try:
         question = request.json.get('question')
         if not question:
             return jsonify({'error': 'No question provided'}), 400
         
+        bypass_cache = bool(request.json.get('bypass_cache', False))
+        response_format = request.json.get('format', 'text')
+        if format_error(response_format):
+            return jsonify({'error': format_error(response_format)}), 400
+        
+        candidates = request.json.get('candidates')
+        if candidates is not None and (not isinstance(candidates, int) or candidates < 1):
+            return jsonify({'error': 'candidates must be a positive integer'}), 400
+        
         logging.info(f"Processing question: {question}")
-        answer, final_message, logs = run_query(question)
+        answer, page, logs = run_query(question, bypass_cache=bypass_cache, candidates=candidates)
+        
+        return query_response(answer, page, logs, response_format)
+    except Exception as e:
+        logging.error(f"Error processing query: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def page_response(query_id: str, page_number: int):
+    try:
+        response_format = request.args.get('format', 'text')
+        if format_error(response_format):
+            return jsonify({'error': format_error(response_format)}), 400
+        
+        page = runtime.result_pager.fetch_page(query_id, page_number) if page_number >= 1 else None
+        if page is None:
+            return jsonify({'error': 'Unknown or expired query, or page out of range'}), 404
+        
+        answer = format_response(page['sql_query'], page) if response_format == 'text' else None
+        return query_response(answer, page, [], response_format)
+    except CursorLimitError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        logging.error(f"Error fetching result page: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/query/<query_id>/page/<int:page_number>', methods=['GET'])
+def query_page(query_id, page_number):
+    return page_response(query_id, page_number)
+
+@bp.route('/query/page', methods=['GET'])
+def query_page_by_token():
+    try:
+        query_id, page_number = decode_page_token(request.args.get('token', ''))
+    except Exception:
+        return jsonify({'error': 'Invalid page token'}), 400
+    return page_response(query_id, page_number)
+
+@bp.route('/query/batch', methods=['POST'])
+def process_batch():
+    try:
+        questions = request.json.get('questions')
+        if not questions or not isinstance(questions, list):
+            return jsonify({'error': 'No questions provided'}), 400
+        if len(questions) > BATCH_CONFIG['max_questions']:
+            return jsonify({'error': f"At most {BATCH_CONFIG['max_questions']} questions per batch"}), 400
+        bypass_cache = bool(request.json.get('bypass_cache', False))
+        
+        logging.info(f"Processing batch of {len(questions)} questions")
         
+        if request.json.get('stream'):
+            def generate():
+                for index, (answer, page, logs) in iter_queries(questions, bypass_cache=bypass_cache):
+                    yield json.dumps({
+                        'index': index,
+                        'question': questions[index],
+                        'answer': answer,
+                        'page': page_metadata(page),
+                        'logs': logs
+                    }) + '\n'
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        responses = run_queries(questions, bypass_cache=bypass_cache)
+        return jsonify({
+            'results': [
+                {'question': question, 'answer': answer, 'page': page_metadata(page), 'logs': logs}
+                for question, (answer, page, logs) in zip(questions, responses)
+            ],
+            'status': 'success'
+        })
+    except Exception as e:
+        logging.error(f"Error processing batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'query_cache': runtime.query_cache.stats() if runtime.query_cache is not None else None,
+        'result_cache': runtime.result_cache.stats() if runtime.result_cache is not None else None,
+        'coalescing': {
+            'questions': runtime.question_flight.stats(),
+            'sql': runtime.sql_flight.stats()
+        }
+    })
+
+@bp.route('/db/stats', methods=['GET'])
+def db_stats():
+    return jsonify({
+        'pool': pool_stats(runtime.engine),
+        'result_pages': runtime.result_pager.stats(),
+        'cost_guard': runtime.cost_guard.stats() if runtime.cost_guard is not None else None,
+        'replica': dict(runtime.replica.stats(), routes=runtime.query_router.stats()) if runtime.replica is not None else None
+    })
+
+@bp.route('/summaries/stats', methods=['GET'])
+def summaries_stats():
+    if runtime.summary_store is None:
+        return jsonify({'error': 'Summaries are disabled'}), 400
+    return jsonify(runtime.summary_store.report())
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    pool = pool_stats(runtime.engine)
+    gauges = {
+        'db_pool_checked_out': pool.get('checked_out', 0),
+        'db_pool_utilization': pool.get('utilization', 0.0),
+        'db_pool_checkout_wait_seconds_max': pool['wait_seconds_max'],
+        'db_statement_timeouts': pool['statement_timeouts'],
+        'result_cursors_open': runtime.result_pager.stats()['open_cursors'],
+    }
+    return Response(metrics_registry.render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/tracing/stats', methods=['GET'])
+def tracing_stats():
+    return jsonify(runtime.request_tracer.stats())
+
+@bp.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    if runtime.result_cache is None:
+        return jsonify({'error': 'Result cache is disabled'}), 400
+    
+    tables = (request.get_json(silent=True) or {}).get('tables')
+    if tables:
+        removed = runtime.result_cache.invalidate_tables(*tables)
+        if runtime.summary_store is not None:
+            runtime.summary_store.invalidate_tables(*tables)
+    else:
+        removed = runtime.result_cache.invalidate_expired()
+    
+    logging.info(f"Invalidated {removed} cached results for tables: {tables or 'expired'}")
+    return jsonify({'status': 'success', 'invalidated': removed})
+
+@bp.route('/schema/refresh', methods=['POST'])
+def schema_refresh():
+    try:
+        changed = refresh_schema(force=True)
+        logging.info(f"Schema catalog refreshed, changed tables: {changed}")
         return jsonify({
-            'answer': answer,
             'status': 'success',
-            'logs': logs
+            'changed_tables': changed,
+            'version': runtime.schema_catalog.version
         })
     except Exception as e:
-        logging.error(f"Error processing query: {str(e)}")
+        logging.error(f"Error refreshing schema: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/clear_history', methods=['POST'])
+def truncate_log_file(path: str):
+    # Truncate under the handler's lock so no record is half-written; the handler appends (O_APPEND),
+    # so it and other worker processes keep writing at the new end of the file
+    path = os.path.abspath(path)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.FileHandler) and handler.baseFilename == path:
+            handler.acquire()
+            try:
+                if handler.stream is not None:
+                    handler.stream.flush()
+                    handler.stream.truncate(0)
+                else:
+                    open(path, 'a').close()
+                    os.truncate(path, 0)
+            finally:
+                handler.release()
+            return
+    if os.path.exists(path):
+        os.truncate(path, 0)
+
+@bp.route('/clear_history', methods=['POST'])
 def clear_history():
     try:
-        # Clear the log file by opening it in write mode
-        with open(LOG_FILE, 'w') as log_file:
-            log_file.write('')
-        
+        truncate_log_file(LOG_FILE)
         logging.info("Log history cleared.")
         return jsonify({
             'status': 'success',
@@ -69,5 +218,32 @@ def clear_history():
         logging.error(f"Error clearing history: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/health', methods=['GET'])
+def health():
+    return jsonify(startup_status())
+
+@bp.route('/health/ready', methods=['GET'])
+def health_ready():
+    return jsonify(startup_status()), 200 if is_ready() else 503
+
+def create_app(warm: bool = None) -> Flask:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp)
+    if STARTUP_CONFIG['warm_up_on_start'] if warm is None else warm:
+        warm_up(background=STARTUP_CONFIG['warm_up_in_background'])
+    return flask_app
+
+# Serve with e.g. `gunicorn 'app:create_app()'` so each worker warms up after it is forked
+app = create_app(warm=False)
+
 if __name__ == '__main__':
+    app = create_app()
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,82 @@
+import json
+import logging
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from Text_To_SQL_Langraph import arun_query, warm_up
+from config import STARTUP_CONFIG
+from result_format import to_arrow_ipc, ARROW_MIME_TYPE, arrow_headers, format_error, query_payload
+
+# Serve with an ASGI server, e.g. `uvicorn asgi:application --workers 2`.
+# POST /query runs on the event loop; every other route is handed to the Flask app.
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_bytes(send, body: bytes, content_type: str, status: int = 200, headers: dict = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+                   + [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, payload: dict, status: int = 200):
+    await send_bytes(send, json.dumps(payload).encode("utf-8"), "application/json", status)
+
+
+async def process_query(scope, receive, send):
+    try:
+        payload = json.loads(await read_body(receive) or b"{}")
+        question = payload.get('question')
+        if not question:
+            return await send_json(send, {'error': 'No question provided'}, 400)
+        bypass_cache = bool(payload.get('bypass_cache', False))
+        response_format = payload.get('format', 'text')
+        if format_error(response_format):
+            return await send_json(send, {'error': format_error(response_format)}, 400)
+        candidates = payload.get('candidates')
+        if candidates is not None and (not isinstance(candidates, int) or candidates < 1):
+            return await send_json(send, {'error': 'candidates must be a positive integer'}, 400)
+
+        logging.info(f"Processing question: {question}")
+        answer, page, logs = await arun_query(question, bypass_cache=bypass_cache, candidates=candidates)
+
+        if response_format == 'arrow' and page is not None:
+            return await send_bytes(send, to_arrow_ipc(page), ARROW_MIME_TYPE, headers=arrow_headers(page))
+        await send_json(send, query_payload(answer, page, logs, response_format))
+    except Exception as e:
+        logging.error(f"Error processing query: {str(e)}")
+        await send_json(send, {'error': str(e)}, 500)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Runs in each worker, after the server has forked it
+            if STARTUP_CONFIG['warm_up_on_start']:
+                warm_up(background=STARTUP_CONFIG['warm_up_in_background'])
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(scope, receive, send)
+    if scope["type"] == "http" and scope["path"] == "/query" and scope["method"] == "POST":
+        return await process_query(scope, receive, send)
+    return await wsgi_application(scope, receive, send)
@@ -13,6 +13,188 @@ LANGSMITH_TRACING="true"
 LANGSMITH_ENDPOINT="https://api.smith.langchain.com"
 LANGSMITH_PROJECT="add-your-project-name-here" 
 
+DB_ENGINE_CONFIG = {
+    'pool_size': 10,  # persistent connections kept per process
+    'max_overflow': 5,  # extra connections opened under burst load and closed afterwards
+    'pool_timeout': 30,  # seconds to wait for a free connection before failing
+    'pool_recycle': 1800,  # reconnect connections older than this (RDS drops idle sessions)
+    'pool_pre_ping': True,
+    'warm_connections': 4,  # connections opened at startup
+    'statement_timeout_seconds': 30,  # abort generated SQL that runs longer than this
+    'login_timeout_seconds': 10,
+}
+
+CONCURRENCY_CONFIG = {
+    'llm_calls': 8,  # concurrent GPT-4 requests per process
+    'db_calls': 4,  # concurrent database statements per process
+    'db_threads': 8,  # worker threads that run blocking pymssql calls on the async path
+}
+
+PAGINATION_CONFIG = {
+    'page_size': 50,  # rows per result page
+    'max_rows': 10000,  # hard cap on rows read for a single query
+    'buffer_pages': 4,  # pages kept in memory per query; older pages are re-read on demand
+    'max_open_cursors': 6,  # database connections held open for partially read results; at most half the pool
+    'idle_seconds': 120,  # close a partially read cursor after this long without a page request
+    'max_queries': 1000,  # queries whose SQL is remembered for /query/<id>/page/<n>
+}
+
+BATCH_CONFIG = {
+    'max_workers': 8,  # questions processed in parallel by run_queries and /query/batch
+    'max_questions': 1000,
+}
+
+QUERY_CACHE_CONFIG = {
+    'enabled': True,
+    'backend': 'memory',  # 'memory' (in-process LRU) or 'sqlite'
+    'max_entries': 1024,
+    'ttl_seconds': 3600,
+    'sqlite_path': 'query_cache.db',
+}
+
+RESULT_CACHE_CONFIG = {
+    'enabled': True,
+    'max_entries': 256,
+    'ttl_seconds': 300,
+    'max_entry_bytes': 1_000_000,  # results larger than this are never cached
+    'table_ttls': {  # per-table overrides; an entry lives as long as its shortest-lived table
+        'Categories': 3600,
+        'Orders': 60,
+        'Order Details': 60,
+    },
+}
+
+SCHEMA_CATALOG_CONFIG = {
+    'snapshot_path': 'schema_snapshot.json',
+    'seed_from_config': True,  # start from SCHEMA_INFO below when there is no snapshot yet
+    'poll_interval_seconds': 300,  # how often sys.objects.modify_date is checked for changed tables
+    'sample_rows': 3,
+}
+
+SCHEMA_LINKING_CONFIG = {
+    'enabled': True,
+    'max_tables': 3,  # best-scoring tables kept before adding foreign-key neighbors
+    'min_score_ratio': 0.35,  # drop tables scoring below this fraction of the best match
+    'include_fk_neighbors': True,
+    'table_descriptions': {
+        'Categories': 'product categories and their descriptions',
+        'Customers': 'customers, clients and companies who place orders, with contacts and addresses by city and country',
+        'Order Details': 'line items of each order: products sold, quantity, unit price, discount, revenue and sales',
+        'Orders': 'orders placed by customers with order, required and shipped dates, freight and shipping country',
+        'Products': 'products with price, stock, units on order, reorder level and discontinued flag',
+    },
+}
+
+SQL_VALIDATION_CONFIG = {
+    'enabled': True,  # check generated SQL against the schema catalog before it is sent to the database
+}
+
+COST_GUARD_CONFIG = {
+    'enabled': True,
+    'max_estimated_rows': 5000,  # larger results are limited with TOP / OFFSET-FETCH (or rejected, see below)
+    'max_estimated_cost': {  # queries whose estimated plan cost exceeds this are rejected
+        'mssql': 500.0,  # SHOWPLAN StatementSubTreeCost
+        'sqlite': 5_000_000.0,  # rows scanned, from EXPLAIN QUERY PLAN and table sizes
+        'duckdb': 5_000_000.0,  # sum of EXPLAIN cardinality estimates
+    },
+    'on_excess_rows': 'rewrite',  # 'rewrite' to limit the rows returned, 'reject' to send the query back
+    'cache_size': 1024,  # plan decisions kept per normalized query
+    'log_directory': 'cost_logs',  # estimated vs actual rows and time for each query, for tuning the limits
+}
+
+REPLICA_CONFIG = {
+    'enabled': False,
+    'url': 'duckdb:///replica/northwind.duckdb',  # needs duckdb and duckdb_engine; a sqlite:/// URL also works
+    'tables': {  # table -> watermark column for incremental refresh, or None to reload it in full
+        'Categories': None,
+        'Customers': None,
+        'Products': None,
+        'Orders': 'OrderID',
+        'Order Details': 'OrderID',
+    },
+    'refresh_interval_seconds': 300,  # how often the replica copies new rows, in the background
+    'max_staleness_seconds': 900,  # queries go to SQL Server when a table they read is older than this
+    'batch_rows': 10000,  # rows copied per insert
+    'route': 'analytical',  # 'analytical' (aggregates, GROUP BY, DISTINCT), 'all' read-only queries, or 'never'
+    'offline': False,  # use an existing replica as the only database, e.g. for tests without SQL Server
+}
+
+SUMMARY_CONFIG = {
+    'enabled': False,
+    'url': 'sqlite:///summaries.db',  # local database holding the materialized summaries
+    'min_occurrences': 3,  # queries with the same tables and grouping must appear this often to be materialized
+    'max_summaries': 20,
+    'max_rows': 100000,  # summaries are grouped by every column their queries filter on; larger ones are not built
+    'mine_window_days': 30,  # how far back in the query log to look for frequent queries
+    'max_age_seconds': 3600,  # older summaries are not used; they are rebuilt before reaching this age
+    'refresh_interval_seconds': 600,  # how often the log is re-mined and stale summaries rebuilt, in the background
+}
+
+SPECULATIVE_CONFIG = {
+    'enabled': False,  # generate several candidate queries at once instead of retrying one at a time
+    'candidates': 3,  # default candidates per generation step when enabled; requests may ask for 1..max_candidates
+    'max_candidates': 5,
+    'temperatures': [0.0, 0.3, 0.7],  # one per candidate, cycled when there are more candidates than entries
+    'prompt_variants': [  # extra instruction per candidate, cycled like the temperatures
+        '',
+        'Qualify every column with its table alias and double-check the join keys against the schema.',
+        'Prefer the simplest query that answers the question: avoid unnecessary joins and subqueries.',
+    ],
+    'dry_run': True,  # have the database compile each candidate without running it before choosing one
+}
+
+METRICS_CONFIG = {
+    'enabled': True,
+    'low_overhead': False,  # production: keep bucket counts only and skip prompt token estimation
+    'latency_buckets': [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60],
+    'reservoir_size': 1024,  # raw samples kept per histogram for p50/p95/p99 when not in low-overhead mode
+}
+
+TRACING_CONFIG = {
+    'enabled': True,
+    'exporter': 'auto',  # 'langsmith', 'jsonl', 'none', or 'auto': LangSmith when configured above, else JSONL
+    'jsonl_path': 'traces.jsonl',
+    'sample_rate': 0.05,  # fraction of ordinary requests exported
+    'always_trace_errors': True,
+    'slow_request_seconds': 10.0,  # requests slower than this are always exported
+    'batch_size': 100,
+    'flush_interval_seconds': 2.0,
+    'max_queue': 10000,  # traces beyond this are dropped rather than blocking requests
+    'langchain_auto_trace': False,  # export every LangChain run synchronously, as before (LANGCHAIN_TRACING_V2)
+}
+
+QUERY_LOG_CONFIG = {
+    'directory': 'query_logs',  # segment files sql_log-<start time>-<pid>.jsonl, one writer per process
+    'legacy_file': 'sql_log.json',  # older single-file log, still read by the log reader
+    'max_segment_bytes': 64 * 1024 * 1024,
+    'max_segment_seconds': 86400,
+    'batch_size': 500,
+    'flush_interval_seconds': 1.0,
+    'max_queue': 100000,  # writers block once this many entries are waiting to be written
+    'max_write_delay_seconds': 3600,  # longest a question's entry waits to be logged, e.g. until its batch finishes
+}
+
+EVALUATION_CONFIG = {
+    'workers': 8,  # queries run in parallel, one pooled connection each
+    'gold_cache_path': 'gold_results.db',  # gold result sets kept across runs; None to always re-run them
+    'gold_cache_max_age_seconds': 7 * 86400,  # re-run gold queries once the data may have changed
+    'chunk_rows': 50000,  # rows read from the cursor and fingerprinted at a time
+    'max_frame_rows': 10000,  # results up to this size are also kept whole, to show differing rows
+    'float_tolerance': 1e-4,  # float and money values this close compare equal
+    'ignore_column_order': True,
+    'max_diff_rows': 10,  # differing rows shown per mismatch
+    'question_index_path': 'gold_question_index.npz',  # rebuilt when gold_queries.json changes
+    'match_candidates': 5,  # closest gold questions by n-gram TF-IDF, re-ranked with SequenceMatcher
+    'incremental_path': 'evaluation_state.db',  # log checkpoint and per-entry results of `--incremental` runs
+}
+
+STARTUP_CONFIG = {
+    # Components built before the first request; /health/ready reports ready once all of them are
+    'warm_up': ['engine', 'db', 'schema_catalog', 'query_gen', 'app'],
+    'warm_up_on_start': True,  # warm up when the Flask app or ASGI server starts
+    'warm_up_in_background': True,  # serve /health right away instead of waiting for the database
+}
+
 SCHEMA_INFO = """
 The database contains the following tables:
 
@@ -0,0 +1,275 @@
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional
+
+from sql_utils import TABLE_REFERENCE_PATTERN, TABLE_NAME_PATTERN, STRING_LITERAL_PATTERN, normalize_sql, normalize_table_name
+from sql_validator import tokenize
+
+SET_OPERATORS = {"UNION", "EXCEPT", "INTERSECT"}
+AGGREGATE_PATTERN = re.compile(r'^\s*select\s+(?:distinct\s+)?(?:count|sum|avg|min|max)\s*\(', re.IGNORECASE)
+SQLITE_PLAN_PATTERN = re.compile(r'^(SCAN|SEARCH)\s+(.+?)(?:\s+USING\b.*)?$')
+DUCKDB_ESTIMATE_PATTERN = re.compile(r'~\s*([\d,]+)\s+rows?', re.IGNORECASE)
+
+
+class PlanEstimate(NamedTuple):
+    rows: Optional[float]
+    cost: Optional[float]
+
+
+class GuardDecision(NamedTuple):
+    action: str  # allow, rewrite or reject
+    sql: str  # the SQL to execute
+    estimate: Optional[PlanEstimate]
+    row_limit: Optional[int]
+    message: str
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    aliases = {}
+    for match in TABLE_REFERENCE_PATTERN.finditer(STRING_LITERAL_PATTERN.sub("''", sql)):
+        for item in match.group(1).split(','):
+            reference = TABLE_NAME_PATTERN.match(item.strip())
+            if not reference:
+                continue
+            table = normalize_table_name(reference.group(0))
+            aliases[table] = table
+            alias = item.strip()[reference.end():].split()
+            if alias and alias[-1].lower() != 'as':
+                aliases[alias[-1].lower()] = table
+    return aliases
+
+
+def parse_showplan(plan_xml: str) -> PlanEstimate:
+    root = ElementTree.fromstring(plan_xml)
+    for element in root.iter():
+        if element.tag.endswith('StmtSimple') and 'StatementEstRows' in element.attrib:
+            return PlanEstimate(
+                float(element.attrib['StatementEstRows']),
+                float(element.attrib.get('StatementSubTreeCost', 0.0))
+            )
+    return PlanEstimate(None, None)
+
+
+def _limit_position(tokens: list) -> Optional[int]:
+    """Index of the token after the outermost SELECT [ALL | DISTINCT], skipping any CTEs."""
+    depth = 0
+    for index, token in enumerate(tokens):
+        depth += token.value == "("
+        depth -= token.value == ")"
+        if depth == 0 and token.kind == "keyword" and token.value == "SELECT":
+            index += 1
+            if index < len(tokens) and tokens[index].value in ("ALL", "DISTINCT"):
+                index += 1
+            return index
+    return None
+
+
+def limit_rows(sql: str, limit: int, dialect: str) -> Optional[str]:
+    """Rewrite `sql` to return at most `limit` rows, or None when that can't be done safely."""
+    sql = sql.strip().rstrip(';').strip()
+    if dialect != 'mssql':
+        return f"SELECT * FROM ({sql}) AS limited_result LIMIT {limit}"
+
+    tokens = tokenize(sql)
+    top_level, depth = [], 0
+    for token in tokens:
+        depth += token.value == "("
+        depth -= token.value == ")"
+        if depth == 0 and token.kind == "keyword":
+            top_level.append(token.value)
+    if "OFFSET" in top_level:
+        return None
+
+    if SET_OPERATORS & set(top_level):
+        if "ORDER" in top_level:
+            return f"{sql} OFFSET 0 ROWS FETCH NEXT {limit} ROWS ONLY"
+        if tokens[0].value == "WITH":
+            return None
+        return f"SELECT TOP ({limit}) * FROM ({sql}) AS limited_result"
+
+    position = _limit_position(tokens)
+    if position is None:
+        return None
+    if position < len(tokens) and tokens[position].value == "TOP":
+        # An existing TOP n is either small enough already or gets replaced
+        index = position + 1
+        parenthesized = index < len(tokens) and tokens[index].value == "("
+        index += parenthesized
+        if index >= len(tokens) or tokens[index].kind != "number":
+            return None
+        after = index + 1 + parenthesized
+        if after < len(tokens) and tokens[after].value in ("PERCENT", "WITH"):
+            return None
+        if float(tokens[index].value) <= limit:
+            return sql
+        rest = sql[tokens[after].pos:] if after < len(tokens) else ""
+        return f"{sql[:tokens[position].pos]}TOP ({limit}) {rest}"
+    insert_at = tokens[position].pos if position < len(tokens) else len(sql)
+    return f"{sql[:insert_at]}TOP ({limit}) {sql[insert_at:]}"
+
+
+class CostGuard:
+    """Estimates each query's plan before it runs and rejects or row-limits the expensive ones."""
+
+    def __init__(self, engine, max_rows: int = 5000, max_cost: float = 500.0, on_excess_rows: str = 'rewrite',
+                 cache_size: int = 1024, cost_log=None):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.max_rows = max_rows
+        self.max_cost = max_cost
+        self.on_excess_rows = on_excess_rows
+        self.cache_size = cache_size
+        self.cost_log = cost_log
+        self._decisions = OrderedDict()
+        self._table_rows = {}
+        self._lock = threading.Lock()
+        self._stats = {"checked": 0, "allowed": 0, "rewritten": 0, "rejected": 0, "estimate_failures": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _sqlite_table_rows(self, conn, table: str) -> int:
+        if table not in self._table_rows:
+            quoted = '"' + table.replace('"', '""') + '"'
+            self._table_rows[table] = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {quoted}").scalar() or 0
+        return self._table_rows[table]
+
+    def _estimate_sqlite(self, sql: str) -> PlanEstimate:
+        # SQLite plans carry no row estimates: bound them by the sizes of the tables the plan scans
+        aliases = table_aliases(sql)
+        rows, cost = 1, 0
+        with self.engine.connect() as conn:
+            details = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+            for detail in details:
+                match = SQLITE_PLAN_PATTERN.match(detail)
+                if not match:
+                    continue
+                table = aliases.get(match.group(2).lower(), match.group(2).lower())
+                table_rows = self._sqlite_table_rows(conn, table)
+                if match.group(1) == "SCAN":
+                    rows *= max(table_rows, 1)
+                    cost += table_rows
+                else:
+                    cost += 1
+        if AGGREGATE_PATTERN.match(sql) and not re.search(r'\bgroup\s+by\b', sql, re.IGNORECASE):
+            rows = 1
+        return PlanEstimate(float(rows), float(cost))
+
+    def _estimate_mssql(self, sql: str) -> PlanEstimate:
+        conn = self.engine.connect()
+        try:
+            conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+            try:
+                plan_xml = conn.exec_driver_sql(sql).fetchone()[0]
+            finally:
+                conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+            return parse_showplan(plan_xml)
+        except Exception:
+            # Never hand a connection back to the pool with SHOWPLAN possibly still on
+            conn.invalidate()
+            raise
+        finally:
+            conn.close()
+
+    def _estimate_duckdb(self, sql: str) -> PlanEstimate:
+        with self.engine.connect() as conn:
+            plan = "\n".join(str(row[-1]) for row in conn.exec_driver_sql(f"EXPLAIN {sql}"))
+        estimates = [int(value.replace(',', '')) for value in DUCKDB_ESTIMATE_PATTERN.findall(plan)]
+        return PlanEstimate(float(max(estimates)), float(sum(estimates))) if estimates else PlanEstimate(None, None)
+
+    def estimate(self, sql: str) -> PlanEstimate:
+        if self.dialect == 'mssql':
+            return self._estimate_mssql(sql)
+        if self.dialect == 'sqlite':
+            return self._estimate_sqlite(sql)
+        if self.dialect == 'duckdb':
+            return self._estimate_duckdb(sql)
+        return PlanEstimate(None, None)
+
+    def _decide(self, sql: str) -> GuardDecision:
+        try:
+            estimate = self.estimate(sql.strip().rstrip(';'))
+        except Exception as e:
+            # A failed estimate must not block the query; the database will report any real error
+            self._count("estimate_failures")
+            print(f"Error estimating query plan: {e}")
+            return GuardDecision("allow", sql, None, None, "")
+
+        if estimate.cost is not None and self.max_cost and estimate.cost > self.max_cost:
+            return GuardDecision("reject", sql, estimate, None, (
+                f"Estimated query cost {estimate.cost:,.1f} exceeds the limit of {self.max_cost:,.1f}. "
+                "Add WHERE filters, aggregate, or join on indexed keys."
+            ))
+        if estimate.rows is not None and self.max_rows and estimate.rows > self.max_rows:
+            limited = limit_rows(sql, self.max_rows + 1, self.dialect) if self.on_excess_rows == 'rewrite' else None
+            if limited is None:
+                return GuardDecision("reject", sql, estimate, None, (
+                    f"The query would return about {estimate.rows:,.0f} rows, more than the limit of {self.max_rows:,}. "
+                    "Add WHERE filters or aggregate the result."
+                ))
+            # One extra row is fetched so the pager can tell whether the limit actually cut anything off
+            return GuardDecision("rewrite", limited, estimate, self.max_rows, (
+                f"The query was estimated to return about {estimate.rows:,.0f} rows; "
+                f"results are limited to the first {self.max_rows:,}."
+            ))
+        return GuardDecision("allow", sql, estimate, None, "")
+
+    def check(self, sql: str) -> GuardDecision:
+        key = normalize_sql(sql, preserve_literals=True)
+        with self._lock:
+            self._stats["checked"] += 1
+            decision = self._decisions.get(key)
+            if decision is not None:
+                self._decisions.move_to_end(key)
+        if decision is None:
+            decision = self._decide(sql)
+            with self._lock:
+                self._decisions[key] = decision
+                while len(self._decisions) > self.cache_size:
+                    self._decisions.popitem(last=False)
+        self._count({"allow": "allowed", "rewrite": "rewritten", "reject": "rejected"}[decision.action])
+        return decision
+
+    def record(self, sql: str, decision: GuardDecision, page: Optional[dict], elapsed_seconds: float):
+        """Log the estimate next to what the query actually returned, for tuning the thresholds."""
+        if self.cost_log is None or decision.estimate is None:
+            return
+        self.cost_log.write({
+            "timestamp": datetime.now().isoformat(),
+            "sql_query": sql,
+            "executed_sql": decision.sql,
+            "action": decision.action,
+            "estimated_rows": decision.estimate.rows,
+            "estimated_cost": decision.estimate.cost,
+            "actual_rows": len(page["rows"]) if page is not None else None,
+            # With paging only the first page is read; more rows may follow
+            "actual_rows_complete": page is not None and not page["has_more"],
+            "elapsed_seconds": elapsed_seconds,
+        })
+
+    def clear(self):
+        with self._lock:
+            self._decisions.clear()
+            self._table_rows.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_decisions"] = len(self._decisions)
+        return stats
+
+
+def create_cost_guard(engine, cost_guard_config: dict, cost_log=None) -> CostGuard:
+    return CostGuard(
+        engine,
+        max_rows=cost_guard_config['max_estimated_rows'],
+        # Plan costs are not comparable across engines, so the cost limit is set per dialect
+        max_cost=cost_guard_config['max_estimated_cost'].get(engine.dialect.name),
+        on_excess_rows=cost_guard_config['on_excess_rows'],
+        cache_size=cost_guard_config['cache_size'],
+        cost_log=cost_log,
+    )
@@ -0,0 +1,215 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.statement_timeouts = 0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_statement_timeout(self):
+        with self._lock:
+            self.statement_timeouts += 1
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    def __init__(self, *args, metrics: PoolMetrics = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _install_statement_timeout(engine: Engine, driver: str, timeout: float, metrics: PoolMetrics):
+    if not timeout:
+        return
+
+    if driver == 'pyodbc':
+        @event.listens_for(engine, "connect")
+        def set_query_timeout(dbapi_connection, connection_record):
+            dbapi_connection.timeout = int(timeout)
+
+    elif driver == 'pysqlite':
+        # SQLite has no statement timeout; abort from the progress handler once the deadline passes
+        @event.listens_for(engine, "connect")
+        def set_progress_handler(dbapi_connection, connection_record):
+            info = connection_record.info
+
+            def check_deadline():
+                deadline = info.get("statement_deadline")
+                if deadline is not None and time.monotonic() > deadline:
+                    metrics.record_statement_timeout()
+                    return 1
+                return 0
+
+            dbapi_connection.set_progress_handler(check_deadline, 10000)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_statement_clock(conn, cursor, statement, parameters, context, executemany):
+            conn.info["statement_deadline"] = time.monotonic() + timeout
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def stop_statement_clock(conn, cursor, statement, parameters, context, executemany):
+            # Streamed pages are fetched long after execute returns; they must not trip the deadline
+            conn.info.pop("statement_deadline", None)
+
+
+def create_db_engine(connection_string: str, engine_config: dict) -> Engine:
+    url = make_url(connection_string)
+    driver = url.get_driver_name()
+    metrics = PoolMetrics()
+
+    connect_args = {}
+    if driver == 'pymssql':
+        # pymssql enforces these per statement and per login on the client side
+        connect_args['timeout'] = int(engine_config['statement_timeout_seconds'])
+        connect_args['login_timeout'] = int(engine_config['login_timeout_seconds'])
+
+    kwargs = {"pool_pre_ping": engine_config['pool_pre_ping']}
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=engine_config['pool_size'],
+            max_overflow=engine_config['max_overflow'],
+            pool_timeout=engine_config['pool_timeout'],
+            pool_recycle=engine_config['pool_recycle'],
+        )
+
+    engine = create_engine(connection_string, connect_args=connect_args, **kwargs)
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.metrics = metrics
+    engine.pool_metrics = metrics
+    _install_statement_timeout(engine, driver, engine_config['statement_timeout_seconds'], metrics)
+    return engine
+
+
+def warm_pool(engine: Engine, connections: int) -> int:
+    """Open `connections` connections at once so the first requests do not pay for the handshakes."""
+    if connections <= 0:
+        return 0
+
+    # Hold every connection until all are open, otherwise fast pings just reuse the first few
+    barrier = threading.Barrier(connections)
+
+    def ping(_):
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                barrier.wait(timeout=30)
+        except threading.BrokenBarrierError:
+            pass
+        except Exception:
+            barrier.abort()
+            raise
+        return True
+
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="db-warmup") as executor:
+        return sum(1 for ok in executor.map(ping, range(connections)) if ok)
+
+
+def dry_run(engine: Engine, sql: str) -> str:
+    """Have the database compile `sql` without running it; returns the error, or "" when it compiles."""
+    sql = sql.strip().rstrip(';')
+    try:
+        with engine.connect() as conn:
+            dialect = engine.dialect.name
+            if dialect == 'mssql':
+                # The supported replacement for SET FMTONLY ON: binds names and types, reads no rows
+                conn.execute(text("EXEC sys.sp_describe_first_result_set @tsql = :tsql"), {"tsql": sql}).fetchall()
+            elif dialect in ('sqlite', 'duckdb', 'postgresql'):
+                conn.exec_driver_sql(f"EXPLAIN {sql}").fetchall()
+            else:
+                conn.exec_driver_sql(f"SELECT * FROM ({sql}) AS dry_run WHERE 1 = 0").fetchall()
+    except Exception as e:
+        return f"SQL Error: {e}"
+    return ""
+
+
+def pool_stats(engine: Engine) -> dict:
+    pool = engine.pool
+    metrics = engine.pool_metrics
+    stats = {
+        "pool_class": type(pool).__name__,
+        "checkouts": metrics.checkouts,
+        "checkout_timeouts": metrics.checkout_timeouts,
+        "statement_timeouts": metrics.statement_timeouts,
+        "wait_seconds_avg": metrics.wait_seconds_total / metrics.checkouts if metrics.checkouts else 0.0,
+        "wait_seconds_max": metrics.wait_seconds_max,
+    }
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + pool._max_overflow
+        stats.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "utilization": pool.checkedout() / capacity if capacity > 0 else 0.0,
+        })
+    return stats
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _dispose_engines_after_fork():
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    # The parent's pooled connections must not be shared; close=False leaves them open for the parent
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+
+def get_engine(connection_string: Optional[str] = None, engine_config: Optional[dict] = None) -> Engine:
+    """Shared engine per connection string, created and warmed on first use."""
+    if connection_string is None or engine_config is None:
+        from config import DB_CONNECTION_STRING, DB_ENGINE_CONFIG
+        connection_string = connection_string or DB_CONNECTION_STRING
+        engine_config = engine_config or DB_ENGINE_CONFIG
+
+    with _engines_lock:
+        engine = _engines.get(connection_string)
+        if engine is None:
+            engine = create_db_engine(connection_string, engine_config)
+            warm_pool(engine, engine_config['warm_connections'])
+            _engines[connection_string] = engine
+        return engine
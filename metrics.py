@@ -0,0 +1,190 @@
+import time
+import bisect
+import random
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+DEFAULT_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+DEFAULT_TOKEN_BUCKETS = [50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000]
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative bucket counts plus an optional reservoir of raw samples for sharper quantiles."""
+
+    def __init__(self, buckets: list, reservoir_size: int = 0):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.reservoir_size = reservoir_size
+        self.samples = []
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+        if self.reservoir_size:
+            # Reservoir sampling keeps a uniform sample of everything observed in bounded memory
+            if len(self.samples) < self.reservoir_size:
+                self.samples.append(value)
+            else:
+                slot = random.randrange(self.count)
+                if slot < self.reservoir_size:
+                    self.samples[slot] = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        if self.samples:
+            ordered = sorted(self.samples)
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        # Interpolate inside the bucket that holds the q-th observation, as Prometheus does
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by metric name and labels, rendered in Prometheus text format."""
+
+    def __init__(self, prefix: str = "text_to_sql", enabled: bool = True, low_overhead: bool = False,
+                 latency_buckets: list = None, token_buckets: list = None, reservoir_size: int = 1024):
+        self.prefix = prefix
+        self.enabled = enabled
+        self.low_overhead = low_overhead
+        self.latency_buckets = latency_buckets or DEFAULT_LATENCY_BUCKETS
+        self.token_buckets = token_buckets or DEFAULT_TOKEN_BUCKETS
+        # Low-overhead mode keeps bucket counts only; quantiles are interpolated from them
+        self.reservoir_size = 0 if low_overhead else reservoir_size
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, buckets: list = None, help_text: str = "", **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(buckets or self.latency_buckets, self.reservoir_size)
+                self._histograms[key] = histogram
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, help_text: str = "", **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._help.setdefault(name, help_text)
+
+    @contextmanager
+    def _timed(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - started,
+                         help_text="Time spent in each stage of answering a question", stage=stage)
+
+    def span(self, stage: str):
+        return self._timed(stage) if self.enabled else nullcontext()
+
+    def record_tokens(self, stage: str, prompt_tokens: int, completion_tokens: int):
+        if not self.enabled:
+            return
+        for kind, tokens in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+            self.observe("llm_tokens", tokens, buckets=self.token_buckets,
+                         help_text="Tokens per LLM call", stage=stage, kind=kind)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {
+                self._series(name, labels): {
+                    "count": histogram.count,
+                    "sum": histogram.total,
+                    **{f"p{int(q * 100)}": histogram.quantile(q) for q in QUANTILES}
+                }
+                for (name, labels), histogram in self._histograms.items()
+            }
+            counters = {self._series(name, labels): value for (name, labels), value in self._counters.items()}
+        return {"histograms": histograms, "counters": counters}
+
+    def _series(self, name: str, labels: tuple, extra: tuple = ()) -> str:
+        pairs = list(labels) + list(extra)
+        label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+        return f"{self.prefix}_{name}{{{label_text}}}" if label_text else f"{self.prefix}_{name}"
+
+    def render_prometheus(self, gauges: dict = None) -> str:
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), histogram in self._histograms.items():
+                by_name.setdefault(name, []).append((labels, histogram))
+            for name, series in sorted(by_name.items()):
+                lines.append(f"# HELP {self.prefix}_{name} {self._help.get(name) or name}")
+                lines.append(f"# TYPE {self.prefix}_{name} histogram")
+                for labels, histogram in series:
+                    cumulative = 0
+                    for bound, bucket_count in zip(_bucket_labels(histogram.buckets), histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{self._series(name + '_bucket', labels, (('le', bound),))} {cumulative}")
+                    lines.append(f"{self._series(name + '_sum', labels)} {histogram.total}")
+                    lines.append(f"{self._series(name + '_count', labels)} {histogram.count}")
+
+                # Quantiles are exported next to the buckets so dashboards don't need histogram_quantile()
+                lines.append(f"# TYPE {self.prefix}_{name}_quantile gauge")
+                for labels, histogram in series:
+                    for q in QUANTILES:
+                        value = histogram.quantile(q)
+                        if value is not None:
+                            lines.append(f"{self._series(name + '_quantile', labels, (('quantile', q),))} {value}")
+
+            counters = {}
+            for (name, labels), value in self._counters.items():
+                counters.setdefault(name, []).append((labels, value))
+            for name, series in sorted(counters.items()):
+                lines.append(f"# HELP {self.prefix}_{name} {self._help.get(name) or name}")
+                lines.append(f"# TYPE {self.prefix}_{name} counter")
+                for labels, value in series:
+                    lines.append(f"{self._series(name, labels)} {value}")
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            lines.append(f"{self.prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _bucket_labels(buckets: list) -> list:
+    return [str(bound) for bound in buckets] + ["+Inf"]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def create_metrics_registry(metrics_config: dict) -> MetricsRegistry:
+    return MetricsRegistry(
+        enabled=metrics_config['enabled'],
+        low_overhead=metrics_config['low_overhead'],
+        latency_buckets=metrics_config['latency_buckets'],
+        reservoir_size=metrics_config['reservoir_size'],
+    )
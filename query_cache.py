@@ -0,0 +1,160 @@
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+def normalize_question(question: str) -> str:
+    question = question.lower()
+    question = re.sub(r'[^\w\s]', ' ', question)
+    return re.sub(r'\s+', ' ', question).strip()
+
+
+class LRUBackend:
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, expires_at: float) -> int:
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    def __init__(self, path: str = 'query_cache.db', max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM query_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE query_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            return row
+
+    def set(self, key: str, value: str, expires_at: float) -> int:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time())
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM query_cache WHERE key IN ("
+                "SELECT key FROM query_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            self._conn.commit()
+        return evicted
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM query_cache")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+
+
+class QueryCache:
+    """Maps normalized questions to validated SQL, scoped to a schema version."""
+
+    def __init__(self, backend=None, ttl_seconds: float = 3600):
+        self.backend = backend if backend is not None else LRUBackend()
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    @staticmethod
+    def make_key(question: str, schema_version: str) -> str:
+        return f"{schema_version}:{normalize_question(question)}"
+
+    def get(self, question: str, schema_version: str) -> Optional[str]:
+        key = self.make_key(question, schema_version)
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count("misses")
+            return None
+        sql_query, expires_at = entry
+        if expires_at < time.time():
+            self.backend.delete(key)
+            self._count("expired")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return sql_query
+
+    def set(self, question: str, schema_version: str, sql_query: str):
+        key = self.make_key(question, schema_version)
+        evicted = self.backend.set(key, sql_query, time.time() + self.ttl_seconds)
+        if evicted:
+            self._count("evictions", evicted)
+
+    def invalidate(self, question: str, schema_version: str):
+        self.backend.delete(self.make_key(question, schema_version))
+        self._count("invalidations")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["size"] = len(self.backend)
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def create_query_cache(cache_config: dict) -> QueryCache:
+    if cache_config.get('backend') == 'sqlite':
+        backend = SQLiteBackend(cache_config['sqlite_path'], cache_config['max_entries'])
+    else:
+        backend = LRUBackend(cache_config['max_entries'])
+    return QueryCache(backend, cache_config['ttl_seconds'])
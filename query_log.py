@@ -0,0 +1,294 @@
+import os
+import glob
+import json
+import time
+import heapq
+import queue
+import atexit
+import threading
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Union
+
+SEGMENT_PREFIX = "sql_log"
+TAIL_BYTES = 64 * 1024
+
+
+class QueryLogWriter:
+    """Appends log entries from a background thread into size- and time-rotated segment files.
+
+    Each process writes its own segments (the pid is in the file name), so workers never interleave writes.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int = 64 * 1024 * 1024, max_segment_seconds: float = 86400,
+                 batch_size: int = 500, flush_interval_seconds: float = 1.0, max_queue: int = 100000,
+                 prefix: str = SEGMENT_PREFIX):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pid = None
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._fd = None
+        self._segment_path = None
+        self._segment_opened = 0.0
+        self._segment_bytes = 0
+        self._stats = {"written": 0, "batches": 0, "segments": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._thread.start()
+
+    def _ensure_process(self):
+        # Threads don't survive fork(): a forked worker starts its own writer and segment
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+
+    def write(self, entry: dict):
+        self._ensure_process()
+        self._queue.put(entry)
+
+    def write_many(self, entries: list[dict]):
+        self._ensure_process()
+        for entry in entries:
+            self._queue.put(entry)
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                # "timestamp" is when the question was asked, and batches and concurrent requests reach the queue
+                # out of that order; "logged_at" is stamped here, so it never decreases within a segment
+                logged_at = datetime.now().isoformat()
+                self._append(''.join(json.dumps(dict(entry, logged_at=logged_at)) + '\n' for entry in batch).encode('utf-8'))
+                self._stats["written"] += len(batch)
+                self._stats["batches"] += 1
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"Error writing to log file: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _rotate(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        self._segment_path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{os.getpid()}.jsonl")
+        self._fd = os.open(self._segment_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment_opened = time.monotonic()
+        self._segment_bytes = 0
+        self._stats["segments"] += 1
+
+    def _append(self, data: bytes):
+        if (self._fd is None
+                or (self._segment_bytes and self._segment_bytes + len(data) > self.max_segment_bytes)
+                or time.monotonic() - self._segment_opened > self.max_segment_seconds):
+            self._rotate()
+        # One write per batch on an O_APPEND descriptor, so a batch is never split by another writer
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self._segment_bytes += len(data)
+
+    def flush(self):
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        stats["segment"] = self._segment_path
+        return stats
+
+
+def _as_timestamp(value: Union[str, datetime, None]) -> Optional[str]:
+    # Entries use datetime.isoformat(), which sorts the same as the times it encodes
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+def _parse(line: bytes) -> Optional[dict]:
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        # A torn last line from a crashed writer, or a segment still being written
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def _last_entry(f) -> Optional[dict]:
+    size = f.seek(0, os.SEEK_END)
+    f.seek(max(0, size - TAIL_BYTES))
+    for line in reversed(f.read().splitlines()):
+        entry = _parse(line)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _seek_to(f, start: str):
+    """Binary search for the first line logged at or after `start`.
+
+    An entry is logged after it is created, so no entry before that line has a timestamp at or after `start`.
+    """
+    lo, hi = 0, f.seek(0, os.SEEK_END)
+    while hi - lo > 4096:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()
+        entry = None
+        while entry is None:
+            line = f.readline()
+            if not line:
+                break
+            entry = _parse(line)
+        # Entries from before "logged_at" existed can't be placed; search to the left of them
+        if entry is None or entry.get("logged_at", start) >= start:
+            hi = mid
+        else:
+            lo = mid
+    f.seek(lo)
+    if lo:
+        f.readline()
+
+
+def _log_order(entry: dict) -> str:
+    # Entries from before "logged_at" existed were written in timestamp order
+    return entry.get("logged_at") or entry.get("timestamp") or ""
+
+
+def read_segment(path: str, start: Optional[str] = None, end: Optional[str] = None,
+                 logged_by: Optional[str] = None) -> Iterator[dict]:
+    """Entries of one segment with a timestamp in [start, end], in the order they were logged.
+
+    Reading stops at the first entry logged after `logged_by`, the latest an entry from the range is written.
+    Entries without a timestamp are only read when no range is given.
+    """
+    with open(path, 'rb') as f:
+        if start is not None:
+            _seek_to(f, start)
+        for line in f:
+            entry = _parse(line)
+            if entry is None:
+                continue
+            if logged_by is not None and entry.get("logged_at", logged_by) > logged_by:
+                return
+            if start is None and end is None:
+                yield entry
+                continue
+            timestamp = entry.get("timestamp")
+            if timestamp is None or (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                continue
+            yield entry
+
+
+class QueryLogReader:
+    """Streams log entries across segments in the order they were logged, optionally limited to a time range.
+
+    Entries reach the log up to `max_write_delay_seconds` after their timestamp (batches are written once every
+    question has finished), so that is how far past the end of a range each segment is read.
+    """
+
+    def __init__(self, directory: str, legacy_file: Optional[str] = None, prefix: str = SEGMENT_PREFIX,
+                 max_write_delay_seconds: float = 3600):
+        self.directory = directory
+        self.legacy_file = legacy_file
+        self.prefix = prefix
+        self.max_write_delay_seconds = max_write_delay_seconds
+
+    def segments(self) -> list[str]:
+        paths = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.jsonl")))
+        if self.legacy_file and os.path.exists(self.legacy_file):
+            paths.insert(0, self.legacy_file)
+        return paths
+
+    def _may_contain(self, path: str, start: Optional[str]) -> bool:
+        # A segment whose last entry was logged before `start` has nothing created after it
+        if start is None:
+            return True
+        with open(path, 'rb') as f:
+            last = _last_entry(f)
+        return last is not None and last.get("logged_at", start) >= start
+
+    def read(self, start: Union[str, datetime, None] = None, end: Union[str, datetime, None] = None) -> Iterator[dict]:
+        start, end = _as_timestamp(start), _as_timestamp(end)
+        logged_by = None
+        if end is not None:
+            logged_by = (datetime.fromisoformat(end) + timedelta(seconds=self.max_write_delay_seconds)).isoformat()
+        streams = [
+            read_segment(path, start, end, logged_by)
+            for path in self.segments()
+            if self._may_contain(path, start)
+        ]
+        return heapq.merge(*streams, key=_log_order)
+
+    def read_new(self, offsets: dict) -> Iterator[dict]:
+        """Entries appended since `offsets` ({path: byte offset}), which is advanced past each line read.
+
+        Segments are append-only, so a checkpoint of these offsets is enough to resume where a reader stopped.
+        A line still being written (no trailing newline yet) is left for the next call.
+        """
+        for path in self.segments():
+            offset = offsets.get(path, 0)
+            with open(path, 'rb') as f:
+                if f.seek(0, os.SEEK_END) < offset:
+                    # Shorter than at the last read: the file was replaced, read it again from the start
+                    offset = 0
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    offsets[path] = offset
+                    entry = _parse(line)
+                    if entry is not None:
+                        yield entry
+
+
+def create_query_log_writer(query_log_config: dict) -> QueryLogWriter:
+    return QueryLogWriter(
+        query_log_config['directory'],
+        max_segment_bytes=query_log_config['max_segment_bytes'],
+        max_segment_seconds=query_log_config['max_segment_seconds'],
+        batch_size=query_log_config['batch_size'],
+        flush_interval_seconds=query_log_config['flush_interval_seconds'],
+        max_queue=query_log_config['max_queue'],
+    )
+
+
+def create_query_log_reader(query_log_config: dict, base_dir: str = '.') -> QueryLogReader:
+    return QueryLogReader(
+        os.path.join(base_dir, query_log_config['directory']),
+        legacy_file=os.path.join(base_dir, query_log_config['legacy_file']) if query_log_config['legacy_file'] else None,
+        max_write_delay_seconds=query_log_config['max_write_delay_seconds'],
+    )
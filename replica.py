@@ -0,0 +1,395 @@
+import os
+import re
+import time
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import Column, Float, MetaData, String, Table, func, select, tuple_
+from sqlalchemy.engine import Engine, make_url
+
+from db_engine import get_engine
+from sql_utils import extract_tables
+from sql_lexer import scan
+
+STATE_TABLE = "replica_state"
+SET_OPERATORS = {"UNION", "EXCEPT", "INTERSECT"}
+ANALYTICAL_PATTERN = re.compile(
+    r'\b(?:group\s+by|having|count|sum|avg|min|max|distinct|over)\b', re.IGNORECASE
+)
+# T-SQL functions with a same-argument equivalent in the replica engines
+RENAMED_FUNCTIONS = {
+    "GETDATE": "CURRENT_TIMESTAMP",
+    "SYSDATETIME": "CURRENT_TIMESTAMP",
+    "ISNULL": "COALESCE",
+    "LEN": "LENGTH",
+}
+# T-SQL functions with no drop-in equivalent; queries using them stay on SQL Server
+UNSUPPORTED_FUNCTIONS = {
+    "common": {"DATEADD", "DATEDIFF", "DATEDIFF_BIG", "DATENAME", "DATEPART", "CONVERT", "TRY_CONVERT", "FORMAT",
+               "CHARINDEX", "PATINDEX", "STUFF", "DATEFROMPARTS", "EOMONTH", "STRING_AGG", "NEWID", "CHOOSE"},
+    "sqlite": {"YEAR", "MONTH", "DAY", "LEFT", "RIGHT", "CONCAT"},
+    "duckdb": {"IIF"},
+}
+
+
+class _Token(NamedTuple):
+    kind: str
+    text: str
+    gap: str  # whitespace and comments before the token
+
+
+def _raw_tokens(sql: str) -> List[_Token]:
+    tokens, gap = [], ""
+    for kind, text, _ in scan(sql):
+        if kind in ("space", "line_comment", "block_comment"):
+            gap += text if kind != "line_comment" else text + "\n"
+            continue
+        tokens.append(_Token(kind, text, gap))
+        gap = ""
+    return tokens
+
+
+def _is(token: _Token, *words: str) -> bool:
+    return token.kind == "word" and token.text.upper() in words
+
+
+def _rows_clause(tokens: List[_Token], index: int) -> Optional[tuple]:
+    """Parse `OFFSET n ROWS [FETCH NEXT m ROWS ONLY]` at `index`; returns (offset, fetch or None, next index)."""
+    def number(at):
+        return tokens[at].text if at < len(tokens) and tokens[at].kind == "number" else None
+
+    offset = number(index + 1)
+    if offset is None or index + 2 >= len(tokens) or not _is(tokens[index + 2], "ROW", "ROWS"):
+        return None
+    index += 3
+    if index < len(tokens) and _is(tokens[index], "FETCH"):
+        fetch = number(index + 2)
+        if (fetch is None or not _is(tokens[index + 1], "NEXT", "FIRST") or index + 4 >= len(tokens)
+                or not _is(tokens[index + 3], "ROW", "ROWS") or not _is(tokens[index + 4], "ONLY")):
+            return None
+        return offset, fetch, index + 5
+    return offset, None, index
+
+
+def transpile(sql: str, dialect: str) -> Optional[str]:
+    """Rewrite a T-SQL SELECT for DuckDB or SQLite, or None when it uses something without an equivalent."""
+    tokens = _raw_tokens(sql.strip().rstrip(';'))
+    unsupported = UNSUPPORTED_FUNCTIONS["common"] | UNSUPPORTED_FUNCTIONS.get(dialect, set())
+    out = []
+    # LIMIT clauses owed to the SELECT at each parenthesis depth, from TOP n
+    pending_limits: Dict[int, str] = {}
+    depth, index = 0, 0
+
+    def emit(text: str, gap: str = " "):
+        out.append(gap + text)
+
+    while index < len(tokens):
+        token = tokens[index]
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        upper = token.text.upper()
+
+        if token.kind in ("variable", "other") or (token.kind == "word" and token.text.startswith("#")):
+            return None
+        if token.kind == "op" and token.text == "(":
+            depth += 1
+        elif token.kind == "op" and token.text == ")":
+            if depth in pending_limits:
+                emit(f"LIMIT {pending_limits.pop(depth)}")
+            depth -= 1
+        elif token.kind == "word" and upper in SET_OPERATORS and depth in pending_limits:
+            # TOP limits one branch; a trailing LIMIT would limit the whole set operation
+            return None
+
+        if token.kind == "bracket":
+            emit('"' + token.text[1:-1].replace("]]", "]").replace('"', '""') + '"', token.gap)
+        elif token.kind == "string" and token.text.startswith(("N'", "n'")):
+            emit(token.text[1:], token.gap)
+        elif token.kind == "word" and upper == "TOP":
+            parenthesized = following is not None and following.text == "("
+            count_at = index + 1 + parenthesized
+            if count_at >= len(tokens) or tokens[count_at].kind != "number":
+                return None
+            after = count_at + 1 + parenthesized
+            if after < len(tokens) and _is(tokens[after], "PERCENT", "WITH"):
+                return None
+            pending_limits[depth] = tokens[count_at].text
+            index = after
+            continue
+        elif token.kind == "word" and upper == "OFFSET":
+            clause = _rows_clause(tokens, index)
+            if clause is None:
+                return None
+            offset, fetch, index = clause
+            emit(f"LIMIT {fetch} OFFSET {offset}" if fetch is not None else
+                 f"LIMIT -1 OFFSET {offset}" if dialect == "sqlite" else f"OFFSET {offset}", token.gap)
+            continue
+        elif _is(token, "WITH") and following is not None and following.text == "(":
+            # Table hints such as WITH (NOLOCK) mean nothing to the replica
+            close = next((at for at in range(index + 2, len(tokens)) if tokens[at].text == ")"), None)
+            if close is None or not all(_is(tokens[at], "NOLOCK", "READUNCOMMITTED") or tokens[at].text == ","
+                                        for at in range(index + 2, close)):
+                return None
+            index = close + 1
+            continue
+        elif token.kind == "word" and token.text.lower() == "dbo" and following is not None and following.text == ".":
+            # The replica has no schemas: dbo.Orders -> Orders
+            index += 2
+            if index < len(tokens):
+                tokens[index] = tokens[index]._replace(gap=token.gap)
+            continue
+        elif token.kind == "word" and following is not None and following.text == "(":
+            if upper in unsupported:
+                return None
+            renamed = RENAMED_FUNCTIONS.get(upper)
+            if renamed == "CURRENT_TIMESTAMP":
+                # GETDATE() -> CURRENT_TIMESTAMP, dropping the empty argument list
+                if index + 2 >= len(tokens) or tokens[index + 2].text != ")":
+                    return None
+                emit(renamed, token.gap)
+                index += 3
+                continue
+            emit(renamed or token.text, token.gap)
+        elif token.kind == "op" and token.text == "+" and (
+                (out and out[-1].lstrip().startswith("'")) or (following is not None and following.kind == "string")):
+            # + next to a string literal is concatenation in T-SQL
+            emit("||", token.gap)
+        else:
+            emit(token.text, token.gap)
+        index += 1
+
+    if 0 in pending_limits:
+        emit(f"LIMIT {pending_limits.pop(0)}")
+    return "".join(out).strip()
+
+
+def is_analytical(sql: str) -> bool:
+    return bool(ANALYTICAL_PATTERN.search(sql))
+
+
+class Replica:
+    """Local copy of the source tables, refreshed incrementally past a per-table watermark column.
+
+    Tables without a watermark are reloaded in full on each refresh. With a primary key, rows at or past the
+    watermark are replaced, so a modification-time watermark also picks up updates; deletes need a full reload.
+    """
+
+    def __init__(self, engine: Engine, source_engine: Optional[Engine], tables: Dict[str, Optional[str]],
+                 batch_rows: int = 10000, refresh_interval_seconds: float = 300):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.source_engine = source_engine
+        self.tables = tables
+        self.batch_rows = batch_rows
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self._metadata = MetaData()
+        self._state = Table(
+            STATE_TABLE, self._metadata,
+            Column("table_name", String(256), primary_key=True),
+            Column("refreshed_at", Float),
+        )
+        self._state.create(self.engine, checkfirst=True)
+        self._refreshed_at = self._load_state()
+        self._lock = threading.Lock()
+        self._refreshing = False
+        os.register_at_fork(after_in_child=self._after_fork)
+        self._last_attempt = 0.0
+        self._stats = {"refreshes": 0, "rows_copied": 0, "errors": 0}
+
+    def _load_state(self) -> Dict[str, float]:
+        with self.engine.connect() as conn:
+            return {name: refreshed_at for name, refreshed_at in conn.execute(select(self._state))}
+
+    def _local_table(self, source: Table) -> Table:
+        local = self._metadata.tables.get(source.name)
+        if local is not None:
+            return local
+        columns = []
+        for column in source.columns:
+            try:
+                column_type = column.type.as_generic()
+            except NotImplementedError:
+                column_type = String()
+            columns.append(Column(column.name, column_type))
+        local = Table(source.name, self._metadata, *columns)
+        local.create(self.engine, checkfirst=True)
+        return local
+
+    def _refresh_table(self, name: str, watermark: Optional[str]) -> int:
+        source = Table(name, MetaData(), autoload_with=self.source_engine)
+        local = self._local_table(source)
+        key = [local.c[column.name] for column in source.primary_key.columns]
+        query = select(source)
+        copied = 0
+        with self.engine.begin() as local_conn:
+            last = local_conn.execute(select(func.max(local.c[watermark]))).scalar() if watermark else None
+            if last is None:
+                local_conn.execute(local.delete())
+            elif key:
+                query = query.where(source.c[watermark] >= last)
+            else:
+                query = query.where(source.c[watermark] > last)
+            if watermark:
+                query = query.order_by(source.c[watermark])
+
+            with self.source_engine.connect() as source_conn:
+                result = source_conn.execution_options(stream_results=True).execute(query)
+                while True:
+                    rows = [dict(row._mapping) for row in result.fetchmany(self.batch_rows)]
+                    if not rows:
+                        break
+                    if last is not None and key:
+                        values = [tuple(row[column.name] for column in key) for row in rows]
+                        condition = key[0].in_([value[0] for value in values]) if len(key) == 1 \
+                            else tuple_(*key).in_(values)
+                        local_conn.execute(local.delete().where(condition))
+                    local_conn.execute(local.insert(), rows)
+                    copied += len(rows)
+
+            refreshed_at = time.time()
+            local_conn.execute(self._state.delete().where(self._state.c.table_name == name))
+            local_conn.execute(self._state.insert(), {"table_name": name, "refreshed_at": refreshed_at})
+        self._refreshed_at[name] = refreshed_at
+        return copied
+
+    def refresh(self, tables: Optional[List[str]] = None) -> int:
+        if self.source_engine is None:
+            return 0
+        copied = 0
+        for name in tables or list(self.tables):
+            try:
+                copied += self._refresh_table(name, self.tables[name])
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"Error refreshing replica table {name}: {e}")
+        self._stats["refreshes"] += 1
+        self._stats["rows_copied"] += copied
+        return copied
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _after_fork(self):
+        # A refresh running in the parent isn't running in the child
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def maybe_refresh(self) -> bool:
+        """Start a background refresh when one is due; never blocks the caller."""
+        with self._lock:
+            if (self.source_engine is None or self._refreshing
+                    or time.time() - self._last_attempt < self.refresh_interval_seconds):
+                return False
+            self._refreshing = True
+            self._last_attempt = time.time()
+        threading.Thread(target=self._refresh_in_background, name="replica-refresh", daemon=True).start()
+        return True
+
+    def table_names(self) -> Dict[str, str]:
+        return {name.lower(): name for name in self.tables}
+
+    def age(self, tables) -> Optional[float]:
+        """Seconds since the stalest of `tables` was refreshed, or None if one was never copied."""
+        if self.source_engine is None:
+            return 0.0
+        names = self.table_names()
+        refreshed = [self._refreshed_at.get(names.get(table, table)) for table in tables]
+        if not refreshed or any(value is None for value in refreshed):
+            return None
+        return time.time() - min(refreshed)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "dialect": self.dialect,
+            "refreshing": self._refreshing,
+            "tables": {
+                name: time.time() - self._refreshed_at[name] if name in self._refreshed_at else None
+                for name in self.tables
+            },
+        }
+
+
+class Route(NamedTuple):
+    target: str  # replica or primary
+    sql: str  # the SQL to run there
+    reason: str
+
+
+class QueryRouter:
+    """Sends read-only analytical queries to the replica while it is fresh enough; everything else to SQL Server."""
+
+    def __init__(self, replica: Replica, mode: str = 'analytical', max_staleness_seconds: float = 900,
+                 offline: bool = False):
+        self.replica = replica
+        self.mode = mode
+        self.max_staleness_seconds = max_staleness_seconds
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def _route(self, sql: str) -> Route:
+        if self.offline:
+            # The replica is the only database: translate everything, and let errors surface
+            return Route("primary", transpile(sql, self.replica.dialect) or sql, "offline")
+        self.replica.maybe_refresh()
+        if self.mode == 'never' or (self.mode == 'analytical' and not is_analytical(sql)):
+            return Route("primary", sql, "not_analytical")
+        tables = extract_tables(sql)
+        if not tables or not tables <= set(self.replica.table_names()):
+            return Route("primary", sql, "not_replicated")
+        age = self.replica.age(tables)
+        if age is None or age > self.max_staleness_seconds:
+            return Route("primary", sql, "stale")
+        transpiled = transpile(sql, self.replica.dialect)
+        if transpiled is None:
+            return Route("primary", sql, "untranslatable")
+        return Route("replica", transpiled, "analytical")
+
+    def route(self, sql: str) -> Route:
+        route = self._route(sql)
+        self._count(f"{route.target}:{route.reason}")
+        return route
+
+    def record_fallback(self):
+        self._count("replica_errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+def create_replica(engine: Engine, source_engine: Optional[Engine], replica_config: dict) -> Replica:
+    replica = Replica(
+        engine,
+        source_engine,
+        replica_config['tables'],
+        batch_rows=replica_config['batch_rows'],
+        refresh_interval_seconds=replica_config['refresh_interval_seconds'],
+    )
+    # The first copy runs in the background; until it lands every query goes to the source
+    replica.maybe_refresh()
+    return replica
+
+
+def create_replica_engine(replica_config: dict, engine_config: dict) -> Engine:
+    database = make_url(replica_config['url']).database
+    if database and database != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+    return get_engine(replica_config['url'], engine_config)
+
+
+def create_query_router(replica: Replica, replica_config: dict) -> QueryRouter:
+    return QueryRouter(
+        replica,
+        mode=replica_config['route'],
+        max_staleness_seconds=replica_config['max_staleness_seconds'],
+        offline=replica_config['offline'],
+    )
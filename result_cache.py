@@ -0,0 +1,122 @@
+import time
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, Optional
+
+from sql_utils import normalize_sql, normalize_table_name, extract_tables
+
+
+class ResultCache:
+    """Caches query results by canonical SQL and tracks which tables each entry reads."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300,
+                 max_entry_bytes: int = 1_000_000, table_ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        self.table_ttls = {table.lower(): ttl for table, ttl in (table_ttls or {}).items()}
+        self._entries = OrderedDict()
+        self._tables = defaultdict(set)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "oversized": 0}
+
+    @staticmethod
+    def make_key(sql_query: str) -> str:
+        return normalize_sql(sql_query, preserve_literals=True)
+
+    def _ttl_for(self, tables: Iterable[str]) -> float:
+        return min([self.table_ttls.get(table, self.ttl_seconds) for table in tables] or [self.ttl_seconds])
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table in entry["tables"]:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tables[table]
+
+    def get(self, sql_query: str):
+        key = self.make_key(sql_query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry["expires_at"] < time.time():
+                self._remove(key)
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry["result"]
+
+    def set(self, sql_query: str, result, size: Optional[int] = None) -> bool:
+        if size is None:
+            size = len(str(result).encode('utf-8'))
+        if size > self.max_entry_bytes:
+            with self._lock:
+                self._stats["oversized"] += 1
+            return False
+
+        key = self.make_key(sql_query)
+        tables = frozenset(extract_tables(sql_query))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {
+                "result": result,
+                "tables": tables,
+                "size": size,
+                "expires_at": time.time() + self._ttl_for(tables),
+            }
+            for table in tables:
+                self._tables[table].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+        return True
+
+    def invalidate_tables(self, *tables: str) -> int:
+        with self._lock:
+            keys = set()
+            for table in tables:
+                keys |= self._tables.get(normalize_table_name(table), set())
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def invalidate_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry["expires_at"] < now]
+            for key in expired:
+                self._remove(key)
+            self._stats["invalidations"] += len(expired)
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tables.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["bytes"] = sum(entry["size"] for entry in self._entries.values())
+            stats["tables"] = {table: len(keys) for table, keys in self._tables.items()}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def create_result_cache(cache_config: dict) -> ResultCache:
+    return ResultCache(
+        max_entries=cache_config['max_entries'],
+        ttl_seconds=cache_config['ttl_seconds'],
+        max_entry_bytes=cache_config['max_entry_bytes'],
+        table_ttls=cache_config.get('table_ttls'),
+    )
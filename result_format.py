@@ -0,0 +1,138 @@
+import io
+import math
+import uuid
+import base64
+import datetime
+from decimal import Decimal
+from typing import Any, List, Optional
+
+from result_pages import page_metadata
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+ARROW_MIME_TYPE = 'application/vnd.apache.arrow.stream'
+RESPONSE_FORMATS = ('text', 'columnar', 'arrow')
+
+# Checked in order: bool before int, datetime before date
+VALUE_TYPES = [
+    (bool, "boolean"),
+    (int, "integer"),
+    (float, "float"),
+    (Decimal, "decimal"),
+    (str, "string"),
+    (datetime.datetime, "datetime"),
+    (datetime.date, "date"),
+    (datetime.time, "time"),
+    ((bytes, bytearray, memoryview), "binary"),
+    (uuid.UUID, "uuid"),
+]
+
+
+def value_type(value: Any) -> str:
+    for python_type, name in VALUE_TYPES:
+        if isinstance(value, python_type):
+            return name
+    return "string"
+
+
+def infer_column_types(columns: List[str], rows: List[tuple]) -> List[str]:
+    types = []
+    for index in range(len(columns)):
+        seen = {value_type(row[index]) for row in rows if row[index] is not None}
+        if not seen:
+            types.append("unknown")
+        elif len(seen) == 1:
+            types.append(seen.pop())
+        elif seen <= {"integer", "float", "decimal"}:
+            types.append("float" if "float" in seen else "decimal")
+        else:
+            types.append("string")
+    return types
+
+
+def encode_value(value: Any, column_type: str) -> Any:
+    # JSON has no decimal, date or binary types: decimals keep their exact digits as strings
+    if value is None:
+        return None
+    if column_type == "float":
+        value = float(value)
+        return value if math.isfinite(value) else None
+    if column_type in ("integer", "boolean"):
+        return value
+    if column_type in ("datetime", "date", "time"):
+        return value.isoformat()
+    if column_type == "binary":
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return str(value)
+
+
+def to_columnar(page: dict) -> dict:
+    types = infer_column_types(page["columns"], page["rows"])
+    columns = list(zip(*page["rows"])) if page["rows"] else [() for _ in page["columns"]]
+    return {
+        "sql": page.get("sql_query"),
+        "columns": [{"name": name, "type": column_type} for name, column_type in zip(page["columns"], types)],
+        "data": [
+            [encode_value(value, column_type) for value in values]
+            for values, column_type in zip(columns, types)
+        ],
+        "row_count": len(page["rows"]),
+    }
+
+
+def to_arrow_ipc(page: dict) -> bytes:
+    if pa is None:
+        raise RuntimeError("Arrow output requires the pyarrow package")
+
+    types = infer_column_types(page["columns"], page["rows"])
+    columns = list(zip(*page["rows"])) if page["rows"] else [() for _ in page["columns"]]
+    arrays = []
+    for values, column_type in zip(columns, types):
+        try:
+            arrays.append(pa.array(list(values)))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([encode_value(value, column_type) for value in values], type=pa.string()))
+
+    metadata = {
+        "sql": page.get("sql_query") or "",
+        "query_id": page["query_id"],
+        "page": str(page["page"]),
+        "next_token": page["next_token"] or "",
+        "truncated": str(page["truncated"]).lower(),
+    }
+    table = pa.Table.from_arrays(arrays, names=list(page["columns"]), metadata=metadata)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def format_error(response_format: str) -> Optional[str]:
+    return None if response_format in RESPONSE_FORMATS else f"Unknown format: {response_format}"
+
+
+def arrow_headers(page: dict) -> dict:
+    return {
+        'X-Query-Id': page['query_id'],
+        'X-Page': str(page['page']),
+        'X-Next-Token': page['next_token'] or ''
+    }
+
+
+def query_payload(answer: str, page: Optional[dict], logs: list, response_format: str = 'text') -> dict:
+    """The JSON body of a query or page response; arrow responses send to_arrow_ipc(page) instead."""
+    payload = {
+        'answer': answer,
+        'page': page_metadata(page),
+        'status': 'success',
+        'logs': logs
+    }
+    if response_format == 'columnar' and page is not None:
+        # The structured result replaces the text rendering of the rows
+        payload['result'] = to_columnar(page)
+        payload['answer'] = None
+    return payload
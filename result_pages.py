@@ -0,0 +1,278 @@
+import json
+import time
+import base64
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import text
+
+PAGE_SEPARATOR = "-" * 80
+
+
+class CursorLimitError(RuntimeError):
+    """Every result cursor slot is in use, so a page that has to be read from the database can't be served now."""
+
+
+def encode_page_token(query_id: str, page: int) -> str:
+    payload = json.dumps({"q": query_id, "p": page}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_page_token(token: str) -> tuple[str, int]:
+    payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    data = json.loads(payload)
+    return data["q"], int(data["p"])
+
+
+def page_metadata(page: Optional[dict]) -> Optional[dict]:
+    if page is None:
+        return None
+    return {key: value for key, value in page.items() if key != "rows"}
+
+
+def format_page(page: dict) -> str:
+    records = "\n\n".join(
+        "\n".join(f"{column}: {value}" for column, value in zip(page["columns"], row))
+        for row in page["rows"]
+    )
+    text_page = f"Results (Page {page['page']}):\n{PAGE_SEPARATOR}\n{records}\n{PAGE_SEPARATOR}"
+    if page.get("notice"):
+        text_page += f"\n{page['notice']}"
+    if page["truncated"]:
+        text_page += f"\nResults truncated at {page['row_limit']} rows."
+    elif page["has_more"]:
+        text_page += f"\nMore rows available (page {page['page'] + 1})."
+    return text_page
+
+
+class ResultCursor:
+    """A query whose rows are read from the database one page at a time."""
+
+    def __init__(self, engine, query_id: str, sql_query: str, page_size: int, max_rows: int, buffer_pages: int,
+                 notice: Optional[str] = None):
+        self.engine = engine
+        self.query_id = query_id
+        self.sql_query = sql_query
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.buffer_pages = buffer_pages
+        self.notice = notice
+        self.columns = []
+        self.pages = OrderedDict()
+        self.next_page = 1
+        self.exhausted = False
+        self.truncated = False
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+        self._connection = None
+        self._result = None
+        self._lookahead = []
+
+    @property
+    def is_open(self) -> bool:
+        return self._result is not None
+
+    def needs_connection(self, page: int) -> bool:
+        return not self.is_open and page not in self.pages and (page < self.next_page or not self.exhausted)
+
+    def _open(self, skip_rows: int = 0):
+        self.close()
+        self._connection = self.engine.connect()
+        try:
+            self._result = self._connection.execution_options(
+                stream_results=True, max_row_buffer=self.page_size
+            ).execute(text(self.sql_query))
+            self.columns = list(self._result.keys())
+            while skip_rows > 0:
+                skipped = self._result.fetchmany(min(skip_rows, self.page_size))
+                if not skipped:
+                    break
+                skip_rows -= len(skipped)
+        except Exception:
+            self.close()
+            raise
+        self.exhausted = False
+
+    def close(self):
+        self._lookahead = []
+        if self._result is not None:
+            self._result.close()
+            self._result = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _read_next_page(self):
+        rows_read = (self.next_page - 1) * self.page_size
+        if not self.is_open:
+            self._open(skip_rows=rows_read)
+
+        # Read one row past the page so the last page is known without an extra empty round trip
+        limit = min(self.page_size, self.max_rows - rows_read)
+        rows = self._lookahead + [tuple(row) for row in self._result.fetchmany(limit + 1 - len(self._lookahead))]
+        self._lookahead = rows[limit:]
+        rows = rows[:limit]
+        if not self._lookahead or rows_read + len(rows) >= self.max_rows:
+            self.truncated = bool(self._lookahead)
+            self.exhausted = True
+            # Release the connection as soon as nothing more will be read from it
+            self.close()
+
+        self.pages[self.next_page] = rows
+        while len(self.pages) > self.buffer_pages:
+            self.pages.popitem(last=False)
+        self.next_page += 1
+
+    def fetch_page(self, page: int) -> Optional[dict]:
+        with self.lock:
+            self.last_used = time.time()
+            if page not in self.pages and page < self.next_page:
+                # The page fell out of the buffer; re-read from the start of it
+                self.close()
+                self.next_page = page
+                self.exhausted = False
+            while page not in self.pages and not self.exhausted:
+                self._read_next_page()
+            if page not in self.pages:
+                return None
+            has_more = not self.exhausted or page + 1 < self.next_page
+            return {
+                "query_id": self.query_id,
+                "sql_query": self.sql_query,
+                "page": page,
+                "page_size": self.page_size,
+                "columns": self.columns,
+                "rows": self.pages[page],
+                "has_more": has_more,
+                "next_token": encode_page_token(self.query_id, page + 1) if has_more else None,
+                "truncated": self.truncated and not has_more,
+                "row_limit": self.max_rows,
+                "notice": self.notice,
+            }
+
+
+class ResultPager:
+    """Registry of paged query results, so later pages can be served without regenerating the SQL."""
+
+    def __init__(self, engine, page_size: int = 50, max_rows: int = 10000, buffer_pages: int = 4,
+                 max_open_cursors: int = 6, idle_seconds: float = 120, max_queries: int = 1000):
+        self.engine = engine
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.buffer_pages = buffer_pages
+        self.max_open_cursors = max_open_cursors
+        self.idle_seconds = idle_seconds
+        self.max_queries = max_queries
+        self._cursors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _open_cursors(self) -> list:
+        return [cursor for cursor in self._cursors.values() if cursor.is_open]
+
+    def _close_idle(self, keep_free: int = 0):
+        """Close idle cursors, then the least recently used, until `keep_free` more may hold a connection."""
+        now = time.time()
+        open_cursors = self._open_cursors()
+        for cursor in list(open_cursors):
+            if now - cursor.last_used > self.idle_seconds or len(open_cursors) > self.max_open_cursors - keep_free:
+                # A cursor being read right now keeps its connection until the read is done
+                if cursor.lock.acquire(blocking=False):
+                    try:
+                        cursor.close()
+                    finally:
+                        cursor.lock.release()
+                    open_cursors.remove(cursor)
+
+    def _release_excess(self, cursor: ResultCursor):
+        # Over the limit, the cursor gives its connection back; its next page is re-read from the start
+        with self._lock:
+            if (cursor.is_open and len(self._open_cursors()) > self.max_open_cursors
+                    and cursor.lock.acquire(blocking=False)):
+                try:
+                    cursor.close()
+                finally:
+                    cursor.lock.release()
+
+    def open(self, sql_query: str, max_rows: Optional[int] = None, notice: Optional[str] = None, engine=None) -> dict:
+        with self._lock:
+            # Make room before the new cursor takes a connection, not after
+            self._close_idle(keep_free=1)
+        # Later pages are read from the same engine as the first, e.g. the local replica
+        cursor = ResultCursor(
+            engine or self.engine, secrets.token_urlsafe(12), sql_query,
+            self.page_size, min(max_rows or self.max_rows, self.max_rows), self.buffer_pages, notice
+        )
+        page = cursor.fetch_page(1)
+        self._register(cursor)
+        self._release_excess(cursor)
+        return page
+
+    def register_page(self, first_page: dict, engine=None) -> dict:
+        """A new query id and page token for a first page read earlier, e.g. from the result cache.
+
+        Nothing is read now; later pages are read from the database, from the start, when asked for.
+        """
+        cursor = ResultCursor(
+            engine or self.engine, secrets.token_urlsafe(12), first_page["sql_query"],
+            self.page_size, first_page["row_limit"], self.buffer_pages, first_page["notice"]
+        )
+        cursor.columns = list(first_page["columns"])
+        cursor.pages[1] = first_page["rows"]
+        cursor.next_page = 2
+        cursor.exhausted = not first_page["has_more"]
+        cursor.truncated = first_page["truncated"]
+        self._register(cursor)
+        return cursor.fetch_page(1)
+
+    def _register(self, cursor: ResultCursor):
+        with self._lock:
+            self._cursors[cursor.query_id] = cursor
+            while len(self._cursors) > self.max_queries:
+                _, evicted = self._cursors.popitem(last=False)
+                evicted.close()
+
+    def fetch_page(self, query_id: str, page: int) -> Optional[dict]:
+        with self._lock:
+            cursor = self._cursors.get(query_id)
+            if cursor is None:
+                return None
+            self._cursors.move_to_end(query_id)
+            needs_connection = cursor.needs_connection(page)
+            self._close_idle(keep_free=1 if needs_connection else 0)
+            if needs_connection and len(self._open_cursors()) >= self.max_open_cursors:
+                raise CursorLimitError("Too many result pages are being read; try this page again shortly")
+        result = cursor.fetch_page(page)
+        self._release_excess(cursor)
+        return result
+
+    def get_sql(self, query_id: str) -> Optional[str]:
+        cursor = self._cursors.get(query_id)
+        return cursor.sql_query if cursor is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queries": len(self._cursors),
+                "open_cursors": sum(1 for cursor in self._cursors.values() if cursor.is_open),
+            }
+
+
+def create_result_pager(engine, pagination_config: dict, engine_config: dict) -> ResultPager:
+    # Open cursors hold pooled connections; at least half the pool stays free for ordinary queries
+    max_open_cursors = pagination_config['max_open_cursors']
+    pool_capacity = engine_config['pool_size'] + engine_config['max_overflow']
+    if max_open_cursors > pool_capacity // 2:
+        print(f"max_open_cursors={max_open_cursors} leaves too few of the pool's {pool_capacity} connections "
+              f"for other queries; using {pool_capacity // 2}")
+        max_open_cursors = pool_capacity // 2
+    return ResultPager(
+        engine,
+        page_size=pagination_config['page_size'],
+        max_rows=pagination_config['max_rows'],
+        buffer_pages=pagination_config['buffer_pages'],
+        max_open_cursors=max_open_cursors,
+        idle_seconds=pagination_config['idle_seconds'],
+        max_queries=pagination_config['max_queries'],
+    )
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+
+class Runtime:
+    """Named components built on first use, once per process, with warm-up hooks and a report of what is built.
+
+    Components registered as process-bound (thread pools, locks, open cursors) are dropped in a forked child,
+    so a pre-forking server can warm up in the parent and each worker rebuilds only those.
+    """
+
+    def __init__(self):
+        self._builders: Dict[str, Callable] = {}
+        self._process_bound = set()
+        self._components = {}
+        self._timings = {}
+        self._errors = {}
+        self._building = set()
+        self._locks = {}
+        self._pid = os.getpid()
+        self.started_at = time.time()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def component(self, name: str, process_bound: bool = False):
+        """Decorator registering the function that builds `name`."""
+        def register(builder: Callable) -> Callable:
+            self._builders[name] = builder
+            self._locks[name] = threading.Lock()
+            if process_bound:
+                self._process_bound.add(name)
+            return builder
+        return register
+
+    def has(self, name: str) -> bool:
+        return name in self._builders
+
+    def get(self, name: str):
+        try:
+            return self._components[name]
+        except KeyError:
+            pass
+        if name not in self._builders:
+            raise AttributeError(f"Unknown component: {name}")
+        with self._locks[name]:
+            if name in self._components:
+                return self._components[name]
+            self._building.add(name)
+            started = time.perf_counter()
+            try:
+                component = self._builders[name]()
+            except Exception as e:
+                # Not cached: the next use tries again, e.g. once the database is reachable
+                self._errors[name] = str(e)
+                raise
+            finally:
+                self._building.discard(name)
+            self._timings[name] = time.perf_counter() - started
+            self._errors.pop(name, None)
+            self._components[name] = component
+            return component
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def warm_up(self, names: Iterable[str]) -> bool:
+        ok = True
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                ok = False
+                print(f"Error warming up {name}: {e}")
+        return ok
+
+    def warm_up_in_background(self, names: Iterable[str]) -> threading.Thread:
+        thread = threading.Thread(target=self.warm_up, args=(list(names),), name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def is_warm(self, names: Iterable[str]) -> bool:
+        return all(name in self._components for name in names)
+
+    def state(self, name: str) -> str:
+        if name in self._components:
+            return "warm"
+        if name in self._building:
+            return "warming"
+        if name in self._errors:
+            return "failed"
+        return "cold"
+
+    def status(self, import_seconds: Optional[float] = None) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": time.time() - self.started_at,
+            "import_seconds": import_seconds,
+            "components": {
+                name: {
+                    "state": self.state(name),
+                    "build_seconds": self._timings.get(name),
+                    "error": self._errors.get(name),
+                }
+                for name in self._builders
+            },
+        }
+
+    def _after_fork(self):
+        # Another thread may have held a lock or been half-way through a build when the process forked
+        self._locks = {name: threading.Lock() for name in self._builders}
+        self._building = set()
+        for name in self._process_bound:
+            self._components.pop(name, None)
+            self._timings.pop(name, None)
+        self._pid = os.getpid()
@@ -0,0 +1,251 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import MetaData, Table, select, text
+
+from sql_utils import schema_hash
+
+TABLE_HEADER_PATTERN = re.compile(r'^\s*\d+\.\s+(.+?)\s*$')
+COLUMN_LINE_PATTERN = re.compile(r'^\s*-\s+(\w+)\s+\((.+)\)\s*$')
+
+
+def parse_schema_info(schema_info: str) -> Dict[str, dict]:
+    tables = {}
+    current = None
+    for line in schema_info.splitlines():
+        header = TABLE_HEADER_PATTERN.match(line)
+        if header:
+            current = {"columns": [], "foreign_keys": [], "sample_rows": [], "modify_date": None}
+            tables[header.group(1)] = current
+            continue
+        column = COLUMN_LINE_PATTERN.match(line)
+        if column and current is not None:
+            parts = [part.strip() for part in column.group(2).split(',')]
+            default = next((part.split(':', 1)[1].strip() for part in parts if part.startswith('default:')), None)
+            current["columns"].append({
+                "name": column.group(1),
+                "type": parts[0],
+                "nullable": "NOT NULL" not in parts,
+                "default": default,
+            })
+    return tables
+
+
+def render_table(name: str, table: dict, include_samples: bool = True) -> str:
+    lines = [name]
+    for column in table["columns"]:
+        details = [column["type"], "NULL" if column["nullable"] else "NOT NULL"]
+        if column.get("default") is not None:
+            details.append(f"default: {column['default']}")
+        lines.append(f"- {column['name']} ({', '.join(details)})")
+    for fk in table.get("foreign_keys", []):
+        lines.append(
+            f"- FOREIGN KEY ({', '.join(fk['columns'])}) REFERENCES "
+            f"{fk['referred_table']} ({', '.join(fk['referred_columns'])})"
+        )
+    if include_samples and table.get("sample_rows"):
+        lines.append("/*")
+        lines.append(f"{len(table['sample_rows'])} rows from {name} table:")
+        lines.append("\t".join(column["name"] for column in table["columns"]))
+        lines.extend("\t".join(str(value) for value in row) for row in table["sample_rows"])
+        lines.append("*/")
+    return "\n".join(lines)
+
+
+class SchemaCatalog:
+    """Rendered schema kept in memory and on disk, refreshed per table when the database changes."""
+
+    def __init__(self, db=None, snapshot_path: Optional[str] = None,
+                 poll_interval_seconds: float = 300, sample_rows: int = 3):
+        self.db = db
+        self.snapshot_path = snapshot_path
+        self.poll_interval_seconds = poll_interval_seconds
+        self.sample_rows = sample_rows
+        self.tables: Dict[str, dict] = {}
+        self.source = None
+        self.last_checked = 0.0
+        self._rendered = None
+        self._version = None
+        self._lock = threading.RLock()
+        # Held for a whole refresh; _lock is only held to read or swap in the tables
+        self._refresh_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A refresh running in the parent isn't running in the child
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+    def _invalidate_rendering(self):
+        self._rendered = None
+        self._version = None
+
+    @property
+    def version(self) -> str:
+        with self._lock:
+            if self._version is None:
+                self._version = schema_hash(self.render(include_samples=False))
+            return self._version
+
+    def render(self, tables: Optional[List[str]] = None, include_samples: bool = True) -> str:
+        with self._lock:
+            if tables is None and include_samples and self._rendered is not None:
+                return self._rendered
+            names = [name for name in self.tables if tables is None or name in tables]
+            rendered = "\n\n".join(
+                f"{index}. {render_table(name, self.tables[name], include_samples)}"
+                for index, name in enumerate(names, start=1)
+            )
+            if tables is None and include_samples:
+                self._rendered = rendered
+            return rendered
+
+    def seed(self, schema_info: str):
+        with self._lock:
+            self.tables = parse_schema_info(schema_info)
+            self.source = "seed"
+            self.last_checked = time.time()
+            self._invalidate_rendering()
+
+    def load_snapshot(self) -> bool:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+        except Exception as e:
+            print(f"Error reading schema snapshot: {e}")
+            return False
+        with self._lock:
+            self.tables = snapshot["tables"]
+            self.source = "snapshot"
+            self.last_checked = time.time()
+            self._invalidate_rendering()
+        return True
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            snapshot = {"version": self.version, "saved_at": time.time(), "tables": self.tables}
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, indent=2, default=str)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"Error writing schema snapshot: {e}")
+
+    def _introspect_table(self, name: str, modify_date: Optional[str]) -> dict:
+        engine = self.db._engine
+        table = Table(name, MetaData(), autoload_with=engine, schema=self.db._schema)
+        sample_rows = []
+        if self.sample_rows:
+            with engine.connect() as conn:
+                sample_rows = [list(row) for row in conn.execute(select(table).limit(self.sample_rows))]
+        return {
+            "columns": [
+                {
+                    "name": column.name,
+                    "type": str(column.type).split('(')[0].lower(),
+                    "nullable": bool(column.nullable),
+                    "default": str(column.server_default.arg) if column.server_default is not None else None,
+                }
+                for column in table.columns
+            ],
+            "foreign_keys": [
+                {
+                    "columns": [element.parent.name for element in fk.elements],
+                    "referred_table": fk.referred_table.name,
+                    "referred_columns": [element.column.name for element in fk.elements],
+                }
+                for fk in table.foreign_key_constraints
+            ],
+            "sample_rows": sample_rows,
+            "modify_date": modify_date,
+        }
+
+    def fetch_modify_dates(self) -> Optional[Dict[str, str]]:
+        engine = self.db._engine
+        dialect = engine.dialect.name
+        with engine.connect() as conn:
+            if dialect == 'mssql':
+                rows = conn.execute(text("SELECT name, modify_date FROM sys.objects WHERE type = 'U'"))
+                return {name: str(modify_date) for name, modify_date in rows}
+            if dialect == 'sqlite':
+                # SQLite has no modification timestamps; the stored DDL changes whenever a table is altered
+                rows = conn.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'table'"))
+                return {name: hashlib.sha256((sql or '').encode('utf-8')).hexdigest()[:16] for name, sql in rows}
+        return None
+
+    def _refresh(self, force: bool) -> List[str]:
+        # Introspection runs without _lock, so a slow database doesn't stall version() and render()
+        usable = set(self.db.get_usable_table_names())
+        modify_dates = self.fetch_modify_dates()
+        if modify_dates is None:
+            modify_dates = {}
+            force = True
+
+        with self._lock:
+            known = {name: table.get("modify_date") for name, table in self.tables.items()}
+        changed = [
+            name for name in sorted(usable)
+            if force or name not in known or known[name] != modify_dates.get(name)
+        ]
+        removed = [name for name in known if name not in usable]
+        introspected = {name: self._introspect_table(name, modify_dates.get(name)) for name in changed}
+
+        with self._lock:
+            self.last_checked = time.time()
+            if changed or removed:
+                tables = {name: table for name, table in self.tables.items() if name not in removed}
+                tables.update(introspected)
+                self.tables = dict(sorted(tables.items()))
+                self.source = "database"
+                self._invalidate_rendering()
+        if changed or removed:
+            self.save_snapshot()
+        return changed + removed
+
+    def refresh(self, force: bool = False) -> List[str]:
+        if self.db is None:
+            return []
+        with self._refresh_lock:
+            return self._refresh(force)
+
+    def maybe_refresh(self) -> List[str]:
+        if self.db is None or time.time() - self.last_checked < self.poll_interval_seconds:
+            return []
+        if not self._refresh_lock.acquire(blocking=False):
+            # Another request is already polling; keep serving the current schema
+            return []
+        try:
+            return self._refresh(force=False)
+        except Exception as e:
+            # Keep serving the last known schema if the poll fails
+            print(f"Error refreshing schema catalog: {e}")
+            self.last_checked = time.time()
+            return []
+        finally:
+            self._refresh_lock.release()
+
+
+def create_schema_catalog(db, catalog_config: dict, schema_info: Optional[str] = None) -> SchemaCatalog:
+    catalog = SchemaCatalog(
+        db,
+        snapshot_path=catalog_config.get('snapshot_path'),
+        poll_interval_seconds=catalog_config['poll_interval_seconds'],
+        sample_rows=catalog_config['sample_rows'],
+    )
+    if catalog.load_snapshot():
+        return catalog
+    if catalog_config.get('seed_from_config') and schema_info:
+        catalog.seed(schema_info)
+        return catalog
+    catalog.refresh(force=True)
+    return catalog
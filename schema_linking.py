@@ -0,0 +1,115 @@
+import re
+import math
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+FIELD_WEIGHTS = {"table": 3, "column": 2, "description": 1, "value": 1}
+
+
+def estimate_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def stem(word: str) -> str:
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    # Splits identifiers as well as prose: "OrderDate" -> order, date; "Order Details" -> order, detail
+    text = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', str(text))
+    text = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1 \2', text)
+    return [stem(word) for word in re.findall(r'[a-z0-9]+', text.lower()) if len(word) > 1]
+
+
+def foreign_key_graph(tables: Dict[str, dict]) -> Dict[str, Set[str]]:
+    graph = defaultdict(set)
+    key_columns = {
+        table["columns"][0]["name"].lower(): name
+        for name, table in tables.items() if table["columns"]
+    }
+    for name, table in tables.items():
+        for fk in table.get("foreign_keys", []):
+            if fk["referred_table"] in tables and fk["referred_table"] != name:
+                graph[name].add(fk["referred_table"])
+                graph[fk["referred_table"]].add(name)
+        # Seeded schemas carry no constraints, so fall back to the Northwind naming convention
+        for column in table["columns"]:
+            referred = key_columns.get(column["name"].lower())
+            if referred and referred != name and column["name"].lower().endswith('id'):
+                graph[name].add(referred)
+                graph[referred].add(name)
+    return graph
+
+
+class SchemaLinker:
+    """TF-IDF index over table names, columns, descriptions and sampled values."""
+
+    def __init__(self, tables: Dict[str, dict], descriptions: Optional[Dict[str, str]] = None):
+        self.tables = list(tables)
+        self.neighbors = foreign_key_graph(tables)
+        descriptions = descriptions or {}
+
+        documents = {}
+        for name, table in tables.items():
+            terms = Counter()
+            for token in tokenize(name):
+                terms[token] += FIELD_WEIGHTS["table"]
+            for column in table["columns"]:
+                for token in tokenize(column["name"]):
+                    terms[token] += FIELD_WEIGHTS["column"]
+            for token in tokenize(descriptions.get(name, "")):
+                terms[token] += FIELD_WEIGHTS["description"]
+            for row in table.get("sample_rows", []):
+                for value in row:
+                    if isinstance(value, str):
+                        for token in tokenize(value):
+                            terms[token] += FIELD_WEIGHTS["value"]
+            documents[name] = terms
+
+        document_frequency = Counter(term for terms in documents.values() for term in terms)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + count)) + 1 for term, count in document_frequency.items()}
+        self.vectors = {}
+        for name, terms in documents.items():
+            vector = {term: (1 + math.log(count)) * self.idf[term] for term, count in terms.items()}
+            norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+            self.vectors[name] = {term: weight / norm for term, weight in vector.items()}
+
+    def score(self, question: str) -> List[Tuple[str, float]]:
+        terms = Counter(token for token in tokenize(question) if token in self.idf)
+        if not terms:
+            return []
+        query = {term: (1 + math.log(count)) * self.idf[term] for term, count in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in query.values())) or 1.0
+        scores = [
+            (name, sum(weight / norm * vector.get(term, 0.0) for term, weight in query.items()))
+            for name, vector in self.vectors.items()
+        ]
+        return sorted([item for item in scores if item[1] > 0], key=lambda item: item[1], reverse=True)
+
+    def link(self, question: str, max_tables: int = 3, min_score_ratio: float = 0.35,
+             include_neighbors: bool = True) -> List[str]:
+        scores = self.score(question)
+        if not scores:
+            return list(self.tables)
+
+        best = scores[0][1]
+        selected = [name for name, score in scores[:max_tables] if score >= best * min_score_ratio]
+        if include_neighbors:
+            # Neighbors of the best match, plus any table that bridges two selected tables in a join
+            linked = set(selected) | self.neighbors.get(selected[0], set())
+            linked |= {name for name in self.tables if len(self.neighbors.get(name, set()) & set(selected)) >= 2}
+            selected = list(linked)
+        return [name for name in self.tables if name in selected]
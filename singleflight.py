@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Tuple
+
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"executions": 0, "coalesced": 0}
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                return call, False
+            call = Future()
+            self._calls[key] = call
+            self._stats["executions"] += 1
+            return call, True
+
+    def _finish(self, key: Hashable):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        call, leader = self._join(key)
+        if not leader:
+            return call.result(), True
+        try:
+            result = func(*args, **kwargs)
+            call.set_result(result)
+            return result, False
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+
+    async def ado(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        # The shared Future is thread-safe, so async callers also coalesce with threads running do()
+        call, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(call), True
+        try:
+            result = await func(*args, **kwargs)
+            call.set_result(result)
+            return result, False
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
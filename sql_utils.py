@@ -0,0 +1,45 @@
+import re
+import hashlib
+from functools import lru_cache
+from typing import Set
+
+from sql_lexer import canonical_tokens, render
+
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_NAME_PART = r'(?:\[[^\]]+\]|"[^"]+"|\w+)'
+TABLE_NAME_PATTERN = re.compile(rf'{_NAME_PART}(?:\.{_NAME_PART})*')
+TABLE_REFERENCE_PATTERN = re.compile(
+    rf'\b(?:from|join)\s+({TABLE_NAME_PATTERN.pattern}(?:\s+(?:as\s+)?\w+)?'
+    rf'(?:\s*,\s*{TABLE_NAME_PATTERN.pattern}(?:\s+(?:as\s+)?\w+)?)*)',
+    flags=re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=16384)
+def normalize_sql(sql: str, preserve_literals: bool = False) -> str:
+    """Lower-cased SQL without comments, in one spacing: `SELECT [Name]  FROM Orders -- x` -> `select name from orders`."""
+    return render(canonical_tokens(sql, fold_literals=not preserve_literals))
+
+
+def schema_hash(schema: str) -> str:
+    # Sample rows are rendered inside /* ... */ blocks and change with the data, not the schema
+    schema = re.sub(r'/\*.*?\*/', '', schema, flags=re.DOTALL)
+    schema = re.sub(r'\s+', ' ', schema).strip()
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_table_name(name: str) -> str:
+    # Drops database/schema prefixes and quoting: [dbo].[Order Details] -> order details
+    parts = re.findall(_NAME_PART, name.strip())
+    return parts[-1].strip('[]"').lower() if parts else name.strip().lower()
+
+
+def extract_tables(sql: str) -> Set[str]:
+    sql = STRING_LITERAL_PATTERN.sub("''", sql)
+    tables = set()
+    for match in TABLE_REFERENCE_PATTERN.finditer(sql):
+        for item in match.group(1).split(','):
+            reference = TABLE_NAME_PATTERN.match(item.strip())
+            if reference:
+                tables.add(normalize_table_name(reference.group(0)))
+    return tables
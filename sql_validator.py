@@ -0,0 +1,411 @@
+import difflib
+from typing import Dict, List, NamedTuple, Optional
+
+from sql_lexer import scan
+
+KEYWORDS = {
+    "ALL", "AND", "ANY", "APPLY", "AS", "ASC", "BETWEEN", "BY", "CASE", "CAST", "COLLATE", "CROSS",
+    "CURRENT", "CURRENT_DATE", "CURRENT_TIMESTAMP", "DESC", "DISTINCT", "ELSE", "END", "ESCAPE", "EXCEPT",
+    "EXISTS", "FETCH", "FIRST", "FOLLOWING", "FOR", "FROM", "FULL", "GROUP", "HAVING", "IN", "INNER",
+    "INTERSECT", "IS", "JOIN", "LEFT", "LIKE", "NEXT", "NOLOCK", "NOT", "NULL", "OFFSET", "ON", "ONLY", "OR",
+    "ORDER", "OUTER", "OVER", "PARTITION", "PERCENT", "PRECEDING", "RANGE", "RIGHT", "ROW", "ROWS", "SELECT",
+    "SOME", "THEN", "TIES", "TOP", "UNBOUNDED", "UNION", "WHEN", "WHERE", "WITH", "WITHIN",
+}
+# Statements and clauses that write, run code or reach outside the database
+WRITE_KEYWORDS = {
+    "ALTER", "BACKUP", "BULK", "CREATE", "DBCC", "DECLARE", "DELETE", "DENY", "DROP", "EXEC", "EXECUTE",
+    "GRANT", "INSERT", "INTO", "KILL", "MERGE", "OPENDATASOURCE", "OPENQUERY", "OPENROWSET", "RESTORE",
+    "REVOKE", "SET", "SHUTDOWN", "TRUNCATE", "UPDATE", "USE", "WAITFOR",
+}
+KEYWORDS |= WRITE_KEYWORDS
+# Functions whose first argument is a date part or type name rather than a column
+NON_COLUMN_FIRST_ARGUMENT = {"DATEADD", "DATEDIFF", "DATEDIFF_BIG", "DATENAME", "DATEPART", "DATETRUNC",
+                             "CONVERT", "TRY_CONVERT"}
+SYSTEM_SCHEMAS = {"sys", "information_schema"}
+FROM_KEYWORDS = {"FROM", "JOIN", "APPLY"}
+CLAUSE_KEYWORDS = {"SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "ON"}
+
+
+class Token(NamedTuple):
+    kind: str  # keyword, ident, string, number, variable, op or other
+    value: str  # keywords upper-cased, identifiers without their quoting
+    pos: int
+
+
+def tokenize(sql: str) -> List[Token]:
+    tokens = []
+    for kind, text, pos in scan(sql):
+        if kind in ("space", "line_comment", "block_comment"):
+            continue
+        if kind == "word":
+            upper = text.upper()
+            tokens.append(Token("keyword", upper, pos) if upper in KEYWORDS else Token("ident", text, pos))
+        elif kind == "bracket":
+            tokens.append(Token("ident", text[1:-1].replace("]]", "]"), pos))
+        elif kind == "quoted":
+            tokens.append(Token("ident", text[1:-1].replace('""', '"'), pos))
+        else:
+            tokens.append(Token(kind, text, pos))
+    return tokens
+
+
+class Scope:
+    """Tables and aliases visible to one SELECT; `sources` maps a name to its table, or None if its columns are unknown."""
+
+    def __init__(self, parent: Optional["Scope"], depth: int):
+        self.parent = parent
+        self.depth = depth
+        self.sources: Dict[str, Optional[str]] = {}
+        self.labels: Dict[str, str] = {}
+        self.clause = None
+
+    def add(self, name: str, table: Optional[str]):
+        self.sources[name.lower()] = table
+        self.labels[name.lower()] = name
+
+    def chain(self):
+        scope = self
+        while scope is not None:
+            yield scope
+            scope = scope.parent
+
+
+class SqlValidator:
+    """Checks generated SQL against the schema catalog without a database round trip."""
+
+    def __init__(self, tables: Dict[str, dict]):
+        self.tables = {name.lower(): name for name in tables}
+        self.columns = {
+            name: {column["name"].lower(): column["name"] for column in table["columns"]}
+            for name, table in tables.items()
+        }
+
+    def validate(self, sql: str) -> List[str]:
+        """Returns a list of problems; an empty list means the query may be sent to the database."""
+        tokens = tokenize(sql)
+        if not tokens:
+            return ["The query is empty."]
+
+        diagnostics = self._check_statement(tokens)
+        if diagnostics:
+            return diagnostics
+        return _Resolver(self, tokens).run()
+
+    def _check_statement(self, tokens: List[Token]) -> List[str]:
+        diagnostics = []
+        for token in tokens:
+            if token.kind == "other" and token.value in "'[\"":
+                diagnostics.append(f"Unterminated {'string literal' if token.value == chr(39) else 'quoted name'} "
+                                   f"at position {token.pos}.")
+                return diagnostics
+
+        while tokens and tokens[-1].value == ";":
+            tokens.pop()
+        if any(token.value == ";" for token in tokens):
+            diagnostics.append("Only a single statement is allowed; remove everything after the first ';'.")
+
+        writes = {token.value for token in tokens if token.kind == "keyword" and token.value in WRITE_KEYWORDS}
+        if tokens[0].value not in ("SELECT", "WITH"):
+            diagnostics.append(f"Only read-only SELECT queries are allowed; the query starts with {tokens[0].value}.")
+            writes.discard(tokens[0].value)
+        if writes:
+            diagnostics.append(f"Only read-only SELECT queries are allowed; found {', '.join(sorted(writes))}.")
+
+        depth = 0
+        for token in tokens:
+            depth += token.value == "("
+            depth -= token.value == ")"
+            if depth < 0:
+                diagnostics.append(f"Unbalanced parentheses: unexpected ')' at position {token.pos}.")
+                break
+        if depth > 0:
+            diagnostics.append("Unbalanced parentheses: a '(' is never closed.")
+        return diagnostics
+
+    def lookup_table(self, parts: List[str]) -> Optional[str]:
+        return self.tables.get(parts[-1].lower())
+
+    def suggest(self, name: str, candidates) -> str:
+        matches = difflib.get_close_matches(name.lower(), [candidate.lower() for candidate in candidates], n=1)
+        if not matches:
+            return ""
+        original = next(candidate for candidate in candidates if candidate.lower() == matches[0])
+        return f" Did you mean '{original}'?"
+
+
+class _Resolver:
+    def __init__(self, validator: SqlValidator, tokens: List[Token]):
+        self.validator = validator
+        self.tokens = tokens
+        self.root = Scope(None, -1)
+        self.scope_of: List[Optional[Scope]] = [None] * len(tokens)
+        self.clause_of: List[Optional[str]] = [None] * len(tokens)
+        self.skip = set()
+        self.ctes = set()
+        self.aliases = set()
+        self.diagnostics = []
+
+    def value(self, index: int) -> Optional[str]:
+        return self.tokens[index].value if 0 <= index < len(self.tokens) else None
+
+    def kind(self, index: int) -> Optional[str]:
+        return self.tokens[index].kind if 0 <= index < len(self.tokens) else None
+
+    def matching_paren(self, index: int) -> int:
+        depth = 0
+        for position in range(index, len(self.tokens)):
+            depth += self.tokens[position].value == "("
+            depth -= self.tokens[position].value == ")"
+            if depth == 0:
+                return position
+        return len(self.tokens) - 1
+
+    def report(self, message: str):
+        if message not in self.diagnostics:
+            self.diagnostics.append(message)
+
+    def run(self) -> List[str]:
+        self.read_ctes()
+        self.build_scopes()
+        self.check_references()
+        return self.diagnostics
+
+    def read_ctes(self):
+        if self.value(0) != "WITH":
+            return
+        index = 1
+        while self.kind(index) == "ident":
+            self.ctes.add(self.value(index).lower())
+            self.root.add(self.value(index), None)
+            self.skip.add(index)
+            index += 1
+            if self.value(index) == "(":
+                closing = self.matching_paren(index)
+                self.skip.update(range(index, closing + 1))
+                index = closing + 1
+            if self.value(index) != "AS" or self.value(index + 1) != "(":
+                return
+            index = self.matching_paren(index + 1) + 1
+            if self.value(index) != ",":
+                return
+            index += 1
+
+    def read_name(self, index: int) -> tuple[List[str], int]:
+        parts = [self.value(index)]
+        index += 1
+        while self.value(index) == "." and self.kind(index + 1) == "ident":
+            parts.append(self.value(index + 1))
+            index += 2
+        return parts, index
+
+    def read_alias(self, index: int, scope: Scope, table: Optional[str]) -> tuple[Optional[str], int]:
+        if self.value(index) == "AS":
+            index += 1
+        if self.kind(index) != "ident":
+            return None, index
+        alias = self.value(index)
+        scope.add(alias, table)
+        self.skip.add(index)
+        index += 1
+        if self.value(index) == "(":
+            # Column aliases of a derived table: d(a, b)
+            closing = self.matching_paren(index)
+            self.skip.update(range(index, closing + 1))
+            index = closing + 1
+        return alias, index
+
+    def table_reference(self, index: int, scope: Scope, from_starts: set) -> int:
+        start = index
+        if self.kind(index) != "ident":
+            return index
+        parts, index = self.read_name(index)
+        self.skip.update(range(start, index))
+
+        if self.value(index) == "(":
+            # Table-valued function; its arguments are checked like any other expression
+            from_starts.discard(index)
+            return index
+
+        name = parts[-1]
+        if len(parts) > 1 and parts[-2].lower() in SYSTEM_SCHEMAS:
+            table = None
+        elif name.lower() in self.ctes:
+            table = None
+        else:
+            table = self.validator.lookup_table(parts)
+            if table is None:
+                self.report(f"Unknown table '{'.'.join(parts)}'."
+                            f"{self.validator.suggest(name, self.validator.columns)}"
+                            f" Available tables: {', '.join(self.validator.columns)}.")
+
+        alias, index = self.read_alias(index, scope, table)
+        if alias is None:
+            scope.add(name, table)
+        if self.value(index) == "WITH" and self.value(index + 1) == "(":
+            closing = self.matching_paren(index + 1)
+            self.skip.update(range(index, closing + 1))
+            index = closing + 1
+        for position in range(start, index):
+            self.scope_of[position] = scope
+        if self.value(index) == "," and scope.clause == "FROM":
+            from_starts.add(index + 1)
+        return index
+
+    def build_scopes(self):
+        stack = [self.root]
+        derived = {}
+        from_starts = set()
+        depth = 0
+        index = 0
+        while index < len(self.tokens):
+            token = self.tokens[index]
+            scope = stack[-1]
+            if index in from_starts and token.value != "(":
+                next_index = self.table_reference(index, scope, from_starts)
+                if next_index > index:
+                    index = next_index
+                    continue
+
+            self.scope_of[index] = scope
+            if token.value == "(":
+                depth += 1
+                if index in from_starts:
+                    if self.value(index + 1) in ("SELECT", "WITH"):
+                        derived[depth] = scope
+                    else:
+                        from_starts.add(index + 1)
+            elif token.value == ")":
+                while len(stack) > 1 and stack[-1].depth == depth:
+                    stack.pop()
+                outer = derived.pop(depth, None)
+                depth -= 1
+                if outer is not None:
+                    _, index = self.read_alias(index + 1, outer, None)
+                    if self.value(index) == "," and outer.clause == "FROM":
+                        from_starts.add(index + 1)
+                    continue
+            elif token.kind == "keyword":
+                if token.value == "SELECT":
+                    if len(stack) > 1 and stack[-1].depth == depth:
+                        # UNION / EXCEPT / INTERSECT: a sibling query replaces the previous one
+                        stack.pop()
+                    stack.append(Scope(stack[-1], depth))
+                    self.scope_of[index] = stack[-1]
+                    stack[-1].clause = "SELECT"
+                elif token.value in CLAUSE_KEYWORDS and scope.depth == depth:
+                    scope.clause = "FROM" if token.value == "ON" else token.value
+                if token.value in FROM_KEYWORDS:
+                    if scope.depth == depth:
+                        scope.clause = "FROM"
+                    from_starts.add(index + 1)
+            self.clause_of[index] = self.scope_of[index].clause
+            index += 1
+
+    def is_expression_end(self, index: int) -> bool:
+        token = self.tokens[index] if index >= 0 else None
+        if token is None:
+            return False
+        if token.kind in ("ident", "string", "variable") or token.value in ("END", "NULL"):
+            return True
+        if token.kind == "number":
+            # TOP 5 ProductName: the number belongs to TOP
+            return self.value(index - 1) != "TOP"
+        if token.value == ")":
+            opening = self.opening_paren(index)
+            return self.value(opening - 1) != "TOP"
+        return False
+
+    def opening_paren(self, index: int) -> int:
+        depth = 0
+        for position in range(index, -1, -1):
+            depth += self.tokens[position].value == ")"
+            depth -= self.tokens[position].value == "("
+            if depth == 0:
+                return position
+        return 0
+
+    def is_alias_definition(self, index: int) -> bool:
+        previous = self.value(index - 1)
+        if previous == "AS":
+            return True
+        if self.is_expression_end(index - 1) and self.value(index - 2) != ".":
+            return True
+        # T-SQL `SELECT Total = COUNT(*)`
+        return (self.value(index + 1) == "=" and self.clause_of[index] == "SELECT"
+                and (previous in (",", "SELECT", "DISTINCT") or self.kind(index - 1) == "number"))
+
+    def is_non_column_argument(self, index: int) -> bool:
+        return self.value(index - 1) == "(" and str(self.value(index - 2)).upper() in NON_COLUMN_FIRST_ARGUMENT
+
+    def check_references(self):
+        references = []
+        index = 0
+        while index < len(self.tokens):
+            if self.kind(index) != "ident" or index in self.skip or self.value(index - 1) == ".":
+                index += 1
+                continue
+            parts, end = self.read_name(index)
+            if self.value(end) == "." and self.value(end + 1) == "*":
+                parts.append("*")
+                end += 2
+            if self.value(end) == "(" or self.is_non_column_argument(index):
+                pass
+            elif len(parts) == 1 and self.is_alias_definition(index):
+                self.aliases.add(parts[0].lower())
+            else:
+                references.append((index, parts))
+            index = end
+
+        for index, parts in references:
+            scope = self.scope_of[index] or self.root
+            if len(parts) == 1:
+                self.check_column(scope, parts[0])
+            else:
+                self.check_qualified(scope, parts[-2], parts[-1], parts)
+
+    def resolve_source(self, scope: Scope, name: str):
+        for candidate in scope.chain():
+            if name.lower() in candidate.sources:
+                return True, candidate.sources[name.lower()]
+        return False, None
+
+    def check_qualified(self, scope: Scope, qualifier: str, column: str, parts: List[str]):
+        if qualifier.lower() in SYSTEM_SCHEMAS:
+            return
+        found, table = self.resolve_source(scope, qualifier)
+        if not found:
+            visible = sorted({label for candidate in scope.chain() for label in candidate.labels.values()})
+            self.report(f"Unknown table or alias '{qualifier}' in '{'.'.join(parts)}'."
+                        f"{self.validator.suggest(qualifier, visible)}"
+                        f" Tables and aliases in scope: {', '.join(visible) or 'none'}.")
+            return
+        if table is None or column == "*":
+            return
+        columns = self.validator.columns[table]
+        if column.lower() not in columns:
+            self.report(f"Column '{column}' does not exist in table {table}"
+                        f"{'' if qualifier.lower() == table.lower() else f' (alias {qualifier})'}."
+                        f"{self.validator.suggest(column, list(columns.values()))}"
+                        f" Columns of {table}: {', '.join(columns.values())}.")
+
+    def check_column(self, scope: Scope, column: str):
+        for candidate in scope.chain():
+            matches = [
+                (name, table) for name, table in candidate.sources.items()
+                if table is not None and column.lower() in self.validator.columns[table]
+            ]
+            if len(matches) > 1:
+                self.report(f"Ambiguous column '{column}': it exists in "
+                            f"{' and '.join(candidate.labels[name] for name, _ in matches)}; qualify it with a table alias.")
+                return
+            if matches or any(table is None for table in candidate.sources.values()):
+                return
+        if column.lower() in self.aliases:
+            return
+
+        tables = sorted({table for candidate in scope.chain() for table in candidate.sources.values() if table})
+        if not tables:
+            return
+        known = [name for table in tables for name in self.validator.columns[table].values()]
+        self.report(f"Unknown column '{column}' in tables {', '.join(tables)}."
+                    f"{self.validator.suggest(column, known)}")
@@ -5,6 +5,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const resultDiv = document.getElementById('result');
     const answerDiv = document.getElementById('answer');
     const logBox = document.getElementById('logBox');
+    const nextPageBtn = document.getElementById('nextPageBtn');
+    const numericTypes = ['integer', 'float', 'decimal'];
+    let nextPageToken = null;
 
     // Function to add a log message to the log box
     function addLogMessage(message, type = 'info') {
@@ -36,12 +39,22 @@ document.addEventListener('DOMContentLoaded', function() {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ question }),
+                body: JSON.stringify({ question, format: 'columnar' }),
             });
 
             const data = await response.json();
 
-            if (response.ok) {
+            if (response.ok && data.result) {
+                // Structured result: render straight from the columnar payload
+                renderColumnar(data.result, data.page);
+                resultDiv.classList.remove('hidden');
+                addLogMessage('Query processed successfully');
+
+                if (data.logs && Array.isArray(data.logs)) {
+                    data.logs.forEach(log => addLogMessage(log, 'info'));
+                }
+            } else if (response.ok) {
+                setNextPage(null);
                 // Split the response into SQL query and results
                 const responseText = data.answer;
                 const sqlQueryMatch = responseText.match(/SQL Query:\n([\s\S]*?)\n\nResults/);
@@ -82,6 +95,81 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Show or hide the next page button for a page's continuation token
+    function setNextPage(page) {
+        nextPageToken = page && page.has_more ? page.next_token : null;
+        nextPageBtn.classList.toggle('hidden', !nextPageToken);
+    }
+
+    // Render a columnar result ({columns: [{name, type}], data: [values per column]}) as a table
+    function renderColumnar(result, page) {
+        document.getElementById('sqlQuery').textContent = result.sql || '';
+
+        const table = document.createElement('table');
+        table.className = 'result-table';
+
+        const header = table.createTHead().insertRow();
+        result.columns.forEach(column => {
+            const th = document.createElement('th');
+            th.textContent = column.name;
+            th.title = column.type;
+            header.appendChild(th);
+        });
+
+        const body = table.createTBody();
+        for (let row = 0; row < result.row_count; row++) {
+            const tr = body.insertRow();
+            result.data.forEach((values, index) => {
+                const cell = tr.insertCell();
+                const value = values[row];
+                if (value === null) {
+                    cell.textContent = 'NULL';
+                    cell.className = 'null';
+                } else {
+                    cell.textContent = value;
+                    if (numericTypes.includes(result.columns[index].type)) {
+                        cell.className = 'numeric';
+                    }
+                }
+            });
+        }
+
+        const pageInfo = document.createElement('div');
+        pageInfo.className = 'page-info';
+        pageInfo.textContent = `Page ${page.page} (${result.row_count} rows)`
+            + (page.truncated ? ` - results truncated at ${page.row_limit} rows` : '')
+            + (page.notice ? ` - ${page.notice}` : '');
+
+        answerDiv.innerHTML = '';
+        answerDiv.appendChild(table);
+        answerDiv.appendChild(pageInfo);
+        setNextPage(page);
+    }
+
+    // Fetch the next page of the current result without regenerating the SQL
+    async function loadNextPage() {
+        if (!nextPageToken) {
+            return;
+        }
+
+        nextPageBtn.disabled = true;
+        try {
+            const response = await fetch(`/query/page?token=${encodeURIComponent(nextPageToken)}&format=columnar`);
+            const data = await response.json();
+
+            if (response.ok) {
+                renderColumnar(data.result, data.page);
+                addLogMessage(`Loaded page ${data.page.page}`);
+            } else {
+                addLogMessage(`Error: ${data.error}`, 'error');
+            }
+        } catch (error) {
+            addLogMessage(`Error: ${error.message}`, 'error');
+        } finally {
+            nextPageBtn.disabled = false;
+        }
+    }
+
     // Helper function to format results
     function formatResults(results) {
         // Split results into individual records
@@ -122,6 +210,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Clear the query input and result
                 queryInput.value = '';
                 answerDiv.textContent = '';
+                setNextPage(null);
                 resultDiv.classList.add('hidden');
                 addLogMessage('History cleared successfully', 'info');
             } else {
@@ -134,6 +223,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Event listeners
     submitBtn.addEventListener('click', handleQuery);
+    nextPageBtn.addEventListener('click', loadNextPage);
     clearHistoryBtn.addEventListener('click', clearHistory);
     queryInput.addEventListener('keypress', function(e) {
         if (e.key === 'Enter') {
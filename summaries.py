@@ -0,0 +1,666 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import (BigInteger, Boolean, Column, Date, DateTime, Float, Integer, LargeBinary, MetaData, Numeric,
+                        String, Table, Text, Time, select)
+from sqlalchemy.engine import Engine
+
+from replica import is_analytical, transpile
+from result_format import infer_column_types
+from sql_lexer import SKIPPED_KINDS, Lexeme, scan
+from sql_utils import extract_tables, normalize_sql
+
+CATALOG_TABLE = "summary_catalog"
+ROW_COLUMN = "summary_row"
+COLUMN_TYPES = {
+    "boolean": Boolean, "integer": BigInteger, "float": Float, "decimal": Numeric, "string": Text,
+    "datetime": DateTime, "date": Date, "time": Time, "binary": LargeBinary,
+}
+
+
+AGGREGATES = {"SUM": "SUM", "COUNT": "SUM", "MIN": "MIN", "MAX": "MAX"}  # function -> how its partial results combine
+NONDETERMINISTIC = {"GETDATE", "GETUTCDATE", "SYSDATETIME", "SYSUTCDATETIME", "CURRENT_TIMESTAMP", "NEWID", "RAND"}
+COMPARISONS = {"=", "<>", "!=", "<", "<=", ">", ">="}
+NAME_KINDS = ("word", "bracket", "quoted")
+CLAUSES = ("SELECT", "FROM", "WHERE", "GROUP", "ORDER")
+REJECTED_WORDS = {"HAVING", "UNION", "EXCEPT", "INTERSECT", "INTO", "OFFSET", "FOR", "OPTION", "WITH", "OVER"}
+
+
+class Measure(NamedTuple):
+    function: str  # SUM, COUNT, MIN or MAX
+    argument: str  # canonical SQL
+
+    @property
+    def key(self) -> str:
+        return f"{self.function.lower()}({self.argument})"
+
+
+class SelectItem(NamedTuple):
+    expr: str  # canonical SQL
+    measure: Optional[Measure]  # None for a grouping column
+    name: str  # output column name, unquoted
+
+
+class Filter(NamedTuple):
+    expr: str  # canonical SQL of the filtered expression
+    predicate: Tuple[str, ...]  # the comparison after it, as written: ("BETWEEN", "1", "AND", "5")
+
+
+class OrderItem(NamedTuple):
+    expr: str
+    measure: Optional[Measure]
+    direction: str  # "", "ASC" or "DESC"
+
+
+class AggregateQuery(NamedTuple):
+    """A SELECT ... FROM ... [WHERE] [GROUP BY] [ORDER BY] that can be answered by rolling up a summary."""
+    source: str  # canonical FROM clause
+    group_by: Tuple[str, ...]
+    items: Tuple[SelectItem, ...]
+    filters: Tuple[Filter, ...]
+    order_by: Tuple[OrderItem, ...]
+    top: Optional[str]
+
+    @property
+    def pattern(self) -> str:
+        """Key shared by queries over the same tables with the same grouping, whatever their filters and literals."""
+        return f"{self.source} group by {', '.join(sorted(self.group_by))}"
+
+    @property
+    def dims(self) -> set:
+        return set(self.group_by) | {condition.expr for condition in self.filters}
+
+    @property
+    def measures(self) -> set:
+        return {item.measure for item in self.items if item.measure} | {item.measure for item in self.order_by if item.measure}
+
+
+class SummaryDefinition(NamedTuple):
+    source: str
+    dims: Tuple[str, ...]
+    measures: Tuple[Measure, ...]
+
+    def sql(self) -> str:
+        columns = [f"{dim} AS [d{index}]" for index, dim in enumerate(self.dims)]
+        columns += [f"{measure.function}({measure.argument}) AS [m{index}]" for index, measure in enumerate(self.measures)]
+        sql = f"SELECT {', '.join(columns)} FROM {self.source}"
+        return sql + f" GROUP BY {', '.join(self.dims)}" if self.dims else sql
+
+
+def _text(sql: str, tokens: List[Lexeme]) -> str:
+    return sql[tokens[0].pos:tokens[-1].pos + len(tokens[-1].text)]
+
+
+def _canonical(sql: str, tokens: List[Lexeme]) -> str:
+    return normalize_sql(_text(sql, tokens), preserve_literals=True)
+
+
+def _split(tokens: List[Lexeme], separator: str) -> List[List[Lexeme]]:
+    parts, depth = [[]], 0
+    for token in tokens:
+        depth += (token.text == "(") - (token.text == ")")
+        if depth == 0 and token.text.upper() == separator:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return parts
+
+
+def _unquote(token: Lexeme) -> str:
+    if token.kind == "bracket":
+        return token.text[1:-1].replace("]]", "]")
+    if token.kind == "quoted":
+        return token.text[1:-1].replace('""', '"')
+    return token.text
+
+
+def _measure(sql: str, tokens: List[Lexeme]) -> Optional[Measure]:
+    """SUM(x), COUNT(*), MIN(x) or MAX(x) making up the whole expression."""
+    if len(tokens) < 4 or tokens[0].text.upper() not in AGGREGATES or tokens[1].text != "(":
+        return None
+    depth = 0
+    for index, token in enumerate(tokens[1:], 1):
+        depth += (token.text == "(") - (token.text == ")")
+        if depth == 0 and index != len(tokens) - 1:
+            return None  # e.g. SUM(a) / SUM(b)
+    argument = tokens[2:-1]
+    if argument[0].text.upper() in ("DISTINCT", "ALL") or (argument[0].text == "*" and tokens[0].text.upper() != "COUNT"):
+        return None
+    return Measure(tokens[0].text.upper(), "*" if argument[0].text == "*" else _canonical(sql, argument))
+
+
+def _is_literal(tokens: List[Lexeme]) -> bool:
+    if tokens and tokens[0].text == "-":
+        tokens = tokens[1:]
+    return len(tokens) == 1 and tokens[0].kind in ("string", "number")
+
+
+def _predicate(tokens: List[Lexeme]) -> bool:
+    """A comparison of the filtered expression with literals only."""
+    words = [token.text.upper() for token in tokens]
+    if words and words[0] == "NOT":
+        tokens, words = tokens[1:], words[1:]
+    if not words:
+        return False
+    if words[0] in COMPARISONS or words[0] == "LIKE":
+        return _is_literal(tokens[1:])
+    if words[0] == "BETWEEN":
+        bounds = _split(tokens[1:], "AND")
+        return len(bounds) == 2 and all(_is_literal(bound) for bound in bounds)
+    if words[0] == "IN":
+        return (len(tokens) > 2 and tokens[1].text == "(" and tokens[-1].text == ")"
+                and all(_is_literal(value) for value in _split(tokens[2:-1], ",")))
+    return words in (["IS", "NULL"], ["IS", "NOT", "NULL"])
+
+
+def _conjuncts(tokens: List[Lexeme]) -> Optional[List[List[Lexeme]]]:
+    # Split at top-level AND, except the one inside BETWEEN x AND y
+    parts, depth, between = [[]], 0, False
+    for token in tokens:
+        word = token.text.upper()
+        depth += (token.text == "(") - (token.text == ")")
+        if depth == 0 and word == "OR":
+            return None
+        if depth == 0 and word == "BETWEEN":
+            between = True
+        elif depth == 0 and word == "AND":
+            if between:
+                between = False
+            else:
+                parts.append([])
+                continue
+        parts[-1].append(token)
+    return parts
+
+
+def parse_aggregate(sql: str) -> Optional[AggregateQuery]:
+    """The parts of a grouped or aggregating query, or None when it can't be answered from a summary."""
+    sql = sql.strip().rstrip(';')
+    tokens = [lexeme for lexeme in scan(sql) if lexeme.kind not in SKIPPED_KINDS]
+    if any(token.kind in ("variable", "other") or token.text.upper() in NONDETERMINISTIC for token in tokens):
+        return None
+
+    clauses, depth = {}, 0
+    for index, token in enumerate(tokens):
+        word = token.text.upper() if token.kind == "word" else None
+        depth += (token.text == "(") - (token.text == ")")
+        if depth or word is None:
+            if word == "SELECT" and "WHERE" in clauses:
+                return None  # a subquery in WHERE
+            continue
+        if word in REJECTED_WORDS:
+            return None
+        if word in CLAUSES:
+            if word in clauses or (word in ("GROUP", "ORDER") and (index + 1 >= len(tokens)
+                                                                   or tokens[index + 1].text.upper() != "BY")):
+                return None
+            clauses[word] = index
+    order = sorted(clauses, key=clauses.get)
+    if not order or order[0] != "SELECT" or clauses["SELECT"] != 0 or order[:2] != ["SELECT", "FROM"]:
+        return None
+    if order != [clause for clause in CLAUSES if clause in clauses]:
+        return None
+    bounds = {clause: (clauses[clause] + (2 if clause in ("GROUP", "ORDER") else 1),
+                       clauses[following] if following else len(tokens))
+              for clause, following in zip(order, order[1:] + [None])}
+    part = {clause: tokens[first:last] for clause, (first, last) in bounds.items()}
+    if not all(part.values()):
+        return None
+
+    select, top = part["SELECT"], None
+    if select[0].text.upper() == "DISTINCT":
+        return None
+    if select[0].text.upper() == "TOP":
+        parenthesized = len(select) > 1 and select[1].text == "("
+        count = select[1 + parenthesized] if len(select) > 1 + parenthesized else None
+        if count is None or count.kind != "number":
+            return None
+        select = select[2 + 2 * parenthesized:]
+        if not select or select[0].text.upper() in ("PERCENT", "WITH"):
+            return None
+        top = count.text
+
+    group_by = []
+    for expr in _split(part["GROUP"], ",") if "GROUP" in part else []:
+        if not expr or expr[0].text.upper() in ("ROLLUP", "CUBE", "GROUPING", "ALL"):
+            return None
+        group_by.append(_canonical(sql, expr))
+
+    items = []
+    for item in _split(select, ","):
+        alias = None
+        if len(item) > 2 and item[-2].text.upper() == "AS" and item[-1].kind in NAME_KINDS:
+            item, alias = item[:-2], _unquote(item[-1])
+        elif (len(item) > 1 and item[-1].kind in NAME_KINDS
+              and (item[-2].text == ")" or (item[-2].kind in NAME_KINDS and item[-2].text.upper() != "AS"))):
+            item, alias = item[:-1], _unquote(item[-1])
+        if not item:
+            return None
+        expr = _canonical(sql, item)
+        # A column reference (a, t.a, [t].[a]) is named after its last part; other expressions need an alias
+        is_column = all(token.kind in NAME_KINDS if index % 2 == 0 else token.text == "."
+                        for index, token in enumerate(item)) and len(item) % 2 == 1
+        name = alias or (_unquote(item[-1]) if is_column else None)
+        if name is None:
+            return None
+        if expr in group_by:
+            items.append(SelectItem(expr, None, name))
+            continue
+        measure = _measure(sql, item)
+        if measure is None:
+            return None
+        items.append(SelectItem(expr, measure, name))
+    if not group_by and not any(item.measure for item in items):
+        return None
+
+    filters = []
+    if "WHERE" in part:
+        conjuncts = _conjuncts(part["WHERE"])
+        if conjuncts is None:
+            return None
+        for conjunct in conjuncts:
+            depth, split_at = 0, None
+            if not conjunct or conjunct[0].text.upper() == "NOT":
+                return None
+            for index, token in enumerate(conjunct):
+                depth += (token.text == "(") - (token.text == ")")
+                if depth == 0 and index and (token.text in COMPARISONS
+                                             or token.text.upper() in ("BETWEEN", "IN", "LIKE", "IS", "NOT")):
+                    split_at = index
+                    break
+            if split_at is None or not _predicate(conjunct[split_at:]):
+                return None
+            filters.append(Filter(_canonical(sql, conjunct[:split_at]), tuple(token.text for token in conjunct[split_at:])))
+
+    order_by = []
+    for item in _split(part["ORDER"], ",") if "ORDER" in part else []:
+        direction = ""
+        if item and item[-1].text.upper() in ("ASC", "DESC"):
+            item, direction = item[:-1], item[-1].text.upper()
+        if not item:
+            return None
+        expr, measure = _canonical(sql, item), _measure(sql, item)
+        # Summaries can be ordered by output position, name, grouping column or measure
+        if not (expr.isdigit() or measure or expr in group_by
+                or any(normalize_sql(f"[{select.name}]") == expr for select in items)):
+            return None
+        order_by.append(OrderItem(expr, measure, direction))
+
+    return AggregateQuery(_canonical(sql, part["FROM"]), tuple(group_by), tuple(items), tuple(filters),
+                          tuple(order_by), top)
+
+
+def mine_patterns(entries: Iterable[dict], min_count: int, limit: int) -> List[tuple]:
+    """Most frequent shapes of successful aggregation queries in the log, as (pattern, definition, count).
+
+    A shape is the tables and grouping of a query; its summary is grouped by every column the queries of that
+    shape group or filter on, so queries with other filters and literals can be answered by rolling it up.
+    """
+    counts, sources, dims, measures = Counter(), {}, defaultdict(set), defaultdict(set)
+    for entry in entries:
+        sql = (entry.get("sql_query") or "").strip()
+        answer = entry.get("answer") or ""
+        if not sql or answer.startswith(("Failed", "Error")) or not is_analytical(sql):
+            continue
+        query = parse_aggregate(sql)
+        if query is None:
+            continue
+        counts[query.pattern] += 1
+        sources[query.pattern] = query.source
+        dims[query.pattern] |= query.dims
+        measures[query.pattern] |= query.measures
+    return [
+        (pattern, SummaryDefinition(sources[pattern], tuple(sorted(dims[pattern])), tuple(sorted(measures[pattern]))), count)
+        for pattern, count in counts.most_common(limit) if count >= min_count
+    ]
+
+
+def rewrite(query: AggregateQuery, table: str, layout: dict, dialect: str) -> str:
+    """`query` as T-SQL over a summary table, rolling its measures up to the query's grouping."""
+    def quote(name: str) -> str:
+        return "[" + name.replace("]", "]]") + "]"
+
+    def rolled_up(measure: Measure) -> str:
+        combined = f"{AGGREGATES[measure.function]}({quote(layout['measures'][measure.key])})"
+        # COUNT over no rows is 0, the SUM of no partial counts is NULL
+        return f"COALESCE({combined}, 0)" if measure.function == "COUNT" and not query.group_by else combined
+
+    def literal(text: str, dim: str) -> str:
+        # SQLite keeps DATETIME values as 'YYYY-MM-DD HH:MM:SS.ffffff'; compare dates written the T-SQL way likewise
+        if dialect == "sqlite" and layout["types"].get(dim) == "datetime" and text[-1:] == "'":
+            try:
+                return f"'{datetime.fromisoformat(text.lstrip('Nn').strip(chr(39))):%Y-%m-%d %H:%M:%S.%f}'"
+            except ValueError:
+                return text
+        return text
+
+    dims = layout["dims"]
+    columns = [
+        f"{rolled_up(item.measure) if item.measure else quote(dims[item.expr])} AS {quote(item.name)}"
+        for item in query.items
+    ]
+    sql = f"SELECT {'TOP ' + query.top + ' ' if query.top else ''}{', '.join(columns)} FROM {quote(table)}"
+    if query.filters:
+        sql += " WHERE " + " AND ".join(
+            f"{quote(dims[condition.expr])} " + " ".join(literal(text, dims[condition.expr]) for text in condition.predicate)
+            for condition in query.filters
+        )
+    if query.group_by:
+        sql += " GROUP BY " + ", ".join(quote(dims[expr]) for expr in query.group_by)
+    if query.order_by:
+        names = {normalize_sql(quote(item.name)): item.name for item in query.items}
+        order = []
+        for item in query.order_by:
+            if item.expr.isdigit():
+                target = item.expr
+            elif item.expr in names:
+                target = quote(names[item.expr])
+            elif item.measure is not None:
+                target = rolled_up(item.measure)
+            else:
+                target = quote(dims[item.expr])
+            order.append(f"{target} {item.direction}".strip())
+        sql += " ORDER BY " + ", ".join(order)
+    return sql
+
+
+def covers(layout: dict, query: AggregateQuery) -> bool:
+    return (layout["source"] == query.source and query.dims <= set(layout["dims"])
+            and all(measure.key in layout["measures"] for measure in query.measures))
+
+
+class SummaryHit(NamedTuple):
+    name: str
+    sql: str  # reads the summary table
+    age: float
+
+
+class SummaryStore:
+    """Frequent aggregation query shapes, materialized at their grouping grain into a local database.
+
+    Queries of a shape, and coarser ones over the same tables, are rewritten to roll the summary up.
+    """
+
+    def __init__(self, engine: Engine, source_engine: Engine, min_count: int = 3, max_summaries: int = 20,
+                 max_rows: int = 100000, max_age_seconds: float = 3600, refresh_interval_seconds: float = 600):
+        self.engine = engine
+        self.source_engine = source_engine
+        self.min_count = min_count
+        self.max_summaries = max_summaries
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_seconds
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self._metadata = MetaData()
+        self._catalog_table = Table(
+            CATALOG_TABLE, self._metadata,
+            Column("name", String(64), primary_key=True),
+            Column("pattern", Text, nullable=False),
+            Column("sql_query", Text, nullable=False),
+            Column("tables", Text, nullable=False),
+            Column("columns", Text, nullable=False),
+            Column("occurrences", Integer, nullable=False),
+            Column("built_at", Float, nullable=False),
+            Column("build_seconds", Float, nullable=False),
+            Column("rows", Integer, nullable=False),
+            Column("hits", Integer, nullable=False),
+            Column("saved_seconds", Float, nullable=False),
+        )
+        self._catalog_table.create(self.engine, checkfirst=True)
+        with self.engine.connect() as conn:
+            self._catalog = {row.pattern: dict(row._mapping) for row in conn.execute(select(self._catalog_table))}
+        # Column layout of each summary; catalogs written before summaries were rolled up have none and are dropped
+        # by the next refresh
+        self._layouts = {}
+        for pattern, entry in self._catalog.items():
+            layout = json.loads(entry["columns"])
+            if isinstance(layout, dict):
+                self._layouts[pattern] = layout
+        self.dialect = engine.dialect.name
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._unsaved_hits = set()  # patterns whose hit counts changed since the catalog table was written
+        os.register_at_fork(after_in_child=self._after_fork)
+        self._last_refresh = 0.0
+        self._stats = {"lookups": 0, "hits": 0, "stale": 0, "builds": 0, "build_errors": 0, "dropped": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _save(self, entry: dict):
+        with self.engine.begin() as conn:
+            conn.execute(self._catalog_table.delete().where(self._catalog_table.c.name == entry["name"]))
+            conn.execute(self._catalog_table.insert(), entry)
+
+    def build(self, pattern: str, definition: SummaryDefinition, occurrences: int) -> bool:
+        # A rebuild writes a new table, so readers of the previous one are never cut off mid-page
+        name = f"summary_{hashlib.sha256(pattern.encode('utf-8')).hexdigest()[:12]}_{int(time.time())}"
+        sql = definition.sql()
+        started = time.perf_counter()
+        with self.source_engine.connect() as conn:
+            result = conn.exec_driver_sql(sql)
+            columns = list(result.keys())
+            rows = result.fetchmany(self.max_rows + 1)
+        build_seconds = time.perf_counter() - started
+        if len(rows) > self.max_rows:
+            return False
+
+        types = infer_column_types(columns, [tuple(row) for row in rows])
+        table = Table(
+            name, MetaData(),
+            Column(ROW_COLUMN, Integer, primary_key=True),
+            *[Column(column, COLUMN_TYPES.get(column_type, Text)) for column, column_type in zip(columns, types)]
+        )
+        with self.engine.begin() as conn:
+            table.create(conn)
+            if rows:
+                conn.execute(table.insert(), [
+                    {ROW_COLUMN: index, **dict(zip(columns, row))} for index, row in enumerate(rows)
+                ])
+
+        layout = {
+            "source": definition.source,
+            "dims": {dim: f"d{index}" for index, dim in enumerate(definition.dims)},
+            "measures": {measure.key: f"m{index}" for index, measure in enumerate(definition.measures)},
+            "types": dict(zip(columns, types)),
+        }
+        with self._lock:
+            previous = self._catalog.get(pattern, {})
+            entry = {
+                "name": name,
+                "pattern": pattern,
+                "sql_query": sql,
+                "tables": json.dumps(sorted(extract_tables(sql))),
+                "columns": json.dumps(layout),
+                "occurrences": occurrences,
+                "built_at": time.time(),
+                "build_seconds": build_seconds,
+                "rows": len(rows),
+                "hits": previous.get("hits", 0),
+                "saved_seconds": previous.get("saved_seconds", 0.0),
+            }
+            self._catalog[pattern] = entry
+            self._layouts[pattern] = layout
+            self._stats["builds"] += 1
+        self._save(entry)
+        if previous:
+            self._drop_table(previous["name"])
+        return True
+
+    def _drop_table(self, name: str):
+        try:
+            with self.engine.begin() as conn:
+                Table(name, MetaData()).drop(conn, checkfirst=True)
+                conn.execute(self._catalog_table.delete().where(self._catalog_table.c.name == name))
+        except Exception as e:
+            print(f"Error dropping summary table {name}: {e}")
+
+    def drop(self, pattern: str):
+        with self._lock:
+            entry = self._catalog.pop(pattern, None)
+            self._layouts.pop(pattern, None)
+            if entry is None:
+                return
+            self._stats["dropped"] += 1
+        self._drop_table(entry["name"])
+
+    def refresh(self, entries: Iterable[dict]) -> dict:
+        """Mine the log, build summaries for new frequent patterns, rebuild stale ones and drop the rest."""
+        mined = mine_patterns(entries, self.min_count, self.max_summaries)
+        keep = {pattern for pattern, _, _ in mined}
+        built = 0
+        for pattern, definition, count in mined:
+            with self._lock:
+                entry, layout = self._catalog.get(pattern), self._layouts.get(pattern)
+                # Rebuild a little before the summary expires so hits don't lapse while it is rebuilt,
+                # and as soon as the queries of its shape group or filter on a column it doesn't have
+                current = (entry is not None and layout is not None
+                           and time.time() - entry["built_at"] < self.max_age_seconds * 0.8
+                           and set(definition.dims) <= set(layout["dims"])
+                           and {measure.key for measure in definition.measures} <= set(layout["measures"]))
+                if current:
+                    entry["occurrences"] = count
+            if current:
+                continue
+            try:
+                built += self.build(pattern, definition, count)
+            except Exception as e:
+                self._count("build_errors")
+                print(f"Error building summary for {definition.sql()!r}: {e}")
+        with self._lock:
+            dropped = [pattern for pattern in self._catalog if pattern not in keep]
+        for pattern in dropped:
+            self.drop(pattern)
+        self._last_refresh = time.time()
+        return {"mined": len(mined), "built": built, "summaries": len(self._catalog)}
+
+    def flush_hits(self):
+        """Write the hit counts recorded since the last flush to the catalog table."""
+        with self._lock:
+            entries = [dict(self._catalog[pattern]) for pattern in self._unsaved_hits if pattern in self._catalog]
+            self._unsaved_hits = set()
+        if not entries:
+            return
+        with self.engine.begin() as conn:
+            for entry in entries:
+                conn.execute(
+                    self._catalog_table.update()
+                    .where(self._catalog_table.c.name == entry["name"])
+                    .values(hits=entry["hits"], saved_seconds=entry["saved_seconds"])
+                )
+
+    def _refresh_in_background(self, entries_factory):
+        try:
+            self.flush_hits()
+            self.refresh(entries_factory())
+        except Exception as e:
+            print(f"Error refreshing summaries: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _after_fork(self):
+        # A refresh running in the parent isn't running in the child
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def maybe_refresh(self, entries_factory) -> bool:
+        """Start a background refresh when one is due; `entries_factory` returns the log entries to mine."""
+        with self._lock:
+            if self._refreshing or time.time() - self._last_refresh < self.refresh_interval_seconds:
+                return False
+            self._refreshing = True
+            self._last_refresh = time.time()
+        threading.Thread(
+            target=self._refresh_in_background, args=(entries_factory,), name="summary-refresh", daemon=True
+        ).start()
+        return True
+
+    def lookup(self, sql: str) -> Optional[SummaryHit]:
+        """The query rewritten over the smallest fresh summary that has every column and measure it needs."""
+        query = parse_aggregate(sql) if is_analytical(sql) else None
+        with self._lock:
+            self._stats["lookups"] += 1
+            if query is None:
+                return None
+            candidates = [
+                (entry, self._layouts[pattern]) for pattern, entry in self._catalog.items()
+                if pattern in self._layouts and covers(self._layouts[pattern], query)
+            ]
+            fresh = [(entry, layout) for entry, layout in candidates
+                     if time.time() - entry["built_at"] <= self.max_age_seconds]
+            if not fresh:
+                self._stats["stale"] += bool(candidates)
+                return None
+            entry, layout = min(fresh, key=lambda candidate: candidate[0]["rows"])
+        rewritten = transpile(rewrite(query, entry["name"], layout, self.dialect), self.dialect)
+        if rewritten is None:
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+        return SummaryHit(entry["name"], rewritten, time.time() - entry["built_at"])
+
+    def record_hit(self, hit: SummaryHit, elapsed_seconds: float):
+        with self._lock:
+            pattern = next((pattern for pattern, entry in self._catalog.items() if entry["name"] == hit.name), None)
+            if pattern is None:
+                return
+            entry = self._catalog[pattern]
+            entry["hits"] += 1
+            # The summary's build time is about what running the original query on the database costs
+            entry["saved_seconds"] += max(0.0, entry["build_seconds"] - elapsed_seconds)
+            # Written by the background refresh, not on the request path
+            self._unsaved_hits.add(pattern)
+
+    def invalidate_tables(self, *tables: str) -> int:
+        tables = {table.lower() for table in tables}
+        invalidated = 0
+        with self._lock:
+            for entry in self._catalog.values():
+                if tables & set(json.loads(entry["tables"])):
+                    entry["built_at"] = 0.0
+                    invalidated += 1
+        # Stale summaries are rebuilt on the next refresh
+        self._last_refresh = 0.0 if invalidated else self._last_refresh
+        return invalidated
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            summaries = [
+                {
+                    "name": entry["name"],
+                    "sql_query": entry["sql_query"],
+                    "tables": json.loads(entry["tables"]),
+                    "occurrences": entry["occurrences"],
+                    "rows": entry["rows"],
+                    "age_seconds": time.time() - entry["built_at"] if entry["built_at"] else None,
+                    "fresh": time.time() - entry["built_at"] <= self.max_age_seconds,
+                    "hits": entry["hits"],
+                    "saved_seconds": entry["saved_seconds"],
+                }
+                for entry in self._catalog.values()
+            ]
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["saved_seconds"] = sum(summary["saved_seconds"] for summary in summaries)
+        stats["refreshing"] = self._refreshing
+        stats["summaries"] = sorted(summaries, key=lambda summary: summary["hits"], reverse=True)
+        return stats
+
+
+def create_summary_store(engine: Engine, source_engine: Engine, summary_config: dict) -> SummaryStore:
+    return SummaryStore(
+        engine,
+        source_engine,
+        min_count=summary_config['min_occurrences'],
+        max_summaries=summary_config['max_summaries'],
+        max_rows=summary_config['max_rows'],
+        max_age_seconds=summary_config['max_age_seconds'],
+        refresh_interval_seconds=summary_config['refresh_interval_seconds'],
+    )
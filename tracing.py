@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """One request and the stage spans recorded while it ran."""
+
+    def __init__(self, name: str, inputs: dict):
+        self.trace_id = str(uuid.uuid4())
+        self.name = name
+        self.inputs = inputs
+        self.outputs = {}
+        self.error = None
+        self.start_time = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, started: float, ended: float, error: Optional[str] = None):
+        with self._lock:
+            self.spans.append({
+                "id": str(uuid.uuid4()),
+                "name": name,
+                "offset": started - self._started,
+                "duration": ended - started,
+                "error": error,
+            })
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start_time": self.start_time.isoformat(),
+            "duration": self.duration,
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "error": self.error,
+            "spans": list(self.spans),
+        }
+
+
+class TraceSampler:
+    """Keeps a random fraction of traces, plus every failed or slow one."""
+
+    def __init__(self, sample_rate: float, always_trace_errors: bool = True, slow_request_seconds: float = None):
+        self.sample_rate = sample_rate
+        self.always_trace_errors = always_trace_errors
+        self.slow_request_seconds = slow_request_seconds
+
+    def keep(self, trace: Trace) -> Optional[str]:
+        if self.always_trace_errors and trace.error:
+            return "error"
+        if self.slow_request_seconds is not None and trace.duration >= self.slow_request_seconds:
+            return "slow"
+        if random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+
+class JsonlExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, traces: list):
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(trace.to_dict(), default=str) + '\n' for trace in traces))
+
+
+class LangSmithExporter:
+    """Uploads each trace as a root run with one child run per span."""
+
+    def __init__(self, api_key: str, api_url: str, project_name: str):
+        from langsmith import Client
+        self.client = Client(api_key=api_key, api_url=api_url, auto_batch_tracing=False)
+        self.project_name = project_name
+
+    def _runs(self, trace: Trace) -> list:
+        root_order = f"{trace.start_time:%Y%m%dT%H%M%S%fZ}{trace.trace_id}"
+        runs = [{
+            "id": trace.trace_id,
+            "trace_id": trace.trace_id,
+            "dotted_order": root_order,
+            "name": trace.name,
+            "run_type": "chain",
+            "inputs": trace.inputs,
+            "outputs": trace.outputs,
+            "error": trace.error,
+            "start_time": trace.start_time,
+            "end_time": trace.start_time + timedelta(seconds=trace.duration),
+            "session_name": self.project_name,
+        }]
+        for span in trace.spans:
+            start_time = trace.start_time + timedelta(seconds=span["offset"])
+            runs.append({
+                "id": span["id"],
+                "trace_id": trace.trace_id,
+                "parent_run_id": trace.trace_id,
+                "dotted_order": f"{root_order}.{start_time:%Y%m%dT%H%M%S%fZ}{span['id']}",
+                "name": span["name"],
+                "run_type": "llm" if span["name"] == "query_gen" else "chain",
+                "inputs": {},
+                "outputs": {},
+                "error": span["error"],
+                "start_time": start_time,
+                "end_time": start_time + timedelta(seconds=span["duration"]),
+                "session_name": self.project_name,
+            })
+        return runs
+
+    def export(self, traces: list):
+        runs = [run for trace in traces for run in self._runs(trace)]
+        self.client.batch_ingest_runs(create=runs)
+
+
+class BatchExportProcessor:
+    """Queues finished traces and exports them in batches from a background thread."""
+
+    def __init__(self, exporter, batch_size: int = 100, flush_interval_seconds: float = 2.0, max_queue: int = 10000):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_queue = max_queue
+        self._stats = {"queued": 0, "dropped": 0, "exported": 0, "export_errors": 0}
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def submit(self, trace: Trace):
+        # The export thread doesn't survive fork(); a forked worker starts its own
+        if self._pid != os.getpid():
+            self._start()
+        # Never wait on the exporter from the request path; drop the trace if the queue is full
+        try:
+            self._queue.put_nowait(trace)
+            self._count("queued")
+        except queue.Full:
+            self._count("dropped")
+
+    def _drain(self) -> list:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._flush_requested.wait(self.flush_interval_seconds)
+            self._flush_requested.clear()
+            self._idle.clear()
+            try:
+                batch = self._drain()
+                while batch:
+                    try:
+                        self.exporter.export(batch)
+                        self._count("exported", len(batch))
+                    except Exception as e:
+                        self._count("export_errors")
+                        print(f"Error exporting traces: {e}")
+                    batch = self._drain()
+            finally:
+                self._idle.set()
+
+    def flush(self, timeout: float = 10.0):
+        self._flush_requested.set()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and (not self._queue.empty() or not self._idle.is_set()):
+            time.sleep(0.02)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+class RequestTracer:
+    def __init__(self, sampler: TraceSampler, processor: Optional[BatchExportProcessor], enabled: bool = True):
+        self.sampler = sampler
+        self.processor = processor
+        self.enabled = enabled and processor is not None
+        self._stats = {"traces": 0, "kept": {"error": 0, "slow": 0, "sampled": 0}}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _trace(self, name: str, inputs: dict):
+        trace = Trace(name, inputs)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        except Exception as e:
+            trace.error = trace.error or repr(e)
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace.finish()
+            reason = self.sampler.keep(trace)
+            with self._lock:
+                self._stats["traces"] += 1
+                if reason:
+                    self._stats["kept"][reason] += 1
+            if reason:
+                trace.outputs["sampling_reason"] = reason
+                self.processor.submit(trace)
+
+    def trace(self, name: str, **inputs):
+        """Trace a request; yields None when tracing is off."""
+        return self._trace(name, inputs) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _span(self, trace: Trace, name: str):
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            trace.add_span(name, started, time.perf_counter(), error)
+
+    def span(self, name: str):
+        trace = _current_trace.get()
+        return self._span(trace, name) if trace is not None else nullcontext()
+
+    def flush(self, timeout: float = 10.0):
+        if self.processor is not None:
+            self.processor.flush(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {"traces": self._stats["traces"], "kept": dict(self._stats["kept"])}
+        stats["export"] = self.processor.stats() if self.processor is not None else None
+        return stats
+
+
+def langsmith_configured(langsmith_settings: dict) -> bool:
+    # config.py ships "add-your-..." placeholders; those count as not set
+    api_key = (langsmith_settings['api_key'] or "").strip()
+    if not api_key or api_key.startswith("add-your-"):
+        return False
+    return bool(langsmith_settings['tracing'] and langsmith_settings['endpoint'])
+
+
+def create_exporter(tracing_config: dict, langsmith_settings: dict):
+    exporter = tracing_config['exporter']
+    if exporter == 'auto':
+        exporter = 'langsmith' if langsmith_configured(langsmith_settings) else 'jsonl'
+    if exporter == 'langsmith':
+        return LangSmithExporter(langsmith_settings['api_key'], langsmith_settings['endpoint'], langsmith_settings['project'])
+    if exporter == 'jsonl':
+        return JsonlExporter(tracing_config['jsonl_path'])
+    return None
+
+
+def create_request_tracer(tracing_config: dict, langsmith_settings: dict) -> RequestTracer:
+    sampler = TraceSampler(
+        tracing_config['sample_rate'],
+        always_trace_errors=tracing_config['always_trace_errors'],
+        slow_request_seconds=tracing_config['slow_request_seconds'],
+    )
+    exporter = create_exporter(tracing_config, langsmith_settings) if tracing_config['enabled'] else None
+    processor = BatchExportProcessor(
+        exporter,
+        batch_size=tracing_config['batch_size'],
+        flush_interval_seconds=tracing_config['flush_interval_seconds'],
+        max_queue=tracing_config['max_queue'],
+    ) if exporter is not None else None
+    return RequestTracer(sampler, processor, enabled=tracing_config['enabled'])